@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+
+"""
+Batch mode: verify many tasks in one run of Symbiotic.
+
+The environment is set up (and the components are checked) only once
+and then every task is verified in a process forked from the set-up
+process, so that the tasks are isolated from each other (they have
+their own working directories, signal handlers, global state, ...)
+and do not pay for the setup again. Up to opts.batch_jobs tasks
+run concurrently.
+
+The tasks are read from a file (or stdin) that contains one JSON object
+per line, e.g.:
+
+  {"id": "t1", "sources": ["a.c", "b.c"], "prp": "memsafety", "timeout": 900}
+
+Only "sources" is mandatory (a plain JSON string is taken as a task
+with a single source). The results are written to stdout as JSON objects,
+one per line, in the order in which the tasks finish.
+"""
+
+import os
+import re
+import sys
+import json
+from time import time
+from copy import deepcopy
+from collections import deque
+from signal import signal, SIGTERM
+from multiprocessing import get_context
+from multiprocessing.connection import wait
+
+from . utils import err, dbg
+from . utils.utils import print_stdout
+from . utils.timeout import Timeout, start_timeout, stop_timeout
+from . utils.telemetry import start_telemetry, write_report
+from . runtime import SetupSymbiotic, rm_tmp_dir
+from . symbiotic import Symbiotic
+from . exceptions import SymbioticException
+
+# the keys that may appear in the description of a task
+_TASK_KEYS = ('id', 'sources', 'prp', '32bit', 'timeout', 'witness', 'test-suite')
+
+
+class BatchTask(object):
+    def __init__(self, taskid, sources):
+        self.id = taskid
+        self.sources = sources
+        # these override the options given on the command line
+        self.prp = None
+        self.is32bit = None
+        self.timeout = None
+        self.witness = None
+        self.test_suite = None
+
+    def name(self):
+        """ The id of the task that can be used in names of files """
+        return re.sub(r'[^\w.-]', '_', str(self.id))
+
+
+def parse_task(line, num, cwd):
+    """
+    Create a BatchTask from the JSON description \param line
+    (the \param num-th line of the input). Relative paths are taken
+    relatively to \param cwd.
+    """
+    try:
+        desc = json.loads(line)
+    except ValueError as e:
+        raise SymbioticException('Invalid task on line {0}: {1}'.format(num, str(e)))
+
+    if isinstance(desc, str):
+        desc = {'sources': desc}
+    if not isinstance(desc, dict) or 'sources' not in desc:
+        raise SymbioticException('The task on line {0} has no sources'.format(num))
+    for key in desc:
+        if key not in _TASK_KEYS:
+            raise SymbioticException("Unknown key '{0}' in the task on line {1}"\
+                                     .format(key, num))
+
+    sources = desc['sources']
+    if isinstance(sources, str):
+        sources = [sources]
+    if not sources:
+        raise SymbioticException('The task on line {0} has no sources'.format(num))
+
+    def path(p):
+        return os.path.abspath(os.path.join(cwd, os.path.expanduser(p)))
+
+    task = BatchTask(desc.get('id', num), [path(s) for s in sources])
+    task.prp = desc.get('prp')
+    task.is32bit = desc.get('32bit')
+    task.timeout = desc.get('timeout')
+    if 'witness' in desc:
+        task.witness = path(desc['witness'])
+    if 'test-suite' in desc:
+        task.test_suite = path(desc['test-suite'])
+    return task
+
+
+class _TaskReader(object):
+    """
+    Read the lines with tasks from a file descriptor. The lines
+    are read only when the descriptor is ready, so that we can wait
+    for new tasks and for the running tasks at the same time.
+    """
+    def __init__(self, fd):
+        self.fd = fd
+        self.eof = False
+        self._pending = b''
+
+    def read(self):
+        """ Return the list of the complete lines that are available """
+        data = os.read(self.fd, 1 << 16)
+        if not data:
+            self.eof = True
+            lines = [self._pending]
+        else:
+            lines = (self._pending + data).split(b'\n')
+            self._pending = lines.pop()
+        return [l.decode('utf-8') for l in lines]
+
+
+def _create_testcomp_metadata(where, source, prps, is32bit):
+    from . testsuits.metadata import MetadataWriter
+
+    os.makedirs(where, exist_ok=True)
+    MetadataWriter(source, prps, is32bit).write(os.path.join(where, 'metadata.xml'))
+
+
+def _verify(task, opts, tool, env, base):
+    """
+    Verify the task, this runs in the worker process. \param base
+    is the pair (options, environment variables) before the setup.
+    """
+    if task.prp is not None and task.prp != opts.propertystr:
+        # set up the verifier for the property of the task the same way
+        # as for a single run, the options derived for the property
+        # of the batch do not hold for it
+        opts, environ = base
+        os.environ.clear()
+        os.environ.update(environ)
+        opts.propertystr = task.prp
+        if task.is32bit is not None:
+            opts.is32bit = bool(task.is32bit)
+        setup = SetupSymbiotic(opts)
+        setup.environment = env
+        # the setup takes the current directory for the one
+        # with the sources, but we are in the directory of the task
+        cwd = env.cwd
+        tool = setup.setup_verifier()
+        env.cwd = cwd
+
+    opts.sources = task.sources
+    if task.is32bit is not None:
+        opts.is32bit = bool(task.is32bit)
+    if task.timeout is not None:
+        opts.timeout = int(task.timeout)
+
+    # every task gets its own outputs, unless told otherwise
+    if task.witness:
+        opts.witness_output = task.witness
+    else:
+        root, ext = os.path.splitext(opts.witness_output)
+        opts.witness_output = '{0}.{1}{2}'.format(root, task.name(), ext)
+    opts.testsuite_output = task.test_suite or\
+                            os.path.join(opts.testsuite_output, task.name())
+    if opts.telemetry:
+        root, ext = os.path.splitext(opts.telemetry)
+        opts.telemetry = '{0}.{1}{2}'.format(root, task.name(), ext)
+        start_telemetry()
+
+    if opts.test_comp:
+        if opts.property.coverage():
+            opts.noslice = True
+
+        assert len(task.sources) == 1
+        _create_testcomp_metadata(opts.testsuite_output, task.sources[0],
+                                  opts.property.ltl(), opts.is32bit)
+
+    print_stdout("INFO: Looking for {0}".format(opts.property.help()), color="BLUE")
+    if opts.timeout != 0:
+        start_timeout(opts.timeout)
+
+    symbiotic = None
+    try:
+        symbiotic = Symbiotic(tool, task.sources, opts, env)
+        return symbiotic.run() or 'no result'
+    except Timeout:
+        return 'timeout'
+    finally:
+        stop_timeout()
+        if symbiotic:
+            symbiotic.terminate()
+            symbiotic.kill()
+            symbiotic.kill_wait()
+
+
+def _worker(task, opts, tool, env, base, workdir, conn):
+    def terminate(signum, frame):
+        # unwind the stack so that the children of the task are killed
+        sys.exit(1)
+    signal(SIGTERM, terminate)
+
+    # the output of the task (and of the tools) goes to a log
+    # in the working directory of the task
+    sys.stdout.flush()
+    sys.stderr.flush()
+    fd = os.open(os.path.join(workdir, 'output.log'),
+                 os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    os.dup2(fd, 1)
+    os.dup2(fd, 2)
+    os.close(fd)
+
+    os.chdir(workdir)
+    env.working_dir = workdir
+
+    try:
+        res = _verify(task, opts, tool, env, base)
+    except SymbioticException as e:
+        res = 'ERROR ({0})'.format(str(e))
+    print_stdout('RESULT: {0}'.format(res))
+    if opts.telemetry:
+        write_report(opts.telemetry, result=res, sources=task.sources)
+    conn.send(res)
+    conn.close()
+
+
+class _Job(object):
+    def __init__(self, task, process, conn, workdir):
+        self.task = task
+        self.process = process
+        self.conn = conn
+        self.workdir = workdir
+        self.start = time()
+
+
+class BatchRunner(object):
+    """
+    Verify tasks read from a file descriptor, each in a process forked
+    from this one, and report the results as JSON lines to stdout
+    """
+
+    def __init__(self, opts, tool, env, base):
+        self._opts = opts
+        self._tool = tool
+        self._env = env
+        # the options and the environment variables before the setup
+        self._base = base
+        self._context = get_context('fork')
+        self._running = []
+        self.failed = 0
+
+    def _start(self, task):
+        from tempfile import mkdtemp
+
+        workdir = mkdtemp(prefix='{0}-'.format(task.name()),
+                          dir=self._env.working_dir)
+        recv, send = self._context.Pipe(duplex=False)
+        process = self._context.Process(target=_worker,
+                                        args=(task, self._opts, self._tool,
+                                              self._env, self._base,
+                                              workdir, send))
+        process.start()
+        # the worker has its copy of the write end
+        send.close()
+        dbg('Started task {0} (pid {1})'.format(task.id, process.pid))
+        self._running.append(_Job(task, process, recv, workdir))
+
+    def _report(self, taskid, res, sources=None, elapsed=None, workdir=None):
+        if res.startswith('error') or res.startswith('ERROR'):
+            self.failed += 1
+
+        report = {'id': taskid, 'result': res}
+        if sources:
+            report['sources'] = sources
+        if elapsed is not None:
+            report['time'] = elapsed
+        if workdir and self._opts.save_files:
+            report['workdir'] = workdir
+            report['log'] = os.path.join(workdir, 'output.log')
+        print(json.dumps(report), flush=True)
+
+    def _finish(self, job):
+        job.process.join()
+        res = None
+        try:
+            if job.conn.poll():
+                res = job.conn.recv()
+        except EOFError:
+            pass
+        job.conn.close()
+        if res is None:
+            res = 'ERROR (the worker exited with status {0})'\
+                  .format(job.process.exitcode)
+
+        self._report(job.task.id, res, job.task.sources,
+                     time() - job.start, job.workdir)
+        if not self._opts.save_files:
+            rm_tmp_dir(job.workdir)
+
+    def run(self, fd):
+        reader = _TaskReader(fd)
+        jobs = max(self._opts.batch_jobs, 1)
+        tasks = deque()
+        num = 0
+        try:
+            while not reader.eof or tasks or self._running:
+                while tasks and len(self._running) < jobs:
+                    self._start(tasks.popleft())
+
+                waitfor = [job.process.sentinel for job in self._running]
+                if not reader.eof and not tasks:
+                    waitfor.append(reader.fd)
+
+                for ready in wait(waitfor):
+                    if ready == reader.fd:
+                        for line in reader.read():
+                            num += 1
+                            if not line.strip() or line.startswith('#'):
+                                continue
+                            try:
+                                tasks.append(parse_task(line, num, self._env.cwd))
+                            except SymbioticException as e:
+                                self._report(num, 'ERROR ({0})'.format(str(e)))
+                        continue
+
+                    job = next(j for j in self._running
+                               if j.process.sentinel == ready)
+                    self._running.remove(job)
+                    self._finish(job)
+        finally:
+            for job in self._running:
+                job.process.terminate()
+            for job in self._running:
+                job.process.join()
+                job.conn.close()
+
+
+def run_batch(opts):
+    """
+    Verify the tasks from the file opts.batch ('-' for stdin).
+    Return the exit code of Symbiotic.
+    """
+    if opts.batch == '-':
+        fd = sys.stdin.fileno()
+    else:
+        try:
+            fd = os.open(opts.batch, os.O_RDONLY)
+        except OSError as e:
+            err('Cannot open the file with tasks: {0}'.format(str(e)))
+
+    # the tasks with another property are set up again from these
+    base = (deepcopy(opts), dict(os.environ))
+    setup = SetupSymbiotic(opts)
+    tool, environment = setup.setup()
+
+    def terminate(signum, frame):
+        sys.exit(1)
+    signal(SIGTERM, terminate)
+
+    runner = BatchRunner(opts, tool, environment, base)
+    try:
+        runner.run(fd)
+    except KeyboardInterrupt:
+        print('Interrupted...', file=sys.stderr)
+        return 1
+    finally:
+        setup.cleanup()
+
+    return 1 if runner.failed else 0
@@ -4,6 +4,12 @@ from os import environ, getcwd
 from os.path import isfile, isdir
 from . utils import err, dbg
 from . utils.utils import process_grep
+from . utils.envcache import EnvironmentCache, search_dirs
+
+try:
+    from benchexec.util import find_executable
+except ImportError:
+    from . benchexec.util import find_executable
 
 import re
 
@@ -14,23 +20,38 @@ def _vers_are_same(v1, v2):
     # compare major and minor versions, ignore micro version
     return all(parts1[i] == parts2[i] for i in range(2))
 
-def _check_clang_in_path(llvm_version):
+def _get_clang_version(cache):
+    key = 'clang-version\0' + environ.get('PATH', '')
+    version = cache.get(key)
+    if version is not None:
+        return version
+
     versline = process_grep(['clang', '-v'], 'clang version')
     if versline[0] != 0 or len(versline[1]) != 1:
-        return False
+        return None
 
     match = re.search(r'\d+\.\d+\.\d+', versline[1][0].decode())
     if match is None:
         err('Could not determine the clang version')
 
-    return _vers_are_same(match[0], llvm_version)
+    clang = find_executable('clang', exitOnError=False)
+    if clang:
+        cache.put(key, match[0], search_dirs('PATH') + [clang])
+    return match[0]
+
+def _check_clang_in_path(llvm_version, cache):
+    version = _get_clang_version(cache)
+    if version is None:
+        return False
+
+    return _vers_are_same(version, llvm_version)
 
 def _set_symbiotic_environ(tool, env, opts):
     env.cwd = getcwd()
 
     if opts.search_include_paths:
         from . includepaths import IncludePathsSearcher
-        additional_include_paths = IncludePathsSearcher().get()
+        additional_include_paths = IncludePathsSearcher(env.cache).get()
         for p in additional_include_paths:
             env.prepend('C_INCLUDE_DIR', p)
 
@@ -42,7 +63,7 @@ def _set_symbiotic_environ(tool, env, opts):
 
     if not isdir(llvm_prefix):
         dbg('Did not find a build of LLVM, checking the system LLVM')
-        if not _check_clang_in_path(llvm_version):
+        if not _check_clang_in_path(llvm_version, env.cache):
             dbg("System's LLVM does not have the right version ({0})".format(llvm_version))
             dbg("Cannot use system LLVM neither the directory with LLVM binaries exists: '{0}'".format(llvm_prefix))
 
@@ -50,7 +71,7 @@ def _set_symbiotic_environ(tool, env, opts):
             dbg("Trying binaries in install/ directory")
             llvm_prefix = '{0}/install/llvm-{1}'.format(env.symbiotic_dir, llvm_version)
             env.prepend('PATH', '{0}/bin'.format(llvm_prefix))
-            if not _check_clang_in_path(llvm_version):
+            if not _check_clang_in_path(llvm_version, env.cache):
                 err('Could not find a suitable LLVM binaries')
             else:
                 dbg('The binary in install/ folder can do!')
@@ -91,7 +112,7 @@ def _set_symbiotic_environ(tool, env, opts):
     # so that we have at least includes from our clang's instalation
     # (these has the lowest prefs., so just append them
     if opts.search_include_paths:
-        additional_include_paths = IncludePathsSearcher().get()
+        additional_include_paths = IncludePathsSearcher(env.cache).get()
         for p in additional_include_paths:
             env.append('C_INCLUDE_DIR', p)
 
@@ -126,6 +147,8 @@ class Environment:
         self.working_dir = None
         # the current directory from where we call symbiotic
         self.cwd = None
+        # the results of probing the environment
+        self.cache = EnvironmentCache()
 
     def prepend(self, env, what):
         """ Prepend 'what' to environment variable 'env'"""
@@ -1,11 +1,21 @@
 from . utils.process import ProcessRunner
 from . utils.watch import ProcessWatch
 from . utils import dbg
+from . utils.envcache import search_dirs
 from . exceptions import SymbioticException
 
+from os import environ
+
+try:
+    from benchexec.util import find_executable
+except ImportError:
+    from . benchexec.util import find_executable
+
 class IncludePathsSearcher:
-    def __init__(self):
+    def __init__(self, cache=None):
         self._paths = []
+        # the cache of the results of probing the environment
+        self._cache = cache
 
     def _get_include_paths(self, cmd):
         """
@@ -43,9 +53,25 @@ class IncludePathsSearcher:
             dbg('Failed getting include paths: {0}'.format(str(e)))
 
     def get(self):
+        # the paths depend on the compilers found in PATH
+        # and on the variables that the compilers take into account
+        key = '\0'.join(['include-paths'] +
+                        [environ.get(v, '') for v in
+                         ('PATH', 'CPATH', 'C_INCLUDE_PATH')])
+        if self._cache:
+            paths = self._cache.get(key)
+            if paths is not None:
+                return paths
+
         self._get_clang_include_paths()
         if not self._paths:
             self._get_cpp_include_paths()
 
+        if self._cache and self._paths:
+            compilers = [find_executable(c, exitOnError=False)
+                         for c in ('clang', 'cpp')]
+            self._cache.put(key, self._paths,
+                            search_dirs('PATH') + [c for c in compilers if c])
+
         return self._paths
 
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+
+"""
+Index of the precompiled models of undefined functions.
+
+The models are precompiled into
+<prefix>/llvm-<version>/{lib,lib32}/<type>/[<tool>/]<function>.bc
+by scripts/precompile_bitcode_files.sh. The index is a JSON file stored
+next to them that maps every model to the symbols it defines and
+the symbols it leaves undefined. With the index, the whole closure
+of models needed by a module can be found without inspecting
+the linked module again after every round of linking.
+"""
+
+import os
+import json
+
+INDEX_FILE = 'models.json'
+INDEX_VERSION = 1
+
+# the symbol types (as printed by nm) of undefined symbols
+UNDEFINED_TYPES = ('U', 'w', 'v')
+
+
+def parse_nm_output(lines):
+    """
+    Parse the output of 'nm --extern-only' (as bytes lines).
+    Return a pair (defined, undefined) of lists of symbol names.
+    """
+    defined, undefined = [], []
+    for line in lines:
+        parts = line.split()
+        if len(parts) < 2:
+            continue
+
+        ty, name = parts[-2].decode('ascii'), parts[-1].decode('ascii')
+        if ty in UNDEFINED_TYPES:
+            undefined.append(name)
+        else:
+            defined.append(name)
+
+    return defined, undefined
+
+
+class ModelIndex(object):
+    """
+    The index of precompiled models in one library directory
+    (i.e., for one version of LLVM and one architecture)
+    """
+
+    def __init__(self, libdir, models):
+        self._libdir = libdir
+        self._models = models
+
+    def get(self, ty, tool, fun):
+        """
+        Return the absolute path to the precompiled model
+        of \param fun from the category \param ty, specific
+        for \param tool, or None if there is no such model.
+        If tool is None, return the generic model.
+        """
+        if tool is None:
+            rel = '{0}/{1}.bc'.format(ty, fun)
+        else:
+            rel = '{0}/{1}/{2}.bc'.format(ty, tool, fun)
+
+        if rel in self._models:
+            return os.path.join(self._libdir, rel)
+        return None
+
+    def _entry(self, path):
+        return self._models.get(os.path.relpath(path, self._libdir), {})
+
+    def defined(self, path):
+        """ Symbols defined by the model at \param path """
+        return self._entry(path).get('defined', [])
+
+    def undefined(self, path):
+        """ Symbols that are undefined in the model at \param path """
+        return self._entry(path).get('undefined', [])
+
+
+def load_index(libdir):
+    """
+    Load the index of models from the directory \param libdir.
+    Return None if there is no (valid) index.
+    """
+    path = os.path.join(libdir, INDEX_FILE)
+    try:
+        with open(path, 'r') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if data.get('version') != INDEX_VERSION:
+        return None
+
+    return ModelIndex(libdir, data.get('models', {}))
+
+
+def build_index(libdir, categories, get_symbols):
+    """
+    Create the index of all precompiled models from \param categories
+    (e.g., libc, posix, ...) found in \param libdir. \param get_symbols
+    is a function that takes a path to a bitcode file and returns
+    the pair (defined, undefined) of symbols of the file.
+    """
+    models = {}
+    for ty in categories:
+        for root, _, files in os.walk(os.path.join(libdir, ty)):
+            for f in files:
+                if not f.endswith('.bc'):
+                    continue
+
+                path = os.path.join(root, f)
+                defined, undefined = get_symbols(path)
+                models[os.path.relpath(path, libdir)] =\
+                    {'defined': sorted(defined),
+                     'undefined': sorted(undefined)}
+
+    with open(os.path.join(libdir, INDEX_FILE), 'w') as f:
+        json.dump({'version': INDEX_VERSION, 'models': models}, f,
+                  indent=1, sort_keys=True)
+
+    return len(models)
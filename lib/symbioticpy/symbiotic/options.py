@@ -45,6 +45,9 @@ class SymbioticOptions(object):
         self.timeout = 0
         self.slicer_timeout = 0
         self.instrumentation_timeout = 0
+        # use the timeouts of stages as they are given,
+        # do not adapt them to the remaining time
+        self.static_timeouts = False
         self.no_optimize = False
         self.no_verification = False
         self.no_instrument = False
@@ -107,6 +110,29 @@ class SymbioticOptions(object):
         self.save_files = False
         self.working_dir_prefix = '/tmp'
         self.unroll_count = 0
+        # directory with the cache of intermediate bitcode files
+        self.cache_dir = None
+        # do not cache the results of probing the environment
+        self.no_env_cache = False
+        # where to store the report about the stages of the run
+        self.telemetry = None
+        # how many verifiers of a portfolio may run concurrently
+        self.portfolio_jobs = 1
+        # stop the verifier this many seconds after it decided the result
+        self.stop_on_verdict = None
+        # the file with tasks to verify in the batch mode ('-' is stdin)
+        self.batch = None
+        # how many tasks may be verified concurrently in the batch mode
+        self.batch_jobs = 1
+        # prepare the unsliced file for the verification in the background
+        # (while slicing and verifying the sliced file)
+        self.background_unsliced = False
+        # verify the sliced and unsliced code concurrently (SV-COMP mode)
+        self.race_unsliced = False
+        # deduplicate the test-suite while it is generated (TEST-COMP mode)
+        self.watch_testsuite = False
+        # remove the redundant tests from the test-suite (TEST-COMP mode)
+        self.minimize_testsuite = False
 
 def _remove_linkundef(options, what):
     try:
@@ -204,7 +230,7 @@ def parse_command_line():
         opts, args = getopt.getopt(argv[1:], '',
                                    ['no-slice', '32', '64', 'prp=', 'no-optimize',
                                     'debug=', 'timeout=','slicer-timeout=',
-                                    'instrumentation-timeout=', 'version', 'help',
+                                    'instrumentation-timeout=', 'static-timeouts', 'version', 'help',
                                     'no-verification', 'output=', 'witness=', 'bc',
                                     'optimize=', 'malloc-never-fails',
                                     'pta=', 'no-link=', 'argv=', 'no-instrument',
@@ -222,7 +248,11 @@ def parse_command_line():
                                     'overflow-with-clang', 'gen-ll', 'gen-c', 'test-suite=',
                                     'search-include-paths', 'replay-error', 'cc',
                                     'report=', 'no-replay-error',
-                                    'unroll=', 'full-instrumentation', 'target-settings='])
+                                    'unroll=', 'full-instrumentation', 'target-settings=',
+                                    'cache-dir=', 'portfolio-jobs=', 'stop-on-verdict=',
+                                    'batch=', 'batch-jobs=', 'no-env-cache',
+                                    'telemetry=', 'background-unsliced', 'race-unsliced',
+                                    'watch-test-suite', 'minimize-test-suite'])
                                    # add klee-params
     except getopt.GetoptError as e:
         err('{0}'.format(str(e)))
@@ -341,6 +371,8 @@ def parse_command_line():
             except ValueError:
                 err('Invalid numerical argument for timeout: {0}'.format(arg))
             dbg('Timeout of slicer set to {0} sec'.format(arg))
+        elif opt == '--static-timeouts':
+            options.static_timeouts = True
         elif opt == '--instrumentation-timeout':
             try:
                 options.instrumentation_timeout = int(arg)
@@ -413,6 +445,45 @@ def parse_command_line():
             options.full_instrumentation = True
         elif opt == '--test-suite':
             options.testsuite_output = os.path.abspath(arg)
+        elif opt == '--cache-dir':
+            options.cache_dir = os.path.abspath(os.path.expanduser(arg))
+            dbg('Intermediate bitcode will be cached in {0}'.format(options.cache_dir))
+        elif opt == '--telemetry':
+            options.telemetry = os.path.abspath(arg)
+            dbg('Telemetry will be stored to {0}'.format(arg))
+        elif opt == '--background-unsliced':
+            options.background_unsliced = True
+        elif opt == '--race-unsliced':
+            options.race_unsliced = True
+        elif opt == '--watch-test-suite':
+            options.watch_testsuite = True
+        elif opt == '--minimize-test-suite':
+            options.minimize_testsuite = True
+        elif opt == '--no-env-cache':
+            options.no_env_cache = True
+        elif opt == '--portfolio-jobs':
+            try:
+                options.portfolio_jobs = int(arg)
+            except ValueError:
+                err('Invalid numerical argument for portfolio-jobs: {0}'.format(arg))
+            if options.portfolio_jobs <= 0:
+                options.portfolio_jobs = os.cpu_count() or 1
+            dbg('Running up to {0} verifiers concurrently'.format(options.portfolio_jobs))
+        elif opt == '--stop-on-verdict':
+            try:
+                options.stop_on_verdict = float(arg)
+            except ValueError:
+                err('Invalid numerical argument for stop-on-verdict: {0}'.format(arg))
+        elif opt == '--batch':
+            options.batch = arg
+        elif opt == '--batch-jobs':
+            try:
+                options.batch_jobs = int(arg)
+            except ValueError:
+                err('Invalid numerical argument for batch-jobs: {0}'.format(arg))
+            if options.batch_jobs <= 0:
+                options.batch_jobs = os.cpu_count() or 1
+            dbg('Verifying up to {0} tasks concurrently'.format(options.batch_jobs))
 
     # check conflicts
     if options.require_slicer and options.noslice:
@@ -437,6 +508,9 @@ where OPTS can be following:
                                  is skipped)
     --slicer-timeout=t           Set timeout for slicer (if slicer fails/timeouts,
                                  the original bitcode is used)
+    --static-timeouts            Use the timeouts of instrumentation, slicer and verifiers
+                                 as they are. By default, they are bounded
+                                 by shares of the time that remains to --timeout
     --no-slice                   Do not slice the code
     --verifier=name              Use the tool 'name'. Default is KLEE, other tools that
                                  can be integrated are Ceagle, CPAchecker, Seahorn,
@@ -515,12 +589,58 @@ where OPTS can be following:
     --dump-env-cmd               Dump environment variables for using them in command line
     --statistics                 Dump statistics about bitcode
     --working-dir-prefix         Where to create the temporary directory (defaults to /tmp)
+    --cache-dir=DIR              Cache the bitcode produced by the compilation stages
+                                 (opt, instrumentation, slicing, linking) in DIR
+                                 and reuse it in the next runs on the same input.
+                                 The results of checking the environment are cached
+                                 in DIR too (in ~/.cache/symbiotic by default)
+    --no-env-cache               Check the environment (the paths to the tools,
+                                 their versions, include paths) on every run, do not
+                                 reuse the results from the previous runs
+    --portfolio-jobs=N           Run up to N verifiers of the target concurrently
+                                 (if the target supports it) and take the first
+                                 true/false answer. 0 means the number of CPUs
+    --stop-on-verdict=t          Stop the verifier t seconds after its output decided
+                                 the result (e.g., KLEE found the error with
+                                 --exit-on-error) instead of waiting until it finishes.
+                                 In a portfolio, stop the other verifiers immediately
+    --batch=FILE                 Verify the tasks from FILE ('-' for stdin) instead of
+                                 the sources. Every line of FILE is a JSON object
+                                 with the keys 'sources' (mandatory), 'id', 'prp',
+                                 '32bit', 'timeout', 'witness' and 'test-suite'.
+                                 The setup is done only once and the results are
+                                 written to stdout as JSON lines. The timeout
+                                 is the timeout of every task
+    --batch-jobs=N               Verify up to N tasks of the batch concurrently,
+                                 0 means the number of CPUs
+    --telemetry=FILE             Store a JSON report with the time, CPU time, memory
+                                 and sizes of the bitcode files of every stage
+                                 (compilation, opt runs, instrumentation, slicing,
+                                 linking, verifiers) into FILE
+    --background-unsliced        Prepare the unsliced code for verification in the background
+                                 while the code is sliced and verified, so that replaying
+                                 errors and falling back to the unsliced code start
+                                 immediately
+    --race-unsliced              With --sv-comp, verify the sliced and the unsliced code
+                                 concurrently (if there are at least two CPUs) instead
+                                 of falling back to the unsliced code when the verification
+                                 of the sliced code fails. The first true/false answer
+                                 is taken and the other verification is stopped
     --replay-error               Try replaying a found error on non-sliced code
     --no-replay-error            Do not replay a found error on non-sliced code (overrides --sv-comp)
     --search-include-paths       Try automatically finding paths with standard include directories
     --sv-comp                    Shortcut for SV-COMP settings (malloc-never-fails, etc.)
     --test-comp                  Shortcut for TEST-COMP settings
     --test-suite                 Output for tests if --test-comp options is on
+    --watch-test-suite           With --test-comp, watch the test-suite while it is generated,
+                                 remove the tests with the same inputs as an earlier test
+                                 and convert the .ktest files that have no test case
+                                 before finishing (also on timeout)
+    --minimize-test-suite        With --test-comp, remove the tests with the same inputs
+                                 from the generated test-suite and, for coverage properties,
+                                 keep only tests that cover all the covered edges
+                                 (the tests are replayed on the program compiled by clang
+                                 with -fsanitize-coverage=trace-pc-guard)
     --full-instrumentation       Tranform checking errors to reachability problem, i.e.
                                  instrument tracking of the state of the program directly
                                  into the program.
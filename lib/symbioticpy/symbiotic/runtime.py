@@ -5,6 +5,7 @@ import os
 from . utils import err, dbg
 from . utils.utils import print_stdout, print_stderr, get_symbiotic_dir
 from . environment import Environment
+from . utils.envcache import EnvironmentCache, search_dirs
 from . verifier import initialize_verifier
 from . property import get_property
 
@@ -70,9 +71,19 @@ class SetupSymbiotic:
                      'libdgPointsToPlugin.so', 'libPredatorPlugin.so',
                      'libdgllvmdg.so', 'libdgllvmpta.so', 'libdgllvmdda.so',
                      'libdgpta.so', 'libdgdda.so', 'libdgllvmcda.so']
+        cache = self.environment.cache
+        key = 'libraries\0' + os.environ.get('LD_LIBRARY_PATH', '')
+        if cache.get(key) is not None:
+            return
+
+        paths = []
         for lib in libraries:
-            if not _find_library(lib):
+            path = _find_library(lib)
+            if not path:
                 err("Cannot find library '{0}'".format(lib))
+            paths.append(path)
+
+        cache.put(key, paths, search_dirs('LD_LIBRARY_PATH') + paths)
 
     def _perform_binaries_check(self, additional):
         try:
@@ -82,12 +93,52 @@ class SetupSymbiotic:
 
         executables = ['clang', 'opt', 'llvm-link', 'llvm-nm',
                        'sbt-instr'] + additional
+        cache = self.environment.cache
+        key = '\0'.join(['executables', os.environ.get('PATH', '')] + executables)
+        paths = cache.get(key)
+        if paths is not None:
+            for exe, exe_path in zip(executables, paths):
+                dbg("'{0}' is '{1}' (cached)".format(os.path.basename(exe), exe_path))
+            return
+
+        paths = []
         for exe in executables:
             exe_path = find_executable(exe)
             if not os.path.isfile(exe_path):
                 err("Cannot find executable '{0}' ('{1}')".format(exe, exe_path))
             else:
                 dbg("'{0}' is '{1}'".format(os.path.basename(exe), exe_path))
+            paths.append(exe_path)
+
+        cache.put(key, paths, search_dirs('PATH') + paths)
+
+    def _perform_integrity_check(self, opts):
+        from . integritycheck import IntegrityChecker
+        from . options import get_versions
+
+        try:
+            from benchexec.util import find_executable
+        except ImportError:
+            from . benchexec.util import find_executable
+
+        # the versions of the components are in the salt of the cache
+        cache = self.environment.cache
+        key = '\0'.join(('integrity', opts.tool_name, os.environ.get('PATH', '')))
+        if cache.get(key):
+            dbg('The integrity of the components has already been checked')
+            return
+
+        try:
+            _, versions, _, _= get_versions()
+            checker = IntegrityChecker(versions)
+            checker.check(opts.tool_name);
+        except SymbioticException as e:
+            err('{0}\nIf you are aware of this, you may use --no-integrity-check '\
+                'to suppress this error'.format(str(e)))
+
+        tools = [find_executable(t, exitOnError=False)
+                 for t in ('klee', 'sbt-slicer', 'sbt-instr')]
+        cache.put(key, True, search_dirs('PATH') + [t for t in tools if t])
 
     def _check_components(self, opts, additional_bins = []):
         # check availability of binaries and libraries
@@ -96,32 +147,39 @@ class SetupSymbiotic:
 
         # this calls the tools, so it must be after setting the environ
         if not self.opts.no_integrity_check:
-            from . integritycheck import IntegrityChecker
-            from . options import get_versions
-
-            try:
-                _, versions, _, _= get_versions()
-                checker = IntegrityChecker(versions)
-                checker.check(opts.tool_name);
-            except SymbioticException as e:
-                err('{0}\nIf you are aware of this, you may use --no-integrity-check '\
-                    'to suppress this error'.format(str(e)))
-
-    def setup(self):
-        self.environment = Environment(get_symbiotic_dir())
-        dbg('Symbiotic dir: {0}'.format(self.environment.symbiotic_dir))
-
+            self._perform_integrity_check(opts)
+
+    def _open_environment_cache(self):
+        from hashlib import sha256
+        from sys import executable
+        from . options import get_versions
+
+        cachedir = self.opts.cache_dir
+        if cachedir is None:
+            cachedir = os.path.join(os.environ.get('XDG_CACHE_HOME') or
+                                    os.path.expanduser('~/.cache'), 'symbiotic')
+        # every installation of symbiotic has its own cache
+        symbdir = self.environment.symbiotic_dir
+        name = 'environment-{0}.json'.format(
+                    sha256(symbdir.encode('utf-8')).hexdigest()[:16])
+        return EnvironmentCache(os.path.join(cachedir, name),
+                                repr((get_versions(), symbdir, executable)))
+
+    def setup_verifier(self):
+        """
+        Derive the property from the options, initialize the verifier
+        for it and set the environment for the verifier. Raises
+        SymbioticException if the property or the verifier is unknown.
+        \return the verifier
+        """
         # setup the property (must be done before initializing the verifier)
         # and then initialize the verifier
-        try:
-            self.opts.property = get_property(self.environment.symbiotic_dir,
-                                              self.opts.propertystr)
-            if self.opts.property is None:
-                err('Could not derive the right property')
+        self.opts.property = get_property(self.environment.symbiotic_dir,
+                                          self.opts.propertystr)
+        if self.opts.property is None:
+            raise SymbioticException('Could not derive the right property')
 
-            tool = initialize_verifier(self.opts)
-        except SymbioticException as e:
-            err(str(e))
+        tool = initialize_verifier(self.opts)
 
         # set environment. That is set PATH and LD_LIBRARY_PATH and so on
         self.environment.set(tool, self.opts)
@@ -131,6 +189,19 @@ class SetupSymbiotic:
             check_bins.append('llvm2c')
             check_bins.append('gen-c')
         self._check_components(self.opts, check_bins)
+        return tool
+
+    def setup(self):
+        self.environment = Environment(get_symbiotic_dir())
+        dbg('Symbiotic dir: {0}'.format(self.environment.symbiotic_dir))
+        if not self.opts.no_env_cache:
+            self.environment.cache = self._open_environment_cache()
+
+        try:
+            tool = self.setup_verifier()
+        except SymbioticException as e:
+            err(str(e))
+        self.environment.cache.save()
 
         # change working directory so that we do not mess up the current directory much
         self.environment.working_dir = os.path.abspath(self._setup_working_directory())
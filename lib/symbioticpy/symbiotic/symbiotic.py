@@ -3,15 +3,82 @@
 import os
 import sys
 import re
+from threading import Thread, Lock
+from queue import Queue
 
 from . transform import SymbioticCC
 from . verifier import SymbioticVerifier
 from . options import SymbioticOptions
 from . utils import err, dbg, print_elapsed_time, restart_counting_time
-from . utils.utils import print_stdout
+from . utils.utils import print_stdout, available_cpus
 from . utils.process import ProcessRunner
 from . exceptions import SymbioticExceptionalResult
 
+def _decided(res):
+    sw = res.lower().startswith
+    return sw('true') or sw('false')
+
+
+class _RaceJob(object):
+    """
+    Verification of one version of the code (sliced or unsliced)
+    in the race, it runs in its own thread
+    """
+
+    def __init__(self, name, get_bitcode):
+        self.name = name
+        # returns the bitcode to verify (or None if there is none)
+        self._get_bitcode = get_bitcode
+        self._verifier = None
+        self._stopped = False
+        self._lock = Lock()
+        self.thread = None
+        self.result = None
+        self.tool = None
+        # the bitcode next to which the verifier stored its outputs
+        self.outfile = None
+        self.exception = None
+
+    def _run(self, symbiotic, finished):
+        try:
+            bitcode = self._get_bitcode()
+            if bitcode is None:
+                self.result = 'unknown (no {0} code)'.format(self.name)
+            else:
+                verifier = SymbioticVerifier(bitcode, symbiotic.sources,
+                                             symbiotic._tool, symbiotic.options,
+                                             symbiotic.env)
+                # the outputs of the verifiers must not clash
+                verifier.cwd = os.path.dirname(os.path.abspath(bitcode))
+                with self._lock:
+                    if self._stopped:
+                        verifier.stop()
+                    self._verifier = verifier
+                self.result, self.tool = verifier.run()
+                self.outfile = verifier.curfile
+        except Exception as e:
+            self.exception = e
+        finished.put(self)
+
+    def start(self, symbiotic, finished):
+        self.thread = Thread(target=self._run, args=(symbiotic, finished),
+                             daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        with self._lock:
+            self._stopped = True
+            verifier = self._verifier
+        if verifier:
+            verifier.stop()
+
+    def kill(self):
+        with self._lock:
+            verifier = self._verifier
+        if verifier:
+            verifier.kill()
+
+
 class Symbiotic(object):
     """
     Instance of symbiotic tool. Instruments, prepares, compiles and runs
@@ -34,36 +101,33 @@ class Symbiotic(object):
         # tool to use
         self._tool = tool
 
+        # the compiler of the code (set once we run)
+        self._cc = None
+        # the watcher of the generated test-suite
+        self._testsuite_watcher = None
+
     def terminate(self):
-        pr = ProcessRunner()
-        if pr.hasProcess():
-            pr.terminate()
+        ProcessRunner.terminate_all()
 
     def kill(self):
-        pr = ProcessRunner()
-        if pr.hasProcess():
-            pr.kill()
+        ProcessRunner.kill_all()
 
     def kill_wait(self):
-        pr = ProcessRunner()
-        if not pr.hasProcess():
+        if ProcessRunner.kill_all() == 0:
             return
 
-        if pr.exitStatus() is None:
-            from time import sleep
-            while pr.exitStatus() is None:
-                pr.kill()
+        from time import sleep
+        while ProcessRunner.kill_all() > 0:
+            print('Waiting for the child processes to terminate')
+            sleep(0.5)
 
-                print('Waiting for the child process to terminate')
-                sleep(0.5)
+        print('Killed the child processes')
 
-            print('Killed the child process')
-
-    def replay_nonsliced(self, tool, cc):
+    def replay_nonsliced(self, tool, cc, outfile):
         bitcode = cc.prepare_unsliced_file()
         params = []
         if hasattr(tool, "replay_error_params"):
-            params = tool.replay_error_params(cc.curfile)
+            params = tool.replay_error_params(outfile)
 
         print_stdout('INFO: Replaying error path', color='WHITE')
         restart_counting_time()
@@ -75,25 +139,133 @@ class Symbiotic(object):
 
         print_elapsed_time('INFO: Replaying error path time', color='WHITE')
 
-        return res
+        return res, verifier.curfile
+
+    def _should_race(self):
+        options = self.options
+        if not options.race_unsliced or options.noslice or options.no_verification:
+            return False
+        if not options.sv_comp:
+            dbg('Racing the sliced and unsliced code is supported only with --sv-comp')
+            return False
+        if available_cpus() < 2:
+            dbg('Not racing the sliced and unsliced code, we have only one CPU')
+            return False
+        return True
+
+    def _race_unsliced(self, cc, bitcode):
+        """
+        Verify the sliced \\param bitcode and the unsliced code concurrently.
+        The first true/false answer wins and the other verification
+        is stopped. If neither answers true/false, the answer
+        on the unsliced code is taken (if we have it).
+        Return the triple (result, tool, outfile) as for a single verification.
+        """
+        options = self.options
+        print_stdout('INFO: Verifying the sliced and the unsliced code concurrently',
+                     color='WHITE')
+
+        finished = Queue()
+        sliced = _RaceJob('sliced', lambda: bitcode)
+        # do not prepare the unsliced file here if preparing
+        # in the background failed, it would clash with the sliced file
+        unsliced = _RaceJob('unsliced', cc.background_unsliced_file)
+        running = [sliced, unsliced]
+        for job in running:
+            job.start(self, finished)
+
+        done = []
+        try:
+            while running:
+                job = finished.get()
+                running.remove(job)
+                if job.exception is not None:
+                    raise job.exception
+                print_stdout('INFO: Verification of the {0} code answered {1}'\
+                             .format(job.name, job.result), color='WHITE')
+                done.append(job)
+                if _decided(job.result):
+                    break
+        finally:
+            for job in running:
+                job.stop()
+            # give the verifiers a moment to terminate, then kill them
+            for job in running:
+                job.thread.join(1)
+                job.kill()
+
+        winner = done[-1]
+        if not _decided(winner.result):
+            # take the answer on the unsliced code if we have it
+            winner = unsliced if unsliced.outfile else sliced
+        if winner is unsliced:
+            # now we behave like without slicing
+            options.replay_error = False
+            options.noslice = True
+        return winner.result, winner.tool, winner.outfile
+
+    def _stop_testsuite_watcher(self):
+        if self._testsuite_watcher:
+            # make the test-suite complete (even on timeout)
+            self._testsuite_watcher.stop()
+            self._testsuite_watcher = None
+
+    def _reduce_testsuite(self):
+        from . testsuits.suite import reduce_testsuite
+
+        # the watcher must not touch the suite anymore
+        self._stop_testsuite_watcher()
+        options = self.options
+        workdir = self.env.working_dir if self.env else os.getcwd()
+        # the tests are replayed natively, so we do not use the compiler
+        # of the tool (it may compile for a different target)
+        total, removed = reduce_testsuite(options.testsuite_output, self.sources,
+                                          workdir, options, jobs=available_cpus())
+        print_stdout('INFO: Kept {0} of {1} tests in the test-suite'\
+                     .format(total - removed, total), color='WHITE')
+        print_elapsed_time('INFO: Reducing the test-suite time', color='WHITE')
 
     def _run_symbiotic(self):
         options = self.options
+        race = self._should_race()
+        if race:
+            # the unsliced code must be ready as soon as possible
+            # and in its own directory
+            options.background_unsliced = True
+
         cc = SymbioticCC(self.sources, self._tool, options, self.env)
+        self._cc = cc
         bitcode = cc.run()
 
         if options.no_verification:
             return 'No verification'
 
-        verifier = SymbioticVerifier(bitcode, self.sources,
-                                     self._tool, options, self.env)
-        # result and the tool that decided this result
-        res, tool = verifier.run()
+        if options.test_comp and options.watch_testsuite:
+            from . testsuits.watcher import TestSuiteWatcher
+            self._testsuite_watcher = TestSuiteWatcher(options.testsuite_output,
+                                                       available_cpus())
+            self._testsuite_watcher.start()
+
+        # slicing may have failed, then there is nothing to race with
+        raced = race and not options.noslice
+        if raced:
+            res, tool, outfile = self._race_unsliced(cc, bitcode)
+        else:
+            verifier = SymbioticVerifier(bitcode, self.sources,
+                                         self._tool, options, self.env)
+            # result and the tool that decided this result
+            res, tool = verifier.run()
+            # the bitcode next to which the verifier stored its outputs
+            # (it differs from cc.curfile if verifiers ran in a portfolio)
+            outfile = verifier.curfile
 
         # if we crashed on the sliced file, try running on the unsliced file
         # (do this optional, as well as for slicer and instrumentation)
         resstartswith = res.lower().startswith
-        if (not options.noslice) and \
+        if raced:
+            # we already verified the unsliced code if it was needed
+            pass
+        elif (not options.noslice) and \
            (options.sv_comp or options.test_comp) and \
            (resstartswith('error') or resstartswith('unknown')):
             print_stdout("INFO: Failed on the sliced code, trying on the unsliced code",
@@ -104,6 +276,7 @@ class Symbiotic(object):
             verifier = SymbioticVerifier(bitcode, self.sources,
                                          self._tool, options, self.env)
             res, tool = verifier.run()
+            outfile = verifier.curfile
             print_elapsed_time('INFO: Running on unsliced code time', color='WHITE')
 
         if tool and options.replay_error and not tool.can_replay():
@@ -115,7 +288,7 @@ class Symbiotic(object):
         if has_error and options.replay_error and\
            not options.noslice and tool.can_replay():
             print_stdout("Trying to confirm the error path")
-            newres = self.replay_nonsliced(tool, cc)
+            newres, outfile = self.replay_nonsliced(tool, cc, outfile)
 
             dbg("Original result: '{0}'".format(res))
             dbg("Replayed result: '{0}'".format(newres))
@@ -139,19 +312,23 @@ class Symbiotic(object):
             verifier = SymbioticVerifier(bitcode, self.sources,
                                          self._tool, options, self.env)
             res, tool = verifier.run()
+            outfile = verifier.curfile
             has_error = res and\
                         (res.startswith('false') or\
                         (res.startswith('done') and options.property.errorcall()))
  
         if has_error and hasattr(tool, "describe_error"):
-            tool.describe_error(cc.curfile)
+            tool.describe_error(outfile)
 
         if has_error and options.executable_witness and\
            hasattr(tool, "generate_exec_witness"):
-            tool.generate_exec_witness(cc.curfile, self.sources)
+            tool.generate_exec_witness(outfile, self.sources)
 
         if not options.nowitness and hasattr(tool, "generate_witness"):
-            tool.generate_witness(cc.curfile, self.sources, has_error)
+            tool.generate_witness(outfile, self.sources, has_error)
+
+        if options.test_comp and options.minimize_testsuite:
+            self._reduce_testsuite()
 
         return res
 
@@ -166,4 +343,9 @@ class Symbiotic(object):
         except SymbioticExceptionalResult as res:
             # we got result from some exceptional case
             return str(res)
+        finally:
+            if self._cc:
+                # we do not need the unsliced file anymore
+                self._cc.cancel_unsliced_preparation()
+            self._stop_testsuite_watcher()
 
@@ -1,53 +1,65 @@
-from . klee import SymbioticTool as KleeTool
-from . ceagle import SymbioticTool as CeagleTool
-from . cbmc import SymbioticTool as CbmcTool
-from . cbmcsvcomp import SymbioticTool as CbmcSVCOMPTool
-from . esbmc import SymbioticTool as EsbmcTool
-from . ikos import SymbioticTool as IkosTool
-from . map2check import SymbioticTool as Map2CheckTool
-from . cpachecker import SymbioticTool as CpaTool
-from . skink import SymbioticTool as SkinkTool
-from . smack import SymbioticTool as SmackTool
-from . seahorn import SymbioticTool as SeahornTool
-from . nidhugg import SymbioticTool as NidhuggTool
-from . divine import SymbioticTool as DivineTool
-from . divinesvc import SymbioticTool as DivineSvcompTool
-from . ultimateautomizer import SymbioticTool as UltimateTool
-from . svcomp import SymbioticTool as SVCompTool
-from . testcomp import SymbioticTool as TestCompTool
-from . slowbeast import SymbioticTool as SlowbeastTool
-from . predatorhp import SymbioticTool as PredatorHPTool
-from . predator import SymbioticTool as PredatorTool
-from . twols import SymbioticTool as TwolsTool
-from . cc import CCTarget
-
-targets = {
-    'klee':               KleeTool,
-    'ceagle':             CeagleTool,
-    'ikos':               IkosTool,
-    'cbmc':               CbmcTool,
-    'cbmc-svcomp':        CbmcSVCOMPTool,
-    'esbmc':              EsbmcTool,
-    'map2check':          Map2CheckTool,
-    'cpachecker':         CpaTool,
-    'cpa':                CpaTool,
-    'skink':              SkinkTool,
-    'smack':              SmackTool,
-    'seahorn':            SeahornTool,
-    'nidhugg':            NidhuggTool,
-    'divine':             DivineTool,
-    'divine-svcomp':      DivineSvcompTool,
-    'ultimateautomizer':  UltimateTool,
-    'ultimate':           UltimateTool,
-    'uautomizer':         UltimateTool,
-    'ua':                 UltimateTool,
-    'svcomp':             SVCompTool,
-    'testcomp':           TestCompTool,
-    'slowbeast':          SlowbeastTool,
-    'sb':                 SlowbeastTool,
-    'predatorhp':         PredatorHPTool,
-    'predator':           PredatorTool,
-    '2ls':                TwolsTool,
-    'cc':                 CCTarget
+from importlib import import_module
+
+# name of the target -> (module, class)
+_targets = {
+    'klee':               ('klee', 'SymbioticTool'),
+    'ceagle':             ('ceagle', 'SymbioticTool'),
+    'ikos':               ('ikos', 'SymbioticTool'),
+    'cbmc':               ('cbmc', 'SymbioticTool'),
+    'cbmc-svcomp':        ('cbmcsvcomp', 'SymbioticTool'),
+    'esbmc':              ('esbmc', 'SymbioticTool'),
+    'map2check':          ('map2check', 'SymbioticTool'),
+    'cpachecker':         ('cpachecker', 'SymbioticTool'),
+    'cpa':                ('cpachecker', 'SymbioticTool'),
+    'skink':              ('skink', 'SymbioticTool'),
+    'smack':              ('smack', 'SymbioticTool'),
+    'seahorn':            ('seahorn', 'SymbioticTool'),
+    'nidhugg':            ('nidhugg', 'SymbioticTool'),
+    'divine':             ('divine', 'SymbioticTool'),
+    'divine-svcomp':      ('divinesvc', 'SymbioticTool'),
+    'ultimateautomizer':  ('ultimateautomizer', 'SymbioticTool'),
+    'ultimate':           ('ultimateautomizer', 'SymbioticTool'),
+    'uautomizer':         ('ultimateautomizer', 'SymbioticTool'),
+    'ua':                 ('ultimateautomizer', 'SymbioticTool'),
+    'svcomp':             ('svcomp', 'SymbioticTool'),
+    'testcomp':           ('testcomp', 'SymbioticTool'),
+    'slowbeast':          ('slowbeast', 'SymbioticTool'),
+    'sb':                 ('slowbeast', 'SymbioticTool'),
+    'predatorhp':         ('predatorhp', 'SymbioticTool'),
+    'predator':           ('predator', 'SymbioticTool'),
+    '2ls':                ('twols', 'SymbioticTool'),
+    'cc':                 ('cc', 'CCTarget')
 }
 
+
+class TargetRegistry(object):
+    """
+    Maps names of targets to the classes of the targets.
+    The module of a target is imported only when the target is used,
+    so that we do not pay for importing all the targets on every run.
+    """
+
+    def __init__(self, targets):
+        self._targets = targets
+
+    def __getitem__(self, name):
+        # raises KeyError for unknown targets
+        module, cls = self._targets[name]
+        return getattr(import_module('.' + module, __name__), cls)
+
+    def __contains__(self, name):
+        return name in self._targets
+
+    def __iter__(self):
+        return iter(self._targets)
+
+    def keys(self):
+        return self._targets.keys()
+
+    def get(self, name, default=None):
+        if name not in self._targets:
+            return default
+        return self[name]
+
+
+targets = TargetRegistry(_targets)
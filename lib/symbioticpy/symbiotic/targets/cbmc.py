@@ -108,6 +108,10 @@ class SymbioticTool(BaseTool, SymbioticBaseTool):
                            None))
         return setups
 
+    def portfolio(self):
+        # the runs with different bounds are independent
+        return self.verifiers()
+
     def cmdline(self, executable, options, tasks, propertyfile, rlimits):
        #if propertyfile:
        #    options = options + ['--propertyfile', propertyfile]
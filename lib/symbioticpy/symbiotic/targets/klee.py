@@ -29,6 +29,7 @@ except ImportError:
     import symbiotic.benchexec.util as util
     import symbiotic.benchexec.result as result
 
+from .. utils.patterns import PatternSet
 from . kleebase import SymbioticTool as KleeBase
 
 class KleeToolFullInstrumentation(KleeBase):
@@ -40,7 +41,7 @@ class KleeToolFullInstrumentation(KleeBase):
         KleeBase.__init__(self, opts)
 
         # define and compile regular expressions for parsing klee's output
-        self._patterns = [
+        self._patterns = PatternSet([
             ('EDOUBLEFREE', re.compile('.*ASSERTION FAIL: 0 && "double free".*')),
             ('EINVALFREE', re.compile(
                 '.*ASSERTION FAIL: 0 && "free on non-allocated memory".*')),
@@ -77,7 +78,7 @@ class KleeToolFullInstrumentation(KleeBase):
             ('ECMP', re.compile('.*Comparison other than (in)equality is not implemented.*')),
             ('ERESOLV', re.compile('.*Failed resolving.*segment.*')),
             ('ERESOLV', re.compile('.*ERROR:.*Could not resolve.*'))
-        ]
+        ])
 
     def passes_after_slicing(self):
         """
@@ -141,26 +142,26 @@ class KleeToolFullInstrumentation(KleeBase):
         return cmd + options + tasks + opts.argv
 
     def _parse_klee_output_line(self, line):
-        for (key, pattern) in self._patterns:
-            if pattern.match(line):
-                if key == 'ASSERTIONFAILED':
-                    if self._options.property.memsafety():
-                        return result.RESULT_FALSE_DEREF
-                    elif self._options.property.signedoverflow():
-                        return result.RESULT_FALSE_OVERFLOW
-                    elif self._options.property.termination():
-                        return result.RESULT_FALSE_TERMINATION
-                    elif self._options.property.memcleanup():
-                        return result.RESULT_FALSE_MEMCLEANUP
-                    return result.RESULT_FALSE_REACH
-                elif self._options.property.memsafety():
-                    if key == 'EDOUBLEFREE' or key == 'EINVALFREE':
-                        return result.RESULT_FALSE_FREE
-                    if key == 'EMEMLEAK':
-                        return result.RESULT_FALSE_MEMTRACK
-                return key
-
-        return None
+        key = self._patterns.match(line)
+        if key is None:
+            return None
+
+        if key == 'ASSERTIONFAILED':
+            if self._options.property.memsafety():
+                return result.RESULT_FALSE_DEREF
+            elif self._options.property.signedoverflow():
+                return result.RESULT_FALSE_OVERFLOW
+            elif self._options.property.termination():
+                return result.RESULT_FALSE_TERMINATION
+            elif self._options.property.memcleanup():
+                return result.RESULT_FALSE_MEMCLEANUP
+            return result.RESULT_FALSE_REACH
+        elif self._options.property.memsafety():
+            if key == 'EDOUBLEFREE' or key == 'EINVALFREE':
+                return result.RESULT_FALSE_FREE
+            if key == 'EMEMLEAK':
+                return result.RESULT_FALSE_MEMTRACK
+        return key
 
     def determine_result(self, returncode, returnsignal, output, isTimeout):
         if isTimeout:
@@ -205,7 +206,7 @@ class SymbioticTool(KleeBase):
             self.FullInstr = KleeToolFullInstrumentation(opts)
 
         # define and compile regular expressions for parsing klee's output
-        self._patterns = [
+        self._patterns = PatternSet([
             ('ASSERTIONFAILED', re.compile('.*ASSERTION FAIL:.*')),
             ('ASSERTIONFAILED2', re.compile('.Assertion .* failed.*')),
             ('ESTPTIMEOUT', re.compile('.*query timed out (resolve).*')),
@@ -247,7 +248,7 @@ class SymbioticTool(KleeBase):
             ('ECMP', re.compile('.*Comparison other than (in)equality is not implemented.*')),
             ('ERESOLV', re.compile('.*Failed resolving.*segment.*')),
             ('ERESOLV', re.compile('.*ERROR:.*Could not resolve.*'))
-        ]
+        ])
 
     def passes_after_slicing(self):
         if self.FullInstr:
@@ -371,28 +372,28 @@ class SymbioticTool(KleeBase):
     def _parse_klee_output_line(self, line):
         opts = self._options
 
-        for (key, pattern) in self._patterns:
-            if pattern.match(line):
-                # return True so that we know we should terminate
-                if key.startswith('ASSERTIONFAILED'):
-                    if opts.property.signedoverflow():
-                        return result.RESULT_FALSE_OVERFLOW
-                    elif opts.property.termination():
-                        return result.RESULT_FALSE_TERMINATION
-                    else:
-                        return result.RESULT_FALSE_REACH
-                elif key == 'EFREE' or key == 'EFREEALLOCA' or key=='EGLOBLFREE':
-                    return result.RESULT_FALSE_FREE
-                elif key in ('EMEMERROR', 'EINVREALLOC', 'EROREALLOC'):
-                    return result.RESULT_FALSE_DEREF
-                elif key == 'EMEMLEAK':
-                    return result.RESULT_FALSE_MEMTRACK
-                elif key == 'EMEMCLEANUP':
-                    return result.RESULT_FALSE_MEMCLEANUP
-
-                return key
+        key = self._patterns.match(line)
+        if key is None:
+            return None
 
-        return None
+        # return True so that we know we should terminate
+        if key.startswith('ASSERTIONFAILED'):
+            if opts.property.signedoverflow():
+                return result.RESULT_FALSE_OVERFLOW
+            elif opts.property.termination():
+                return result.RESULT_FALSE_TERMINATION
+            else:
+                return result.RESULT_FALSE_REACH
+        elif key == 'EFREE' or key == 'EFREEALLOCA' or key=='EGLOBLFREE':
+            return result.RESULT_FALSE_FREE
+        elif key in ('EMEMERROR', 'EINVREALLOC', 'EROREALLOC'):
+            return result.RESULT_FALSE_DEREF
+        elif key == 'EMEMLEAK':
+            return result.RESULT_FALSE_MEMTRACK
+        elif key == 'EMEMCLEANUP':
+            return result.RESULT_FALSE_MEMCLEANUP
+
+        return key
 
     def determine_result(self, returncode, returnsignal, output, isTimeout):
         opts = self._options
@@ -441,6 +442,22 @@ class SymbioticTool(KleeBase):
         if 'EINITVALS' in found: # EINITVALS would break the validity of the found error
             return "{0}({1})".format(result.RESULT_UNKNOWN, " ".join(found))
 
+        for f in found:
+            # we found error that we sought for?
+            res = self._sought_error(f)
+            if res:
+                return res
+
+        return "{0} ({1})".format(result.RESULT_UNKNOWN, " ".join(found))
+
+    def _sought_error(self, f):
+        """
+        Return the result if \param f (a result of _parse_klee_output_line)
+        is an error that violates the checked property, otherwise None
+        """
+        opts = self._options
+        prop = opts.property
+
         FALSE_REACH = result.RESULT_FALSE_REACH
         FALSE_OVERFLOW = result.RESULT_FALSE_OVERFLOW
         FALSE_FREE = result.RESULT_FALSE_FREE
@@ -450,23 +467,32 @@ class SymbioticTool(KleeBase):
         FALSE_TERMINATION = result.RESULT_FALSE_TERMINATION
         FALSE_UNDEF = 'false(def-behavior)'
 
-        for f in found:
-            # we found error that we sought for?
-            if f == FALSE_REACH and prop.unreachcall():
-                return f
-            elif f == FALSE_REACH and prop.undefinedness():
-                return FALSE_UNDEF
-            elif f == FALSE_OVERFLOW and prop.signedoverflow():
-                return f
-            elif f in (FALSE_FREE, FALSE_DEREF, FALSE_MEMTRACK)\
-                and prop.memsafety():
-                return f
-            elif f == FALSE_MEMCLEANUP and\
-                (prop.memcleanup() or prop.memsafety() and not opts.sv_comp):
-                return f
-            elif f == FALSE_TERMINATION and prop.termination():
-                return f
-            elif f == FALSE_DEREF and prop.nullderef():
-                return f
+        if f == FALSE_REACH and prop.unreachcall():
+            return f
+        elif f == FALSE_REACH and prop.undefinedness():
+            return FALSE_UNDEF
+        elif f == FALSE_OVERFLOW and prop.signedoverflow():
+            return f
+        elif f in (FALSE_FREE, FALSE_DEREF, FALSE_MEMTRACK)\
+            and prop.memsafety():
+            return f
+        elif f == FALSE_MEMCLEANUP and\
+            (prop.memcleanup() or prop.memsafety() and not opts.sv_comp):
+            return f
+        elif f == FALSE_TERMINATION and prop.termination():
+            return f
+        elif f == FALSE_DEREF and prop.nullderef():
+            return f
+        return None
 
-        return "{0} ({1})".format(result.RESULT_UNKNOWN, " ".join(found))
+    def decisive_result(self, line):
+        opts = self._options
+        # only with -exit-on-error-type KLEE stops on the first error
+        # that we look for
+        if opts.test_comp or self.FullInstr or not opts.exit_on_error:
+            return None
+
+        fnd = self._parse_klee_output_line(str(line))
+        if fnd and fnd.startswith('false'):
+            return self._sought_error(fnd)
+        return None
@@ -49,6 +49,9 @@ class SymbioticTool(BaseTool, SymbioticBaseTool):
     def verifiers(self):
         prp = self._options.property
         if prp.unreachcall():
+            # the time slot of KLEE is tuned for 900s, it is scaled to the actual
+            # time limit and the time that KLEE does not use goes to slowbeast
+            # (unless running with --static-timeouts, see utils/budget.py)
             return ((KleeTool(self._options), None, 222),
                     (SlowbeastTool(self._options), ['-kind'], None),
                     # if slowbeast crashes, run KLEE w/o timeout
@@ -59,6 +62,16 @@ class SymbioticTool(BaseTool, SymbioticBaseTool):
                     )
         return ((KleeTool(self._options), None, None),)
 
+    def portfolio(self):
+        prp = self._options.property
+        if prp.unreachcall():
+            # when running concurrently, there is no need
+            # to interrupt KLEE in favour of slowbeast
+            return [(KleeTool(self._options), None, None),
+                    (SlowbeastTool(self._options), ['-kind'], None),
+                    (SlowbeastTool(self._options), ['-se-replay-errors'], None)]
+        return None
+
     def name(self):
         return 'svcomp'
 
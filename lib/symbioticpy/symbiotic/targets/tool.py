@@ -52,6 +52,25 @@ class SymbioticBaseTool(object):
         # pairs (tool, params, timeout)
         return ((self, None, None),)
 
+    def decisive_result(self, line):
+        """
+        Called with every line of the output of the tool while the tool
+        is running. Return the result if the line decides it (e.g., the tool
+        found an error and is going to exit), otherwise None.
+        The final result is still given by determine_result().
+        """
+        return None
+
+    def portfolio(self):
+        """
+        Return a list of verifiers (in the same format as verifiers())
+        that can run concurrently on the generated file, ordered
+        by their priority, or None if the verifiers of this tool
+        must run sequentially (the default). The verifiers run
+        each in its own working directory.
+        """
+        return None
+
    # we run these passes for every tool
    #def passes_after_compilation(self):
    #    """
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+
+"""
+Reducing the generated test-suite.
+
+The main KLEE and the side KLEEs of kleetester write their tests into
+one directory, so the suite contains tests with the same inputs and tests
+that cover nothing new. TestSuite removes the tests with the same inputs
+(by the hash of the inputs) and can minimize the suite: every test is
+replayed on the program compiled with -fsanitize-coverage=trace-pc-guard
+(the harness below records the covered edges) and only a greedy set
+cover of the edges is kept. The tests are removed only once the coverage
+of all tests is known, so an interrupted minimization removes nothing.
+"""
+
+import os
+import re
+import heapq
+from array import array
+from queue import Queue
+from concurrent.futures import ThreadPoolExecutor
+
+from symbiotic.utils import dbg
+from symbiotic.utils.process import ProcessRunner, runcmd
+from symbiotic.utils.watch import ProcessWatch
+from symbiotic.exceptions import SymbioticException
+from symbiotic.testsuits.testcases import testcase_digest
+
+# the values of the inputs of a test case
+_input_value_re = re.compile(rb'<input\b[^>]*>([^<]*)</input>')
+
+# The harness for replaying tests. The values of inputs are read from
+# the file 'test.input' (one per line) and the indices of covered edges
+# are appended to 'test.cov' once they are covered, so the coverage
+# is recorded also if the program crashes or is killed. The functions
+# are weak, so that the definitions from the program take precedence.
+_HARNESS = r'''
+#include <stdio.h>
+#include <stdlib.h>
+#include <stdint.h>
+#include <fcntl.h>
+#include <unistd.h>
+
+static FILE *__symbiotic_input;
+static int __symbiotic_cov = -1;
+
+void __sanitizer_cov_trace_pc_guard_init(uint32_t *start, uint32_t *stop) {
+    static uint32_t n;
+    if (start == stop || *start)
+        return;
+    for (uint32_t *g = start; g < stop; ++g)
+        *g = ++n;
+    if (__symbiotic_cov < 0)
+        __symbiotic_cov = open("test.cov", O_WRONLY | O_CREAT | O_TRUNC, 0644);
+}
+
+void __sanitizer_cov_trace_pc_guard(uint32_t *guard) {
+    if (!*guard)
+        return;
+    write(__symbiotic_cov, guard, sizeof(*guard));
+    *guard = 0;
+}
+
+static int __symbiotic_next(char *buf, int size) {
+    if (!__symbiotic_input)
+        __symbiotic_input = fopen("test.input", "r");
+    return __symbiotic_input && fgets(buf, size, __symbiotic_input);
+}
+
+static long long __symbiotic_int(void) {
+    char buf[128];
+    if (!__symbiotic_next(buf, sizeof(buf)))
+        return 0;
+    if (buf[0] == '-')
+        return strtoll(buf, NULL, 0);
+    return (long long)strtoull(buf, NULL, 0);
+}
+
+static double __symbiotic_float(void) {
+    char buf[128];
+    if (!__symbiotic_next(buf, sizeof(buf)))
+        return 0;
+    return strtod(buf, NULL);
+}
+
+#define NONDET(type, name) \
+    __attribute__((weak)) type __VERIFIER_nondet_##name(void) \
+    { return (type)__symbiotic_int(); }
+
+NONDET(_Bool, bool)
+NONDET(char, char)
+NONDET(unsigned char, uchar)
+NONDET(short, short)
+NONDET(unsigned short, ushort)
+NONDET(int, int)
+NONDET(unsigned int, uint)
+NONDET(long, long)
+NONDET(unsigned long, ulong)
+NONDET(long long, longlong)
+NONDET(unsigned long long, ulonglong)
+NONDET(unsigned char, u8)
+NONDET(unsigned short, u16)
+NONDET(unsigned int, u32)
+NONDET(unsigned int, unsigned)
+NONDET(unsigned long, size_t)
+NONDET(long, loff_t)
+NONDET(void *, pointer)
+
+__attribute__((weak)) float __VERIFIER_nondet_float(void)
+{ return (float)__symbiotic_float(); }
+__attribute__((weak)) double __VERIFIER_nondet_double(void)
+{ return __symbiotic_float(); }
+
+__attribute__((weak)) void __VERIFIER_assume(int cond)
+{ if (!cond) exit(0); }
+__attribute__((weak)) void __VERIFIER_error(void)
+{ exit(1); }
+'''
+
+
+class TestCase(object):
+    def __init__(self, path, data):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.digest = testcase_digest(data)
+        self.inputs = [v.strip() for v in _input_value_re.findall(data)]
+
+
+def _order(name):
+    # the tests of the main KLEE (test000001.xml) go before the tests
+    # of the side KLEEs (test000001.3.xml)
+    return (name.count('.'), name)
+
+
+class TestSuite(object):
+    """ The test cases (not metadata.xml) in the directory \\param outdir """
+
+    def __init__(self, outdir):
+        self.outdir = outdir
+        self.testcases = []
+
+        try:
+            names = sorted(os.listdir(outdir), key=_order)
+        except OSError as e:
+            dbg('Cannot read the test-suite: {0}'.format(str(e)))
+            names = []
+
+        for name in names:
+            if not name.endswith('.xml') or name == 'metadata.xml':
+                continue
+            path = os.path.join(outdir, name)
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+            except OSError as e:
+                dbg('Cannot read {0}: {1}'.format(path, str(e)))
+                continue
+            if b'<testcase' in data:
+                self.testcases.append(TestCase(path, data))
+
+    def _remove(self, keep):
+        """ Remove the test cases that are not in \\param keep """
+        removed = 0
+        for testcase in self.testcases:
+            if testcase in keep:
+                continue
+            try:
+                os.unlink(testcase.path)
+                removed += 1
+            except OSError as e:
+                dbg('Cannot remove {0}: {1}'.format(testcase.path, str(e)))
+        self.testcases = [t for t in self.testcases if t in keep]
+        return removed
+
+    def remove_duplicates(self):
+        """ Remove the test cases with the same inputs, return their number """
+        first = {}
+        for testcase in self.testcases:
+            first.setdefault(testcase.digest, testcase)
+        return self._remove(set(first.values()))
+
+    def minimize(self, replay, jobs=1):
+        """
+        Keep only a subset of test cases that covers the same edges.
+        \\param replay is a CoverageReplay. Return the number of removed tests.
+        """
+        jobs = max(jobs, 1)
+        # every running replay has its own directory
+        slots = Queue()
+        for slot in range(jobs):
+            slots.put(slot)
+
+        def coverage(testcase):
+            slot = slots.get()
+            try:
+                return replay.coverage(testcase, slot)
+            finally:
+                slots.put(slot)
+
+        with ThreadPoolExecutor(jobs) as pool:
+            covers = list(pool.map(coverage, self.testcases))
+
+        return self._remove(set(greedy_cover(self.testcases, covers)))
+
+
+def greedy_cover(items, covers):
+    """
+    Return a subset of \\param items (in their order) such that the union
+    of their \\param covers (the sets covered by the items) is the same
+    as for all items. Uses the lazy greedy algorithm: the gains of
+    the items can only decrease, so an item whose recomputed gain is still
+    the largest one in the queue is the best one.
+    """
+    uncovered = set()
+    for cover in covers:
+        uncovered |= cover
+
+    # (-gain, index) -- ties are broken by the order of items
+    queue = [(-len(cover), n) for n, cover in enumerate(covers) if cover]
+    heapq.heapify(queue)
+    chosen = []
+    while uncovered and queue:
+        _, n = heapq.heappop(queue)
+        gain = len(covers[n] & uncovered)
+        if gain == 0:
+            continue
+        if queue and gain < -queue[0][0]:
+            heapq.heappush(queue, (-gain, n))
+            continue
+        chosen.append(n)
+        uncovered -= covers[n]
+
+    return [items[n] for n in sorted(chosen)]
+
+
+class CoverageReplay(object):
+    """
+    The program from \\param sources compiled for replaying tests
+    in \\param workdir. Raises SymbioticException if it cannot be built.
+    """
+
+    def __init__(self, sources, workdir, cc=['clang'], flags=[], timeout=10):
+        self._workdir = workdir
+        self._timeout = timeout
+        os.makedirs(workdir, exist_ok=True)
+
+        harness = os.path.join(workdir, 'harness.c')
+        with open(harness, 'w') as f:
+            f.write(_HARNESS)
+
+        # the harness must not be instrumented, its callbacks
+        # would call themselves
+        harnessobj = os.path.join(workdir, 'harness.o')
+        runcmd(cc + flags + ['-c', harness, '-o', harnessobj],
+               ProcessWatch(None), 'Failed compiling the replay harness')
+        self.executable = os.path.join(workdir, 'replay')
+        runcmd(cc + flags + ['-D__inline=', '-w',
+                             '-fsanitize-coverage=trace-pc-guard'] +\
+               sources + [harnessobj, '-lm', '-o', self.executable],
+               ProcessWatch(None), 'Failed compiling the program for replaying tests')
+
+    def coverage(self, testcase, slot=0):
+        """
+        Replay \\param testcase (in the directory of the \\param slot)
+        and return the set of covered edges
+        """
+        cwd = os.path.join(self._workdir, str(slot))
+        os.makedirs(cwd, exist_ok=True)
+        with open(os.path.join(cwd, 'test.input'), 'wb') as f:
+            f.write(b''.join(v + b'\n' for v in testcase.inputs))
+        covfile = os.path.join(cwd, 'test.cov')
+        if os.path.exists(covfile):
+            os.unlink(covfile)
+
+        # the exit status does not matter, the test may reach an error
+        ProcessRunner().run([self.executable], ProcessWatch(), cwd=cwd,
+                            timeout=self._timeout)
+
+        edges = array('I')
+        try:
+            with open(covfile, 'rb') as f:
+                edges.frombytes(f.read())
+        except OSError:
+            pass
+        return set(edges)
+
+
+def reduce_testsuite(outdir, sources, workdir, opts, cc=['clang'], jobs=1):
+    """
+    Remove the duplicate tests from the test-suite in \\param outdir
+    and, for coverage properties, minimize it. Return the pair
+    (the number of tests, the number of removed tests).
+    """
+    suite = TestSuite(outdir)
+    total = len(suite.testcases)
+    removed = suite.remove_duplicates()
+    dbg('Removed {0} tests with duplicate inputs'.format(removed))
+
+    if opts.property.coverage() and len(suite.testcases) > 1:
+        flags = list(opts.CPPFLAGS)
+        if opts.is32bit:
+            flags.append('-m32')
+        try:
+            replay = CoverageReplay(sources, os.path.join(workdir, 'replay'),
+                                    cc, flags)
+        except SymbioticException as e:
+            dbg('Cannot minimize the test-suite: {0}'.format(str(e)))
+            return total, removed
+        removed += suite.minimize(replay, jobs)
+
+    return total, removed
@@ -1,6 +1,9 @@
 #!/usr/bin/env python3
 
+import os
 from os.path import basename
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
 from sys import version_info
 from hashlib import sha256 as hashfunc
 
@@ -10,20 +13,36 @@ if version_info < (3, 0):
 
 import re
 
+from symbiotic.utils.ktest import KTest, KTestError, print_object
+
 skip_repeating_lines = False
 include_objects = True
 only_objects_in_main = True
 trivial_witness = True
 
-no_lxml = False
-try:
-    from lxml import etree as ET
-except ImportError:
-    no_lxml = True
+_xml_backend = None
+
+
+def _xml():
+    """
+    Return the pair (ET, no_lxml) with the XML backend. It is imported
+    only once the first test case is written, the streaming writer
+    does not need it.
+    """
+    global _xml_backend
+    if _xml_backend is None:
+        try:
+            from lxml import etree as ET
+            _xml_backend = (ET, False)
+        except ImportError:
+            # if this fails, then we're screwed, so let the script die
+            from xml.etree import ElementTree as ET
+            _xml_backend = (ET, True)
+    return _xml_backend
+
 
-if no_lxml:
-    # if this fails, then we're screwed, so let the script die
-    from xml.etree import ElementTree as ET
+_XML_DECLARATION = """<?xml version="1.0" encoding="UTF-8" standalone="no"?>"""
+_DOCTYPE = """<!DOCTYPE testcase PUBLIC "+//IDN sosy-lab.org//DTD test-format testcase 1.0//EN" "https://sosy-lab.org/test-format/testcase-1.0.dtd">"""
 
 
 def get_hash(source):
@@ -36,100 +55,91 @@ def get_hash(source):
     return hsh.hexdigest()
 
 
-def get_repr(obj):
-    ret = []
-    assert len(obj[1]) > 0
+def split_name(name):
+    var = name.decode('utf-8').split(":")
+    if len(var) != 4:
+        return None, None, None
+    return var[0], var[1], var[2]
 
-    b = obj[1][0]
-    num = 1
-    for i in range(1, len(obj[1])):
-        if obj[1][i] != b:
-            ret.append((b, num))
-            b = obj[1][i]
-            num = 1
-        else:
-            num += 1
 
-    ret.append((b, num))
-    return ret
+# is this string a valid variable identificatior?
+_variable_re = re.compile("^[_a-zA-Z\$][_a-zA-Z\$0-9]*$")
 
 
-def print_object(obj):
-    rep = 'len {0} bytes, |'.format(len(obj[1]))
-    for part in get_repr(obj):
-        if version_info.major < 3:
-            value = ord(part[0])
-        else:
-            value = part[0]
+def _testcase_inputs(ktest, variable_re=_variable_re):
+    """
+    Yield the pairs (variable, value) for the inputs of the test case
+    from the opened KTest \param ktest
+    """
+    objects = ktest.objects
 
-        value = hex(value)
+    # the names of the objects, they are needed several times
+    names = {o.offset: split_name(o.name) for o in objects}
 
-        if part[1] > 1:
-            rep += '{0} times {1}|'.format(part[1], value)
-        else:
-            rep += '{0}|'.format(value)
-    print('{0} := {1}'.format(obj[0], rep))
+    if only_objects_in_main:
+        # filter the objects to those that are present in main
+        # and sort them according to line numbers
+        new_objects = []
+        for o in objects:
+            var_fun, var_name, var_line = names[o.offset]
+            if var_fun is None or var_fun != 'main':
+                continue
 
+            # for the trivial witnesses use only scalar variables, as for
+            # array accesses we would need a full path
+            if trivial_witness and not variable_re.match(var_name):
+                continue
 
-def split_name(name):
-    var = name.decode('utf-8').split(":")
-    if len(var) != 4:
-        return None, None, None
-    return var[0], var[1], var[2]
+            new_objects.append((var_line, o))
+
+        # sort the objects according to line numbers
+        new_objects.sort(key=lambda x: int(x[0]))
+        objects = [o for o in map(lambda x: x[1], new_objects)]
+
+    # If possible, dump the values as regular numbers (not byte per byte)
+    # XXX: the length may not be sufficient. We need to know also
+    # that it is really a primitive type (we can have a struct of size 8)
+    values = ktest.int_values(objects)
+    for o, val in zip(objects, values):
+        var_fun, var_name, var_line = names[o.offset]
+        if var_line is None:
+            continue
+
+        assert var_fun and var_name and var_line
+        if not only_objects_in_main and\
+           not variable_re.match(var_name):
+           # use only scalar variables now, as we do not support arrays
+           # or multiple assignments now
+            continue
+
+        if val is None:
+            if o.size == 0:
+                # there is no value to dump
+                continue
+            # dump this as bytes
+            # XXX: only the last byte is dumped now
+            val = o.data[-1]
+
+        yield var_name, val
 
 
 class TestCaseWriter(object):
     def __init__(self, source, covers_error):
+        ET, self._no_lxml = _xml()
+        self._ET = ET
         if covers_error:
             self._root = ET.Element('testcase', key = 'coverError')
         else:
             self._root = ET.Element('testcase')
 
-        # is this string a valid variable identificatior?
-        self._variable_re = re.compile("^[_a-zA-Z\$][_a-zA-Z\$0-9]*$")
+        self._variable_re = _variable_re
         # is this string a valid variable identificatior or array access?
         # XXX: this is not supported now
         self._variable_index_re = re.compile(
             "^[_a-zA-Z\$][_a-zA-Z\$0-9]*(\[.*\])?$")
 
-    def _parseKtest(self, pathFile):
-        # this code is taken from ktest-tool from KLEE
-        # (but modified)
-        from struct import unpack
-
-        f = open(pathFile, 'rb')
-
-        hdr = f.read(5)
-        if len(hdr) != 5 or (hdr != b'KTEST' and hdr != b"BOUT\n"):
-            print('unrecognized file')
-            sys.exit(1)
-        version, = unpack('>i', f.read(4))
-        if version > 3:
-            print('unrecognized version')
-            sys.exit(1)
-        # skip args
-        numArgs, = unpack('>i', f.read(4))
-        for i in range(numArgs):
-            size, = unpack('>i', f.read(4))
-            f.read(size)
-
-        if version >= 2:
-            unpack('>i', f.read(4))
-            unpack('>i', f.read(4))
-
-        numObjects, = unpack('>i', f.read(4))
-        objects = []
-        for i in range(numObjects):
-            size, = unpack('>i', f.read(4))
-            name = f.read(size)
-            size, = unpack('>i', f.read(4))
-            bytes = f.read(size)
-            objects.append((name, bytes))
-
-        f.close()
-        return objects
-
     def _newNodeEdge(self, last_id, line=None, originfile=None):
+        ET = self._ET
         # create new node
         node = ET.SubElement(self._graph, 'node', id=str(last_id))
 
@@ -145,9 +155,11 @@ class TestCaseWriter(object):
         return node, edge
 
     def _dumpObjects(self, ktestfile, originfile):
-        from struct import unpack
+        with KTest(ktestfile) as ktest:
+            return self._dumpKTest(ktest)
 
-        objects = self._parseKtest(ktestfile)
+    def _dumpKTest(self, ktest):
+        objects = ktest.objects
        #print(' -- ---- --')
        #print('Symbolic objects:')
        #for o in objects:
@@ -158,64 +170,8 @@ class TestCaseWriter(object):
             return 1
 
         last_id = 1
-
-        if only_objects_in_main:
-            # filter the objects to those that are present in main
-            # and sort them according to line numbers
-            new_objects = []
-            for o in objects:
-                var_fun, var_name, var_line = split_name(o[0])
-                if var_fun is None or var_fun != 'main':
-                    continue
-
-                # for the trivial witnesses use only scalar variables, as for
-                # array accesses we would need a full path
-                if trivial_witness and not self._variable_re.match(var_name):
-                    continue
-
-                new_objects.append((var_line, o))
-
-            # sort the objects according to line numbers
-            new_objects.sort(key=lambda x: int(x[0]))
-            objects = [o for o in map(lambda x: x[1], new_objects)]
-
-        for o in objects:
-            var_fun, var_name, var_line = split_name(o[0])
-            if var_line is None:
-                continue
-
-            assert var_fun and var_name and var_line
-            if not only_objects_in_main and\
-               not self._variable_re.match(var_name):
-               # use only scalar variables now, as we do not support arrays
-               # or multiple assignments now
-                continue
-
-            ass_list = []
-            bytes_num = len(o[1])
-            # If possible, dump the value as a regular number (not byte per byte)
-            # XXX: the length may not be sufficient. We need to know also
-            # that it is really a primitive type (we can have a struct of size 8)
-            if bytes_num == 8:
-                val = unpack('l', o[1])[0]
-            elif bytes_num == 4:
-                val = unpack('i', o[1])[0]
-            elif bytes_num == 2:
-                # unpack needs a buffer of size 4 for an integer
-                val = unpack('h', o[1])[0]
-            elif bytes_num == 1:
-                # unpack needs a buffer of size 4 for an integer
-                val = unpack('b', o[1])[0]
-            else:
-                # dump this as bytes
-                for i in range(0, bytes_num):
-                    if version_info.major < 3:
-                        val = ord(o[1][i])
-                    else:
-                        val = o[1][i]
-
-            ET.SubElement(self._root, 'input', variable = var_name).text = str(val)
-
+        for var_name, val in _testcase_inputs(ktest, self._variable_re):
+            self._ET.SubElement(self._root, 'input', variable = var_name).text = str(val)
             last_id += 1
 
         return last_id
@@ -232,20 +188,256 @@ class TestCaseWriter(object):
         last_id = self._dumpObjects('{0}ktest'.format(pathFile[:-4]), filename)
 
     def dump(self):
-        if no_lxml:
-            print(ET.tostring(self._root))
+        if self._no_lxml:
+            print(self._ET.tostring(self._root))
         else:
-            print(ET.tostring(self._root, pretty_print=True))
+            print(self._ET.tostring(self._root, pretty_print=True))
 
     def write(self, to):
-        et = ET.ElementTree(self._root)
-        doctype = """<!DOCTYPE testcase PUBLIC "+//IDN sosy-lab.org//DTD test-format testcase 1.0//EN" "https://sosy-lab.org/test-format/testcase-1.0.dtd">"""
-        if no_lxml:
+        et = self._ET.ElementTree(self._root)
+        doctype = _DOCTYPE
+        if self._no_lxml:
            with open(to, 'wb') as f:
-                f.write("""<?xml version="1.0" encoding="UTF-8" standalone="no"?>""".encode('utf8'))
+                f.write(_XML_DECLARATION.encode('utf8'))
                 f.write(doctype.encode('utf8'))
                 et.write(f, encoding='UTF-8', method="xml",
                      xml_declaration=False)
         else:
             et.write(to, encoding='UTF-8', method="xml", doctype = doctype,
                      pretty_print=True, xml_declaration=True)
+
+
+##
+# Streaming writer of test cases
+#
+# The test cases are written directly from the memory-mapped .ktest
+# files using precomputed templates (the names of the variables are
+# identifiers and the values are integers, so nothing needs escaping),
+# without building any XML tree. Only one test case is in memory at once
+# in every process and the conversions can run in a pool of processes.
+##
+
+_HEADER = '{0}\n{1}\n<testcase>\n'.format(_XML_DECLARATION, _DOCTYPE)
+_HEADER_COVER_ERROR = '{0}\n{1}\n<testcase key="coverError">\n'\
+                      .format(_XML_DECLARATION, _DOCTYPE)
+_INPUT = '  <input variable="{0}">{1}</input>\n'
+_FOOTER = '</testcase>\n'
+
+
+# the inputs of a test case in the XML
+_input_re = re.compile(rb'<input\b[^>]*>[^<]*</input>')
+
+
+def testcase_digest(data):
+    """
+    The hash of the inputs of the test case with XML \param data (bytes).
+    Test cases with the same inputs have the same hash, whatever tool
+    wrote them.
+    """
+    hsh = hashfunc()
+    for inp in _input_re.findall(data):
+        hsh.update(inp)
+        hsh.update(b'\n')
+    return hsh.hexdigest()
+
+
+def testcase_name(ktestfile):
+    """ The name of the test case for \\param ktestfile (test000001.xml) """
+    name = basename(ktestfile)
+    if name.endswith('.ktest'):
+        name = name[:-6]
+    return '{0}.xml'.format(name)
+
+
+def write_testcase(ktestfile, to, covers_error=False, replace=True):
+    """
+    Write the test case for the .ktest file \\param ktestfile
+    into the file \\param to. Raises KTestError or OSError.
+    If \\param replace is False, an existing file is kept (also if
+    someone else creates it meanwhile) and False is returned.
+    """
+    parts = [_HEADER_COVER_ERROR if covers_error else _HEADER]
+    with KTest(ktestfile) as ktest:
+        if include_objects:
+            parts.extend(_INPUT.format(var_name, val)
+                         for var_name, val in _testcase_inputs(ktest))
+    parts.append(_FOOTER)
+    data = ''.join(parts).encode('utf-8')
+
+    if replace:
+        with open(to, 'wb') as f:
+            f.write(data)
+        return True
+
+    # write the file aside and link it, so that the test case appears
+    # only complete and the linking fails if the file exists
+    tmp = os.path.join(os.path.dirname(to),
+                       '.{0}.{1}.tmp'.format(basename(to), os.getpid()))
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    try:
+        os.link(tmp, to)
+        return True
+    except FileExistsError:
+        return False
+    finally:
+        os.unlink(tmp)
+
+
+def _write_testcases(ktestfiles, outdir, covers_error, replace):
+    """
+    Write the test cases for \\param ktestfiles into \\param outdir.
+    Return the lists of converted files and of pairs (file, error)
+    for the files that could not be converted. The files whose test case
+    existed (and \\param replace is False) are in neither list.
+    This runs in the workers.
+    """
+    written, failed = [], []
+    for ktestfile in ktestfiles:
+        try:
+            if write_testcase(ktestfile,
+                              os.path.join(outdir, testcase_name(ktestfile)),
+                              covers_error, replace):
+                written.append(ktestfile)
+        except (KTestError, OSError) as e:
+            failed.append((ktestfile, str(e)))
+    return written, failed
+
+
+class TestSuiteWriter(object):
+    """
+    Convert .ktest files to test cases in a directory while KLEE
+    is generating them (TestSuiteWatcher feeds it with the new files):
+
+      writer = TestSuiteWriter(outdir, jobs=4)
+      while klee_runs:
+          writer.add(ktestfile)
+          ...
+          writer.submit()
+      writer.add_directory(kleedir)
+      writer.finish()
+
+    The files are converted in chunks of at most \\param chunk files,
+    by \\param jobs worker processes (or in this process if jobs is 1).
+    At most two chunks per worker are in flight, so the memory does not
+    grow with the number of tests. A file that cannot be converted is tried
+    again if it is added again and the last error for it is kept
+    in self.failed until it is converted. With \\param replace False,
+    the test cases that exist (e.g., written by KLEE) are kept.
+    \\param done is called with the list of converted .ktest files
+    (in the thread that uses the writer).
+    """
+
+    def __init__(self, outdir, covers_error=False, jobs=1, chunk=64,
+                 replace=True, done=None):
+        self._outdir = outdir
+        self._covers_error = covers_error
+        self._replace = replace
+        self._done_callback = done
+        self._jobs = max(jobs, 1)
+        self._chunk = max(chunk, 1)
+        self._pool = None
+        self._futures = []
+        self._pending = []
+        self._seen = set()
+        self.written = 0
+        self.failed = {}
+
+        os.makedirs(outdir, exist_ok=True)
+
+    def add(self, ktestfile):
+        """ Convert \\param ktestfile unless it was already converted """
+        if ktestfile in self._seen:
+            return
+        self._seen.add(ktestfile)
+        self._pending.append(ktestfile)
+        if len(self._pending) >= self._chunk:
+            self.submit()
+
+    def add_directory(self, kleedir):
+        """
+        Convert the .ktest files from \\param kleedir that were not
+        converted yet. Return the number of new files.
+        """
+        try:
+            names = sorted(e.name for e in os.scandir(kleedir)
+                           if e.name.endswith('.ktest'))
+        except OSError:
+            # KLEE has not created the directory yet
+            return 0
+
+        num = len(self._seen)
+        for name in names:
+            self.add(os.path.join(kleedir, name))
+        self.submit()
+        return len(self._seen) - num
+
+    def submit(self):
+        """
+        Start converting the files that were added
+        and collect the finished conversions
+        """
+        if not self._pending:
+            self._collect()
+            return
+        chunk, self._pending = self._pending, []
+
+        if self._jobs == 1:
+            self._done(_write_testcases(chunk, self._outdir,
+                                        self._covers_error, self._replace))
+            return
+
+        if self._pool is None:
+            # the pool is created from the thread of TestSuiteWatcher
+            # while other threads (of the runners) may hold locks, so do
+            # not fork this process, fork the workers from a fresh server
+            context = get_context('forkserver')
+            context.set_forkserver_preload([__name__])
+            self._pool = ProcessPoolExecutor(self._jobs, mp_context=context)
+        # do not queue more chunks than the workers can take
+        while len(self._futures) >= 2 * self._jobs:
+            self._done(self._futures.pop(0).result())
+        self._futures.append(self._pool.submit(_write_testcases, chunk,
+                                               self._outdir, self._covers_error,
+                                               self._replace))
+        self._collect()
+
+    def _collect(self, block=False):
+        running = []
+        for future in self._futures:
+            if block or future.done():
+                self._done(future.result())
+            else:
+                running.append(future)
+        self._futures = running
+
+    def _done(self, result):
+        written, failed = result
+        self.written += len(written)
+        if written and self._done_callback:
+            self._done_callback(written)
+        for ktestfile in written:
+            self.failed.pop(ktestfile, None)
+        for ktestfile, msg in failed:
+            # try it again the next time
+            self._seen.discard(ktestfile)
+            self.failed[ktestfile] = msg
+
+    def finish(self):
+        """ Wait until all the added files are converted, return their number """
+        try:
+            self.submit()
+            self._collect(block=True)
+        finally:
+            if self._pool:
+                self._pool.shutdown()
+                self._pool = None
+        return self.written
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.finish()
+        return False
+
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+
+"""
+Watching the directory with the test-suite while the tools generate it.
+
+The tools (KLEE and the side KLEEs of kleetester) write the test cases
+into the directory during the run. TestSuiteWatcher picks up every test
+case once it is written and removes the test cases whose inputs are
+the same as the inputs of a test case that was emitted before
+(the side KLEEs generate many of them). Every new .ktest file for which
+there is no test case is converted by a pool of workers (TestSuiteWriter)
+as soon as it is written. A test case that exists is never overwritten,
+so the test cases written by the tool take precedence. What is left
+is converted when the watching stops, which happens also when we hit
+the time limit, so the test-suite is complete at any time we finish.
+
+DirectoryWatcher uses inotify if it is available. Otherwise it polls
+the directory and reports a file once its size and modification time
+did not change between two polls.
+"""
+
+import os
+import ctypes
+import ctypes.util
+from struct import Struct
+from select import select
+from threading import Thread, Event
+
+from symbiotic.utils import dbg
+from symbiotic.testsuits.testcases import testcase_name, testcase_digest,\
+                                          TestSuiteWriter
+
+# from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+# struct inotify_event without the name
+_event = Struct('iIII')
+
+
+class _Inotify(object):
+    """ Minimal wrapper of inotify, raises OSError if it is not available """
+
+    def __init__(self, path):
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            init, add_watch = libc.inotify_init1, libc.inotify_add_watch
+        except (OSError, AttributeError):
+            raise OSError('inotify is not available')
+
+        self.fd = init(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        if add_watch(self.fd, os.fsencode(path), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+            errno = ctypes.get_errno()
+            self.close()
+            raise OSError(errno, os.strerror(errno))
+
+    def read(self, timeout):
+        """
+        Wait at most \\param timeout seconds for events and return the list
+        of names of the written files, or None if some events were lost
+        """
+        if not select([self.fd], [], [], timeout)[0]:
+            return []
+
+        names = []
+        while True:
+            try:
+                buf = os.read(self.fd, 1 << 16)
+            except BlockingIOError:
+                return names
+            pos = 0
+            while pos < len(buf):
+                _, mask, _, length = _event.unpack_from(buf, pos)
+                pos += _event.size
+                if mask & (IN_Q_OVERFLOW | IN_IGNORED):
+                    names = None
+                elif names is not None:
+                    names.append(os.fsdecode(buf[pos:pos + length].rstrip(b'\0')))
+                pos += length
+
+    def close(self):
+        os.close(self.fd)
+
+
+class DirectoryWatcher(object):
+    """
+    Report the files that are written into a directory.
+    A file may be reported more times if it is written more times.
+    """
+
+    def __init__(self, path, poll_interval=0.5):
+        self.path = path
+        self._interval = poll_interval
+        self._inotify = None
+        self._polling = False
+        # for polling: name -> (size, mtime) from the last poll
+        self._last = {}
+        self._reported = {}
+
+    def _scan(self):
+        try:
+            with os.scandir(self.path) as it:
+                return {e.name: (e.stat().st_size, e.stat().st_mtime_ns)
+                        for e in it if e.is_file()}
+        except OSError:
+            return {}
+
+    def _start(self):
+        """ Start watching once the directory exists, return the files in it """
+        if not os.path.isdir(self.path):
+            return []
+        try:
+            self._inotify = _Inotify(self.path)
+            dbg('Watching {0} using inotify'.format(self.path))
+        except OSError as e:
+            dbg('Polling {0} ({1})'.format(self.path, str(e)))
+            self._polling = True
+            return []
+        # the files written before we started watching
+        return list(self._scan())
+
+    def _poll(self):
+        current = self._scan()
+        names = [name for name, stat in current.items()
+                 if self._last.get(name) == stat and\
+                    self._reported.get(name) != stat]
+        for name in names:
+            self._reported[name] = current[name]
+        self._last = current
+        return names
+
+    def changes(self, timeout=None):
+        """
+        Wait at most \\param timeout seconds (the poll interval by default)
+        and return the list of names of the files that were written
+        """
+        if timeout is None:
+            timeout = self._interval
+        if self._inotify:
+            names = self._inotify.read(timeout)
+            if names is None:
+                dbg('Lost events on {0}, rescanning it'.format(self.path))
+                return list(self._scan())
+            return names
+
+        if not self._polling:
+            names = self._start()
+            if self._inotify or self._polling:
+                return names
+
+        # polling or waiting for the directory
+        Event().wait(timeout)
+        return self._poll() if self._polling else []
+
+    def flush(self):
+        """ Return the names of the files that were not reported yet """
+        if self._inotify:
+            # we do not know which files are being written now,
+            # report all of them
+            self._inotify.read(0)
+            return list(self._scan())
+        current = self._scan()
+        names = [name for name, stat in current.items()
+                 if self._reported.get(name) != stat]
+        self._reported.update(current)
+        return names
+
+    def close(self):
+        if self._inotify:
+            self._inotify.close()
+            self._inotify = None
+
+
+class TestSuiteWatcher(object):
+    """
+    Deduplicate the test cases in \\param outdir while they are generated
+    and convert the .ktest files without test cases by \\param jobs workers:
+
+      watcher = TestSuiteWatcher(outdir)
+      watcher.start()
+      ... run the tools ...
+      watcher.stop()
+    """
+
+    def __init__(self, outdir, jobs=1):
+        self._outdir = outdir
+        self._watcher = DirectoryWatcher(outdir)
+        self._stopped = Event()
+        self._thread = None
+        # digest of inputs -> the test case with these inputs
+        self._digests = {}
+        self._emitted = set()
+        # the test cases that were written (with duplicates), without suffix
+        self._testcases = set()
+        self._writer = TestSuiteWriter(outdir, jobs=jobs, replace=False,
+                                       done=self._converted)
+        self.duplicates = 0
+        self.converted = 0
+
+    def _testcase(self, name):
+        if name in self._emitted:
+            # the first test case with its inputs, it was already processed
+            return
+        path = os.path.join(self._outdir, name)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            # removed meanwhile
+            return
+        if b'<testcase' not in data:
+            # not a test case (e.g., metadata.xml)
+            return
+        if b'</testcase>' not in data:
+            # not written completely, we get it again once it is
+            return
+
+        self._testcases.add(name[:-4])
+        digest = testcase_digest(data)
+        first = self._digests.setdefault(digest, name)
+        if first == name:
+            self._emitted.add(name)
+            return
+
+        dbg('{0} has the same inputs as {1}, removing it'.format(name, first))
+        try:
+            os.unlink(path)
+            self.duplicates += 1
+        except OSError:
+            pass
+
+    def _handle(self, names):
+        for name in names:
+            if name.endswith('.xml'):
+                self._testcase(name)
+            elif name.endswith('.ktest') and name[:-6] not in self._testcases:
+                self._writer.add(os.path.join(self._outdir, name))
+
+    def _converted(self, ktestfiles):
+        self.converted += len(ktestfiles)
+        for ktestfile in ktestfiles:
+            self._testcase(testcase_name(ktestfile))
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._handle(self._watcher.changes())
+            self._writer.submit()
+
+    def start(self):
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """ Stop watching and process what was written meanwhile """
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self._handle(self._watcher.flush())
+        self._watcher.close()
+        self._writer.finish()
+        dbg('Test-suite: removed {0} duplicate(s), converted {1} test(s)'\
+            .format(self.duplicates, self.converted))
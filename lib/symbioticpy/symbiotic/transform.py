@@ -9,9 +9,15 @@ from . options import SymbioticOptions
 from . utils import dbg, print_elapsed_time, restart_counting_time
 from . utils.process import ProcessRunner, runcmd
 from . utils.watch import ProcessWatch, DbgWatch
-from . utils.utils import print_stdout, print_stderr, process_grep
+from . utils.bitcode import get_symbols, get_instructions_count, BitcodeError
+from . utils.telemetry import Stage
+from . utils.budget import slicer_timeout, instrumentation_timeout
+from . utils.utils import print_stdout, print_stderr, process_grep, available_cpus
 from . exceptions import SymbioticException
-from shutil import move
+from shutil import move, copyfile
+from signal import signal, SIGTERM
+from threading import Lock
+from time import time
 
 class PrepareWatch(ProcessWatch):
     def __init__(self, lines=100):
@@ -92,7 +98,8 @@ class UnsuppWatch(ProcessWatch):
     def parse(self, line):
         uline = line.decode('utf-8')
         dbg(uline, domain='prepare', print_nl=False)
-        self._ok = not UnsuppWatch.unsupported_call.match(uline)
+        if UnsuppWatch.unsupported_call.match(uline):
+            self._ok = False
 
 def get_optlist_before(optlevel):
     from . optimizations import optimizations
@@ -126,6 +133,59 @@ def get_optlist_after(optlevel):
 
     return lst
 
+def _prepare_unsliced_worker(cc, workdir, conn):
+    """
+    Prepare the unsliced file in the directory \param workdir and send
+    the path to it to \param conn. This runs in a process forked
+    from the main process, so that it does not interfere with
+    the state of the main process (the current file, options, ...).
+    """
+    def terminate(signum, frame):
+        # unwind the stack so that the running tools are killed
+        sys.exit(1)
+    signal(SIGTERM, terminate)
+
+    # the messages of the preparation would be mixed
+    # with the messages of the main process
+    sys.stdout.flush()
+    sys.stderr.flush()
+    fd = os.open(os.path.join(workdir, 'output.log'),
+                 os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    os.dup2(fd, 1)
+    os.dup2(fd, 2)
+    os.close(fd)
+    os.chdir(workdir)
+
+    llvmfile = None
+    try:
+        llvmfile = cc._prepare_unsliced_file()
+    except SymbioticException as e:
+        print_stderr('Preparing the unsliced file failed: {0}'.format(str(e)))
+    conn.send(llvmfile)
+    conn.close()
+
+
+def _compiled_names(sources, reserved=[]):
+    """
+    Return the names of the bitcode files for the \param sources.
+    The names are derived from the names of the sources and made unique
+    (sources from different directories may have the same name).
+    The names in \param reserved are not used.
+    """
+    used = set(reserved)
+    names = []
+    for source in sources:
+        stem = os.path.splitext(os.path.basename(source))[0]
+        name = '{0}.bc'.format(stem)
+        n = 1
+        while name in used:
+            name = '{0}-{1}.bc'.format(stem, n)
+            n += 1
+        used.add(name)
+        names.append(name)
+    return names
+
+
 class SymbioticCC(object):
     """
     Instance of symbiotic compiler tool.
@@ -135,8 +195,13 @@ class SymbioticCC(object):
     def __init__(self, src, tool, opts=None, env=None):
         # source file
         self.sources = src
+        # opt passes that were requested but not run yet,
+        # see run_opt() and the curfile property
+        self._pending_passes = []
+        # are there optimizations among the pending passes?
+        self._pending_optimizations = False
         # source compiled to llvm bitecode
-        self.curfile = None
+        self._curfile = None
         # environment
         self.env = env
 
@@ -154,6 +219,40 @@ class SymbioticCC(object):
         # optimization renames in used LLVM release
         self._opt_renames = {}
 
+        # index of precompiled models (False if not loaded yet)
+        self._model_index = False
+
+        # the unsliced file prepared for verification
+        # (see prepare_unsliced_file())
+        self._unsliced_file = None
+        # the process that prepares the unsliced file in the background
+        # and the connection on which it sends the result
+        self._unsliced_job = None
+        self._unsliced_lock = Lock()
+
+        # cache of the intermediate bitcode files (if enabled)
+        self._cache = None
+        if self.options.cache_dir:
+            from . utils.cache import BitcodeCache
+            self._cache = BitcodeCache(self.options.cache_dir,
+                                       self._cache_salt())
+
+    @property
+    def curfile(self):
+        """
+        The current bitcode file. Reading the attribute
+        runs the pending opt passes, so that the returned
+        file is always up-to-date.
+        """
+        self._flush_passes()
+        return self._curfile
+
+    @curfile.setter
+    def curfile(self, value):
+        # the pending passes belong to the old file
+        self._flush_passes()
+        self._curfile = value
+
     def _get_cc(self):
         if hasattr(self._tool, 'cc'):
             return self._tool.cc()
@@ -197,15 +296,37 @@ class SymbioticCC(object):
         return runcmd(cmd, DbgWatch('all'),
                       "Failed running command: {0}".format(" ".join(cmd)))
 
-    def _compile_to_llvm(self, source, output=None, with_g=True, opts=[]):
+    def _cache_salt(self):
+        from . options import get_versions
+        return repr((get_versions(), self._tool.llvm_version()))
+
+    def _cache_fetch(self, stage, cmd, inputs, output):
         """
-        Compile given source to LLVM bitecode
+        Try getting the output of the stage from the cache.
+        Return a pair (hit, key) where hit is True if the output
+        has been fetched from the cache and key is the key under which
+        the output should be stored after running the stage.
+        """
+        if self._cache is None:
+            return False, None
+
+        key = self._cache.key(stage, cmd, inputs, output)
+        return self._cache.fetch(key, output), key
+
+    def _cache_store(self, key, output):
+        if self._cache is not None:
+            self._cache.store(key, output)
+
+    def _compile_cmd(self, source, output, with_g=True, opts=[], preprocess=False):
+        """
+        Compose the command that compiles given source to LLVM bitcode
+        (or that only preprocesses the source if \param preprocess is True)
         """
 
         # __inline attribute is buggy in clang, remove it using -D__inline
-        cmd = self._get_cc() + ['-c', '-emit-llvm',
-                                #'-include', 'symbiotic.h',
-                                '-D__inline='] + opts
+        cmd = self._get_cc() + (['-E'] if preprocess else ['-c', '-emit-llvm']) +\
+              [#'-include', 'symbiotic.h',
+               '-D__inline='] + opts
 
         if with_g:
             cmd.append('-g')
@@ -222,34 +343,103 @@ class SymbioticCC(object):
             # make the bitcode better readable if we generate the .ll files
             cmd.append("-fno-discard-value-names")
 
-        cmd.append('-o')
+        return cmd + ['-o', output, source]
+
+    def _compile_cache_key(self, source, output, with_g, opts, cmd):
+        """
+        Get the key of the compiled \param source in the cache. The key
+        is derived from the preprocessed source and the compilation flags,
+        so that a change in any included header is taken into account.
+        Return None if the source cannot be preprocessed.
+        """
+        preprocessed = '{0}.i'.format(output)
+        ppcmd = self._compile_cmd(source, preprocessed, with_g, opts, preprocess=True)
+        try:
+            # errors are reported by the compilation itself
+            if ProcessRunner().run(ppcmd, ProcessWatch()) != 0:
+                return None
+            return self._cache.key('compile', cmd, [preprocessed], output)
+        finally:
+            if os.path.isfile(preprocessed):
+                os.unlink(preprocessed)
+
+    def _compile_to_llvm(self, source, output=None, with_g=True, opts=[],
+                         runner=None):
+        """
+        Compile given source to LLVM bitecode
+        (by \param runner if it is given)
+        """
+
         if output is None:
             basename = os.path.basename(source)
             llvmfile = '{0}.bc'.format(basename[:basename.rfind('.')])
         else:
             llvmfile = output
-        cmd.append(llvmfile)
-        cmd.append(source)
-
-        runcmd(cmd, CompileWatch(),
-               "Compiling source '{0}' failed".format(source))
+        cmd = self._compile_cmd(source, llvmfile, with_g, opts)
+
+        with Stage('compile', [source]) as stage:
+            stage.output = llvmfile
+            key = None
+            if self._cache is not None:
+                key = self._compile_cache_key(source, llvmfile, with_g, opts, cmd)
+                if self._cache.fetch(key, llvmfile):
+                    stage.info['cached'] = True
+                    return llvmfile
+
+            status = runcmd(cmd, CompileWatch(),
+                            "Compiling source '{0}' failed".format(source),
+                            runner)
+            stage.add_usage(status.usage)
+            self._cache_store(key, llvmfile)
 
         return llvmfile
 
     def run_opt(self, passes):
+        """
+        Schedule running the given opt passes on the current file.
+        The passes are not run immediately, they are queued and all
+        the queued passes are run in a single opt process once the
+        bitcode is needed (i.e., when curfile is accessed).
+        """
         if not passes:
             return
 
+        self._pending_passes += passes
+
+    def _flush_passes(self):
+        """ Run the queued opt passes """
+        if not self._pending_passes:
+            return
+
+        passes = self._pending_passes
+        optimizations = self._pending_optimizations
+        self._pending_passes = []
+        self._pending_optimizations = False
+
+        # do not use restart_counting_time(), the passes may be run
+        # in the middle of a stage that measures its own time
+        start = time()
         self._run_opt(passes)
+        if optimizations:
+            print_stdout('INFO: Optimizations time: {0}'.format(time() - start),
+                         color='WHITE')
 
     def _run_opt(self, passes):
-        output = '{0}-pr.bc'.format(self.curfile[:self.curfile.rfind('.')])
+        curfile = self._curfile
+        output = '{0}-pr.bc'.format(curfile[:curfile.rfind('.')])
         cmd = ['opt', '-load', 'LLVMsbt.so',
-               self.curfile, '-o', output] + passes
+               curfile, '-o', output] + passes
         self._disable_new_pm(cmd)
 
-        runcmd(cmd, PrepareWatch(), 'Running opt failed')
-        self.curfile = output
+        with Stage('opt', [curfile], passes=passes) as stage:
+            hit, key = self._cache_fetch('opt', cmd, [curfile], output)
+            if not hit:
+                status = runcmd(cmd, PrepareWatch(), 'Running opt failed')
+                stage.add_usage(status.usage)
+                self._cache_store(key, output)
+            stage.output = output
+            stage.info['cached'] = hit
+        self._curfile = output
         self._save_ll()
 
     def _disable_new_pm(self, cmd):
@@ -326,20 +516,29 @@ class SymbioticCC(object):
         print_stdout('INFO: Starting instrumentation', color='WHITE')
 
         output = '{0}-inst.bc'.format(self.curfile[:self.curfile.rfind('.')])
-        if self.options.instrumentation_timeout > 0:
-            cmd = ['timeout', str(self.options.instrumentation_timeout)]
-        else:
-            cmd = []
-
-        cmd += ['sbt-instr', config, self.curfile, definitionsbc, output]
+        cmd = ['sbt-instr', config, self.curfile, definitionsbc, output]
         if not shouldlink:
             cmd.append('--no-linking')
 
         restart_counting_time()
         watch = InstrumentationWatch()
 
-        process = ProcessRunner()
-        retval = process.run(cmd, watch)
+        with Stage('instrumentation', [self.curfile]) as stage:
+            hit, key = self._cache_fetch('instrumentation', cmd,
+                                         [self.curfile, definitionsbc, config],
+                                         output)
+            if hit:
+                retval = 0
+            else:
+                timeout = self.options.instrumentation_timeout
+                if not self.options.static_timeouts:
+                    timeout = instrumentation_timeout(timeout)
+                process = ProcessRunner()
+                retval = process.run(cmd, watch, timeout=timeout)
+                stage.add_usage(process.usage)
+            stage.info.update({'cached': hit, 'exit_status': retval})
+            if retval == 0:
+                stage.output = output
         if retval != 0:
             for line in watch.getLines():
                 if b'PredatorPlugin: Predator found no errors' in line:
@@ -351,7 +550,7 @@ class SymbioticCC(object):
             # on timeout, just proceed, but avoid slicing and such,
             # since it depends on instrumentation
             if not self.options.full_instrumentation and\
-                    (retval == 124 or self.options.sv_comp):
+                    (retval == ProcessRunner.TIMEOUT_STATUS or self.options.sv_comp):
                 self.options.noslice = True
                 self.options.no_optimize = False
                 self.options.optlevel = []
@@ -359,6 +558,8 @@ class SymbioticCC(object):
                 raise SymbioticException('Instrumenting the code failed')
             print_elapsed_time('INFO: Instrumentation [FAILED] time', color='WHITE')
         else:
+            if not hit:
+                self._cache_store(key, output)
             print_elapsed_time('INFO: Instrumentation time', color='WHITE')
             self.curfile = output
             self._save_ll()
@@ -381,31 +582,68 @@ class SymbioticCC(object):
         if self.curfile:
             cmd.append(self.curfile)
 
-        runcmd(cmd, DbgWatch('compile'),
-               'Failed linking llvm file with libraries')
+        with Stage('link', cmd[3:]) as stage:
+            hit, key = self._cache_fetch('link', cmd, cmd[3:], output)
+            if not hit:
+                status = runcmd(cmd, DbgWatch('compile'),
+                                'Failed linking llvm file with libraries')
+                stage.add_usage(status.usage)
+                self._cache_store(key, output)
+            stage.output = output
+            stage.info['cached'] = hit
         self.curfile = output
         self._save_ll()
 
-    def _link_undefined(self, undefs):
-        def _get_path(symbdir, llvmver, ty, tool, undef):
-            # check also if we have precompiled .bc files
-            if self.options.is32bit:
-                path = os.path.abspath('{0}/llvm-{1}/lib32/{2}/{3}/{4}.bc'.format(symbdir, llvmver, ty, tool, undef))
+    def _get_model_index(self):
+        """
+        Get the index of precompiled models for the used LLVM
+        and architecture or None if there is no index.
+        """
+        if self._model_index is False:
+            from . models import load_index
+            libdir = os.path.join(self.env.symbiotic_dir,
+                                  'llvm-{0}'.format(self._tool.llvm_version()),
+                                  'lib32' if self.options.is32bit else 'lib')
+            self._model_index = load_index(libdir)
+            if self._model_index is None:
+                dbg('Found no index of precompiled models in {0}'.format(libdir))
+
+        return self._model_index
+
+    def _find_model(self, undef, index=None):
+        """
+        Find the model of the function \param undef. Return the path to
+        the precompiled model or to its source, or None if there is no model.
+        """
+        symbdir = self.env.symbiotic_dir
+        llvmver = self._tool.llvm_version()
+        libdir = 'lib32' if self.options.is32bit else 'lib'
+
+        def _get_precompiled(ty, tool):
+            if index is not None:
+                return index.get(ty, tool, undef)
+
+            if tool is None:
+                path = os.path.abspath('{0}/llvm-{1}/{2}/{3}/{4}.bc'.format(symbdir, llvmver, libdir, ty, undef))
             else:
-                path = os.path.abspath('{0}/llvm-{1}/lib/{2}/{3}/{4}.bc'.format(symbdir, llvmver, ty, tool, undef))
+                path = os.path.abspath('{0}/llvm-{1}/{2}/{3}/{4}/{5}.bc'.format(symbdir, llvmver, libdir, ty, tool, undef))
             if os.path.isfile(path):
                 return path
+            return None
+
+        def _get_path(ty, tool):
+            # check also if we have precompiled .bc files
+            path = _get_precompiled(ty, tool)
+            if path:
+                return path
 
             path = os.path.abspath('{0}/lib/{1}/{2}/{3}.c'.format(symbdir, ty, tool, undef))
             if os.path.isfile(path):
                 return path
 
             # do we have at least a generic implementation?
-            if self.options.is32bit:
-                path = os.path.abspath('{0}/llvm-{1}/lib32/{2}/{3}.bc'.format(symbdir, llvmver, ty, undef))
-            else:
-                path = os.path.abspath('{0}/llvm-{1}/lib/{2}/{3}.bc'.format(symbdir, llvmver, ty, undef))
-            if os.path.isfile(path):
+            path = _get_precompiled(ty, None)
+            if path:
                 return path
 
             path = os.path.abspath('{0}/lib/{1}/{2}.c'.format(symbdir, ty, undef))
@@ -414,27 +652,29 @@ class SymbioticCC(object):
 
             return None
 
-        def get_path(symbdir, llvmver, tool, undef):
-            # return the first found definition (in the order of linkundef)
-            for ty in self.options.linkundef:
-                path = _get_path(symbdir, llvmver, ty, tool, undef)
-                if path:
-                    return path
-            return None
+        # return the first found definition (in the order of linkundef)
+        tool = self._tool.name().lower()
+        for ty in self.options.linkundef:
+            path = _get_path(ty, tool)
+            if path:
+                return path
+        return None
 
+    def _compile_model(self, path):
+        basename = os.path.basename(path)
+        bcfile='{0}.bc'.format(basename[:basename.rfind('.')])
+        output = os.path.abspath(bcfile)
+        self._compile_to_llvm(path, output)
+        return output
 
+    def _link_undefined(self, undefs):
         tolink = []
         for undef in undefs:
-            path = get_path(self.env.symbiotic_dir, self._tool.llvm_version(),
-                            self._tool.name().lower(), undef)
+            path = self._find_model(undef)
             if path is None:
                 continue
 
-            basename = os.path.basename(path)
-            bcfile='{0}.bc'.format(basename[:basename.rfind('.')])
-            output = os.path.abspath(bcfile)
-            self._compile_to_llvm(path, output)
-            tolink.append(output)
+            tolink.append(self._compile_model(path))
 
             # for debugging
             self._linked_functions.append(undef)
@@ -445,21 +685,91 @@ class SymbioticCC(object):
 
         return False
 
+    def _link_undefined_closure(self, index, only_func=[]):
+        """
+        Link models of the undefined functions together with all the models
+        that these models need. The dependencies of precompiled models are
+        taken from the index, so all the models are linked at once.
+        Return False if we linked some model that is not precompiled
+        (and therefore we do not know what functions it needs).
+        """
+        defined, all_undefs = self._get_symbols(self.curfile)
+        if only_func:
+            queue = [x for x in all_undefs if x in only_func]
+        else:
+            queue = list(all_undefs)
+
+        resolved = set(defined)
+        tolink = []
+        complete = True
+        while queue:
+            undef = queue.pop(0)
+            if undef in resolved:
+                continue
+            resolved.add(undef)
+
+            path = self._find_model(undef, index)
+            if path is None:
+                continue
+
+            if path.endswith('.c'):
+                tolink.append(self._compile_model(path))
+                complete = False
+            else:
+                tolink.append(path)
+                resolved.update(index.defined(path))
+                queue += index.undefined(path)
+
+            # for debugging
+            self._linked_functions.append(undef)
+
+            # once we linked something, we link models for all
+            # undefined functions (the same as _rec_link_undefined does)
+            if only_func:
+                only_func = None
+                queue += all_undefs
+
+        if tolink:
+            self.link(libs=tolink)
+
+        return complete
+
     def link_unconditional(self):
         """ Link the files that we got on the command line """
 
         return self._link_undefined(self.options.link_files)
 
     def _get_undefined(self, bitcode, only_func=[]):
-        cmd = ['llvm-nm', '--undefined-only', '--just-symbol-name', bitcode]
-        watch = ProcessWatch(None)
-        runcmd(cmd, watch, 'Failed getting undefined symbols from bitcode')
-        undefs = list(map(lambda s: s.strip().decode('ascii'), watch.getLines()))
+        undefs = self._get_symbols(bitcode)[1]
         if only_func:
             return [x for x in undefs if x in only_func]
         return undefs
 
+    def _get_symbols(self, bitcode):
+        """
+        Return the pair (defined, undefined) of lists
+        of external symbols of the given bitcode
+        """
+        try:
+            return get_symbols(bitcode)
+        except (BitcodeError, OSError) as e:
+            dbg('Reading symbols of {0} failed ({1}), using llvm-nm'.format(bitcode, str(e)))
+
+        from . models import parse_nm_output
+        cmd = ['llvm-nm', '--extern-only', bitcode]
+        watch = ProcessWatch(None)
+        runcmd(cmd, watch, 'Failed getting symbols from bitcode')
+        return parse_nm_output(watch.getLines())
+
     def _rec_link_undefined(self, only_func=[]):
+        index = self._get_model_index()
+        if index is not None:
+            if self._link_undefined_closure(index, only_func):
+                return
+            # we linked also models that are not precompiled,
+            # search for the functions that they need
+            only_func = []
+
         # get undefined functions from the bitcode
         undefs = self._get_undefined(self.curfile, only_func)
         if self._link_undefined(undefs):
@@ -492,11 +802,7 @@ class SymbioticCC(object):
         output = '{0}.sliced'.format(self.curfile[:self.curfile.rfind('.')])
 
 
-        if self.options.slicer_timeout > 0:
-            cmd = ['timeout', str(self.options.slicer_timeout)] +\
-                   self.options.slicer_cmd + ['-c', ",".join(crit)] + opts
-        else:
-            cmd = self.options.slicer_cmd + ['-c', ",".join(crit)] + opts
+        cmd = self.options.slicer_cmd + ['-c', ",".join(crit)] + opts
 
         if self.options.slicer_pta in ['fi', 'fs']:
             cmd.append('-pta')
@@ -516,11 +822,44 @@ class SymbioticCC(object):
 
         cmd.append(self.curfile)
 
-        watch = SlicerWatch()
-        process = ProcessRunner()
-        retval = process.run(cmd, watch)
+        with Stage('slicing', [self.curfile]) as stage:
+            hit, key = self._cache_fetch('slicer', cmd, [self.curfile], output)
+            timeout = self.options.slicer_timeout
+            if not hit and not self.options.static_timeouts:
+                timeout = slicer_timeout(timeout, self.curfile)
+                if timeout is None:
+                    stage.info['skipped'] = True
+                    print_stdout("INFO: Not enough time left for slicing, "
+                                 "using the unsliced file.")
+                    self.options.noslice = True
+                    return
+
+            if not hit and self._slicer_blew_up(key, timeout):
+                stage.info['skipped'] = True
+                print_stdout("INFO: Slicing blew up on this code before, "
+                             "using the unsliced file.")
+                self.options.noslice = True
+                return
+
+            if hit:
+                retval = 0
+            else:
+                watch = SlicerWatch()
+                process = ProcessRunner()
+                retval = process.run(cmd, watch, timeout=timeout)
+                stage.add_usage(process.usage)
+            stage.info.update({'cached': hit, 'exit_status': retval})
+            if retval == 0:
+                stage.output = output
+
+        if hit:
+            self.curfile = output
+            self._save_ll()
+            return
+
         if retval != 0:
-            if retval != 124: # TIMEOUT of slicer
+            self._slicer_failed(key, retval, timeout, process.usage)
+            if retval != ProcessRunner.TIMEOUT_STATUS:
                 for line in watch.getLines():
                     print_stderr(line.decode('utf-8'), color='RED', print_nl=False)
                 print_stderr("INFO: Slicing FAILED, using the unsliced file.")
@@ -532,37 +871,63 @@ class SymbioticCC(object):
             # act as the slicing was disabled
             self.options.noslice = True
         else:
+            self._cache_store(key, output)
             self.curfile = output
             self._save_ll()
 
-    def optimize(self, passes, disable=[], load_sbt = False):
+    def _slicer_failed(self, key, retval, timeout, usage):
+        """
+        Remember in the cache that the slicer blew up on the input
+        (it timeouted or it was killed, e.g., because of the memory limit)
+        """
+        if self._cache is None or retval is None:
+            return
+        if retval != ProcessRunner.TIMEOUT_STATUS and retval >= 0:
+            # an ordinary failure, it may not happen with other options
+            return
+
+        self._cache.store_failure(key, {'exit_status': int(retval),
+                                        'timeout': timeout,
+                                        'usage': usage.as_dict() if usage else None})
+
+    def _slicer_blew_up(self, key, timeout):
+        """
+        Return True if the slicer blew up on the input before
+        and it would most likely blow up again with \\param timeout
+        """
+        if self._cache is None:
+            return False
+        failure = self._cache.fetch_failure(key)
+        if failure is None:
+            return False
+
+        dbg('The slicer blew up on this input before: {0}'.format(failure))
+        if failure['exit_status'] == ProcessRunner.TIMEOUT_STATUS:
+            # try again if we have more time now
+            return bool(timeout) and timeout <= failure['timeout']
+        return True
+
+    def optimize(self, passes, disable=[]):
+        """
+        Schedule optimizations of the current file. The optimizations
+        are queued together with other opt passes, see run_opt().
+        """
         if not passes or self.options.no_optimize:
             return
 
-        disable += self.options.disabled_optimizations
+        disable = disable + self.options.disabled_optimizations
         if disable:
-            passes = filter(lambda x: x not in disable, passes)
+            passes = [x for x in passes if x not in disable]
 
         if self._opt_renames:
-            passes = map(lambda x: self._opt_renames.get(x, x), passes)
+            passes = [self._opt_renames.get(x, x) for x in passes]
 
         if not passes:
             dbg("No passes available for optimizations")
+            return
 
-        output = '{0}-opt.bc'.format(self.curfile[:self.curfile.rfind('.')])
-        cmd = ['opt']
-        if load_sbt:
-            cmd += ['-load', 'LLVMsbt.so']
-        self._disable_new_pm(cmd)
-        cmd += ['-o', output, self.curfile]
-        cmd += passes
-
-        restart_counting_time()
-        runcmd(cmd, CompileWatch(), 'Optimizing the code failed')
-        print_elapsed_time('INFO: Optimizations time', color='WHITE')
-
-        self.curfile = output
-        self._save_ll()
+        self.run_opt(passes)
+        self._pending_optimizations = True
 
     def postprocess_llvm(self):
         """
@@ -581,6 +946,40 @@ class SymbioticCC(object):
         self.curfile = output
         self._save_ll()
 
+    def _compile_in_parallel(self, sources, outputs, opts):
+        """
+        Compile \param sources into the files \param outputs, running
+        as many compilations concurrently as we have CPUs.
+        Return the list of the compiled files.
+        """
+        jobs = min(len(sources), available_cpus())
+        if jobs <= 1:
+            return [self._compile_to_llvm(src, out, opts=opts)
+                    for src, out in zip(sources, outputs)]
+
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+
+        dbg('Compiling {0} sources using {1} jobs'.format(len(sources), jobs))
+        runners = [ProcessRunner() for _ in sources]
+        executor = ThreadPoolExecutor(max_workers=jobs)
+        futures = [executor.submit(self._compile_to_llvm, src, out,
+                                   opts=opts, runner=runner)
+                   for src, out, runner in zip(sources, outputs, runners)]
+        try:
+            for future in as_completed(futures):
+                # re-raise the failure of the compilation
+                future.result()
+        except:
+            # do not start compiling the rest of the sources and do not
+            # wait for the running compilations (e.g., on timeout)
+            executor.shutdown(wait=False, cancel_futures=True)
+            for runner in runners:
+                runner.stop()
+            raise
+        executor.shutdown()
+
+        return [future.result() for future in futures]
+
     def _compile_sources(self, output='code.bc'):
         """
         Compile the given sources into LLVM bitcode and link them into one
@@ -606,17 +1005,25 @@ class SymbioticCC(object):
         opts += self.cc_disable_optimizations()
 
         llvmsrc = []
+        tocompile = []
         options = self.options
         for source in self.sources:
             if options.source_is_bc:
                 dbg("Treating '{0}' as LLVM bitcode (required)".format(source))
-                llvms = source
+                llvmsrc.append(source)
             elif source.endswith('.bc') or source.endswith('.ll'):
                 dbg("Treating '{0}' as LLVM bitcode (according to suffix)".format(source))
-                llvms = source
+                llvmsrc.append(source)
             else:
-                llvms = self._compile_to_llvm(source, opts=opts)
-            llvmsrc.append(llvms)
+                # placeholder for the compiled source
+                llvmsrc.append(None)
+                tocompile.append(len(llvmsrc) - 1)
+
+        outputs = _compiled_names([self.sources[n] for n in tocompile], [output])
+        compiled = self._compile_in_parallel([self.sources[n] for n in tocompile],
+                                             outputs, opts)
+        for n, llvms in zip(tocompile, compiled):
+            llvmsrc[n] = llvms
 
         # link all compiled sources to a one bitecode
         # the result is stored to self.curfile
@@ -632,21 +1039,41 @@ class SymbioticCC(object):
 
         print_stdout('INFO: Starting slicing', color='WHITE')
         restart_counting_time()
-        for n in range(0, self.options.repeat_slicing):
+        repeat = self.options.repeat_slicing
+        size = self._instructions_count() if repeat > 1 else None
+        for n in range(0, repeat):
             dbg('Slicing the code for the {0}. time'.format(n + 1))
             # if n == 0 and self.options.repeat_slicing > 1:
             #    add_params = ['-pta-field-sensitive=8']
 
             self.slicer(add_params)
+            if self.options.noslice:
+                # slicing failed (or was skipped),
+                # the next rounds would fail too
+                break
 
-            if self.options.repeat_slicing > 1:
+            if repeat > 1:
                 opt = get_optlist_after(self.options.optlevel)
-                self.optimize(opt + ['-remove-infinite-loops'], load_sbt=True)
+                self.optimize(opt + ['-remove-infinite-loops'])
+
+                # slicing and optimizing the code again
+                # does not help if this round did not remove anything
+                previous, size = size, self._instructions_count()
+                if size is not None and size == previous:
+                    dbg('Slicing reached a fixpoint after {0} rounds'.format(n + 1))
+                    break
 
         print_elapsed_time('INFO: Total slicing time', color='WHITE')
 
         self._get_stats('After slicing ')
 
+    def _instructions_count(self):
+        """ The number of instructions in the current file (None if unknown) """
+        try:
+            return get_instructions_count(self.curfile)
+        except (BitcodeError, OSError):
+            return None
+
     def postprocessing(self):
         passes = []
 
@@ -673,8 +1100,6 @@ class SymbioticCC(object):
         self.optimize(passes=opt)
 
         # XXX: we could optimize the code again here...
-        print_elapsed_time('INFO: After-slicing optimizations and transformations time',
-                           color='WHITE')
 
         if hasattr(self._tool, 'passes_before_verification'):
             self.run_opt(self._tool.passes_before_verification())
@@ -690,11 +1115,28 @@ class SymbioticCC(object):
         # and also other funs like __errno_location may be included
         self.link_undefined()
 
+        # the optimizations are run together with the passes
+        # before verification, so measure the time of all of them
+        self._flush_passes()
+        print_elapsed_time('INFO: After-slicing optimizations and transformations time',
+                           color='WHITE')
+
     def prepare_unsliced_file(self):
         """
         Get the unsliced file and perform the same
-        postprocessing steps as for the sliced file
+        postprocessing steps as for the sliced file.
+        The file is prepared only once, the next calls return
+        the same file.
         """
+        self.background_unsliced_file()
+        if self._unsliced_file and os.path.isfile(self._unsliced_file):
+            dbg('Reusing the prepared unsliced file')
+            return self._unsliced_file
+
+        self._unsliced_file = self._prepare_unsliced_file()
+        return self._unsliced_file
+
+    def _prepare_unsliced_file(self):
         llvmfile = self.nonsliced_llvmfile
         tmp = self.curfile
         self.curfile = llvmfile
@@ -711,6 +1153,88 @@ class SymbioticCC(object):
 
         return llvmfile
 
+    def _start_unsliced_preparation(self):
+        """
+        Start preparing the unsliced file in a process forked from this one.
+        The process works in the directory 'unsliced' with a copy
+        of the unsliced file, so that the names of files do not clash.
+        """
+        from multiprocessing import get_context
+
+        workdir = os.path.abspath('unsliced')
+        os.makedirs(workdir, exist_ok=True)
+        llvmfile = os.path.join(workdir, os.path.basename(self.nonsliced_llvmfile))
+        if os.path.exists(llvmfile):
+            os.unlink(llvmfile)
+        try:
+            os.link(self.nonsliced_llvmfile, llvmfile)
+        except OSError:
+            copyfile(self.nonsliced_llvmfile, llvmfile)
+
+        context = get_context('fork')
+        recv, send = context.Pipe(duplex=False)
+        nonsliced = self.nonsliced_llvmfile
+        # the forked process gets this state
+        self.nonsliced_llvmfile = llvmfile
+        try:
+            process = context.Process(target=_prepare_unsliced_worker,
+                                      args=(self, workdir, send), daemon=True)
+            process.start()
+        finally:
+            self.nonsliced_llvmfile = nonsliced
+            send.close()
+
+        print_stdout('INFO: Preparing the unsliced file in the background',
+                     color='WHITE')
+        self._unsliced_job = (process, recv)
+
+    def background_unsliced_file(self):
+        """
+        Wait for the unsliced file that is prepared in the background
+        and return it. Return None if the file is not being prepared
+        in the background or if preparing it failed.
+        """
+        # several threads may wait for the file
+        with self._unsliced_lock:
+            job = self._unsliced_job
+            if job is None:
+                return self._unsliced_file
+
+            process, conn = job
+            if process.is_alive():
+                print_stdout('INFO: Waiting for the unsliced file', color='WHITE')
+            llvmfile = None
+            try:
+                llvmfile = conn.recv()
+            except (EOFError, OSError):
+                # the process failed or it was cancelled
+                pass
+            finally:
+                process.join()
+                conn.close()
+
+            if llvmfile is None:
+                dbg('Preparing the unsliced file in the background failed '
+                    '(exit status {0})'.format(process.exitcode))
+            self._unsliced_file = llvmfile
+            self._unsliced_job = None
+            return llvmfile
+
+    def cancel_unsliced_preparation(self):
+        """
+        Stop preparing the unsliced file in the background (if we do).
+        Can be called from another thread than the one that waits
+        for the file.
+        """
+        job = self._unsliced_job
+        if job is None:
+            return
+
+        process, _ = job
+        if process.is_alive():
+            process.terminate()
+        process.join()
+
 
     def _disable_and_rename_optimizations(self, llvm_version):
         disabled = []
@@ -883,7 +1407,7 @@ class SymbioticCC(object):
                 passes += ['-reg2mem', '-break-infinite-loops',]
             passes += ['-remove-infinite-loops',
                        '-mem2reg', '-break-crit-loops', '-lowerswitch']
-        self.optimize(passes, load_sbt=True)
+        self.optimize(passes)
 
         if hasattr(self._tool, 'actions_before_slicing'):
             self._tool.actions_before_slicing(self)
@@ -893,6 +1417,8 @@ class SymbioticCC(object):
 
         # remember the non-sliced llvmfile
         self.nonsliced_llvmfile = self.curfile
+        if self.options.background_unsliced and not self.options.noslice:
+            self._start_unsliced_preparation()
 
         if hasattr(self._tool, 'passes_before_slicing'):
             passes = self._tool.passes_before_slicing()
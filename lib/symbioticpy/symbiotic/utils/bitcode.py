@@ -0,0 +1,436 @@
+#!/usr/bin/env python3
+
+"""
+Minimal reader of LLVM bitcode files that extracts
+the external symbols of a module without spawning llvm-nm.
+
+Only the records of the module block that describe global values
+are decoded, all nested blocks (types, constants, function bodies, ...)
+are skipped using their length, so reading a module is cheap.
+The reader supports the bitcode written by LLVM 5 and newer (names
+of global values are stored in the string table). For anything else
+it raises BitcodeError and the caller is supposed to fall back to llvm-nm.
+"""
+
+from struct import unpack_from
+
+from . cache import hash_file
+
+
+class BitcodeError(Exception):
+    pass
+
+
+# abbreviation ids
+_END_BLOCK = 0
+_ENTER_SUBBLOCK = 1
+_DEFINE_ABBREV = 2
+_UNABBREV_RECORD = 3
+
+# block ids
+_BLOCKINFO_BLOCK = 0
+_MODULE_BLOCK = 8
+_FUNCTION_BLOCK = 12
+_STRTAB_BLOCK = 23
+
+# record codes in the module block
+_MODULE_CODE_VERSION = 1
+_MODULE_CODE_TRIPLE = 2
+_MODULE_CODE_ASM = 4
+_MODULE_CODE_GLOBALVAR = 7
+_MODULE_CODE_FUNCTION = 8
+_MODULE_CODE_ALIAS = 14
+_MODULE_CODE_IFUNC = 15
+
+# record codes in the function block that are not instructions
+# (declareblocks, debug locations, operand bundles, blockaddr users
+# and debug records)
+_FUNC_CODES_NOT_INSTRUCTIONS = (1, 33, 35, 55, 60, 61, 62, 63, 64, 65)
+
+# record codes in the blockinfo block
+_BLOCKINFO_CODE_SETBID = 1
+
+# encodings of abbreviation operands
+_ENC_FIXED = 1
+_ENC_VBR = 2
+_ENC_ARRAY = 3
+_ENC_CHAR6 = 4
+_ENC_BLOB = 5
+
+# encoded linkages (as written by BitcodeWriter)
+_LOCAL_LINKAGES = (3, 9, 13, 14) # internal, private
+_LINKAGE_EXTERN_WEAK = 7
+_LINKAGE_AVAILABLE_EXTERNALLY = 12
+
+_CHAR6 = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789._'
+
+
+class _BitReader(object):
+    def __init__(self, data, start=0, end=None):
+        self._data = data
+        self._end = (len(data) if end is None else end) * 8
+        self.pos = start * 8
+
+    def at_end(self):
+        return self.pos >= self._end
+
+    def read(self, width):
+        if width == 0:
+            return 0
+        pos = self.pos
+        if pos + width > self._end:
+            raise BitcodeError('Unexpected end of bitcode')
+
+        first = pos >> 3
+        last = (pos + width + 7) >> 3
+        val = int.from_bytes(self._data[first:last], 'little')
+        self.pos = pos + width
+        return (val >> (pos & 7)) & ((1 << width) - 1)
+
+    def read_vbr(self, width):
+        hibit = 1 << (width - 1)
+        mask = hibit - 1
+        val, shift = 0, 0
+        while True:
+            piece = self.read(width)
+            val |= (piece & mask) << shift
+            if not piece & hibit:
+                return val
+            shift += width - 1
+
+    def align32(self):
+        self.pos = (self.pos + 31) & ~31
+
+    def skip_bytes(self, num):
+        self.pos += num * 8
+        if self.pos > self._end:
+            raise BitcodeError('Unexpected end of bitcode')
+
+    def byte_pos(self):
+        assert self.pos % 8 == 0
+        return self.pos >> 3
+
+
+def _read_abbrev(reader):
+    ops = []
+    numops = reader.read_vbr(5)
+    i = 0
+    while i < numops:
+        if reader.read(1):
+            ops.append((None, reader.read_vbr(8)))
+        else:
+            enc = reader.read(3)
+            if enc in (_ENC_FIXED, _ENC_VBR):
+                width = reader.read_vbr(5)
+                if width == 0:
+                    # zero-width fields are literal zeros
+                    ops.append((None, 0))
+                else:
+                    ops.append((enc, width))
+            elif enc in (_ENC_ARRAY, _ENC_CHAR6, _ENC_BLOB):
+                ops.append((enc, None))
+            else:
+                raise BitcodeError('Invalid abbreviation encoding')
+        i += 1
+    return ops
+
+
+def _read_scalar(reader, op):
+    enc, val = op
+    if enc is None:
+        return val
+    if enc == _ENC_FIXED:
+        return reader.read(val)
+    if enc == _ENC_VBR:
+        return reader.read_vbr(val)
+    if enc == _ENC_CHAR6:
+        return ord(_CHAR6[reader.read(6)])
+    raise BitcodeError('Invalid scalar operand')
+
+
+def _read_record(reader, abbrevid, abbrevs):
+    """ Return a pair (code, operands, blob) """
+    if abbrevid == _UNABBREV_RECORD:
+        code = reader.read_vbr(6)
+        numops = reader.read_vbr(6)
+        return code, [reader.read_vbr(6) for _ in range(numops)], None
+
+    try:
+        abbrev = abbrevs[abbrevid - 4]
+    except IndexError:
+        raise BitcodeError('Invalid abbreviation id')
+
+    vals, blob = [], None
+    n = 0
+    while n < len(abbrev):
+        op = abbrev[n]
+        enc = op[0]
+        if enc == _ENC_ARRAY:
+            n += 1
+            elt = abbrev[n]
+            num = reader.read_vbr(6)
+            vals += [_read_scalar(reader, elt) for _ in range(num)]
+        elif enc == _ENC_BLOB:
+            num = reader.read_vbr(6)
+            reader.align32()
+            start = reader.byte_pos()
+            reader.skip_bytes(num)
+            blob = (start, num)
+            reader.align32()
+        else:
+            vals.append(_read_scalar(reader, op))
+        n += 1
+
+    if not vals:
+        raise BitcodeError('Abbreviated record without a code')
+    return vals[0], vals[1:], blob
+
+
+class _Module(object):
+    def __init__(self):
+        self.version = 0
+        self.triple = ''
+        self.has_asm = False
+        # (strtab offset, size, is defined, linkage)
+        self.values = []
+        # the number of instructions (if counted)
+        self.instructions = 0
+
+
+def _skip_block(reader):
+    reader.read_vbr(4) # abbreviation width
+    reader.align32()
+    numwords = reader.read(32)
+    reader.skip_bytes(numwords * 4)
+
+
+def _read_block_header(reader):
+    width = reader.read_vbr(4)
+    reader.align32()
+    reader.read(32) # number of words
+    return width
+
+
+def _read_blockinfo(reader, width, blockinfo):
+    curbid = None
+    while True:
+        abbrevid = reader.read(width)
+        if abbrevid == _END_BLOCK:
+            reader.align32()
+            return
+        if abbrevid == _ENTER_SUBBLOCK:
+            reader.read_vbr(8)
+            _skip_block(reader)
+        elif abbrevid == _DEFINE_ABBREV:
+            if curbid is None:
+                raise BitcodeError('Abbreviation in BLOCKINFO without block id')
+            blockinfo.setdefault(curbid, []).append(_read_abbrev(reader))
+        else:
+            code, ops, _ = _read_record(reader, abbrevid, [])
+            if code == _BLOCKINFO_CODE_SETBID and ops:
+                curbid = ops[0]
+
+
+def _count_instructions(reader, width, blockinfo):
+    """ Count the instructions in a function block """
+    abbrevs = list(blockinfo.get(_FUNCTION_BLOCK, []))
+    num = 0
+    while True:
+        abbrevid = reader.read(width)
+        if abbrevid == _END_BLOCK:
+            reader.align32()
+            return num
+        if abbrevid == _ENTER_SUBBLOCK:
+            # constants, metadata, symbol table, ...
+            reader.read_vbr(8)
+            _skip_block(reader)
+        elif abbrevid == _DEFINE_ABBREV:
+            abbrevs.append(_read_abbrev(reader))
+        else:
+            code, _, _ = _read_record(reader, abbrevid, abbrevs)
+            if code not in _FUNC_CODES_NOT_INSTRUCTIONS:
+                num += 1
+
+
+def _read_module(reader, width, blockinfo, count=False):
+    module = _Module()
+    abbrevs = list(blockinfo.get(_MODULE_BLOCK, []))
+    while True:
+        abbrevid = reader.read(width)
+        if abbrevid == _END_BLOCK:
+            reader.align32()
+            return module
+        if abbrevid == _ENTER_SUBBLOCK:
+            blockid = reader.read_vbr(8)
+            if blockid == _BLOCKINFO_BLOCK:
+                _read_blockinfo(reader, _read_block_header(reader), blockinfo)
+            elif blockid == _FUNCTION_BLOCK and count:
+                module.instructions +=\
+                    _count_instructions(reader, _read_block_header(reader), blockinfo)
+            else:
+                _skip_block(reader)
+            continue
+        if abbrevid == _DEFINE_ABBREV:
+            abbrevs.append(_read_abbrev(reader))
+            continue
+
+        code, ops, _ = _read_record(reader, abbrevid, abbrevs)
+        if code == _MODULE_CODE_VERSION and ops:
+            module.version = ops[0]
+        elif code == _MODULE_CODE_TRIPLE:
+            module.triple = ''.join(map(chr, ops))
+        elif code == _MODULE_CODE_ASM:
+            module.has_asm = module.has_asm or len(ops) > 0
+        elif code == _MODULE_CODE_GLOBALVAR and len(ops) > 5:
+            # [offset, size, type, isconst, initid, linkage, ...]
+            module.values.append((ops[0], ops[1], ops[4] != 0, ops[5]))
+        elif code == _MODULE_CODE_FUNCTION and len(ops) > 5:
+            # [offset, size, type, cc, isproto, linkage, ...]
+            module.values.append((ops[0], ops[1], ops[4] == 0, ops[5]))
+        elif code in (_MODULE_CODE_ALIAS, _MODULE_CODE_IFUNC) and len(ops) > 5:
+            # [offset, size, type, addrspace, value, linkage, ...]
+            module.values.append((ops[0], ops[1], True, ops[5]))
+
+
+def _read_strtab(reader, width, data):
+    abbrevs = []
+    strtab = None
+    while True:
+        abbrevid = reader.read(width)
+        if abbrevid == _END_BLOCK:
+            reader.align32()
+            return strtab
+        if abbrevid == _ENTER_SUBBLOCK:
+            reader.read_vbr(8)
+            _skip_block(reader)
+        elif abbrevid == _DEFINE_ABBREV:
+            abbrevs.append(_read_abbrev(reader))
+        else:
+            _, _, blob = _read_record(reader, abbrevid, abbrevs)
+            if blob is not None:
+                strtab = bytes(data[blob[0]:blob[0] + blob[1]])
+
+
+def _get_stream(data):
+    start, end = 0, len(data)
+    # the wrapper header, see BitcodeReader
+    if data[:4] == b'\xde\xc0\x17\x0b':
+        _, _, start, size = unpack_from('<IIII', data, 4)
+        end = start + size
+    if data[start:start + 4] != b'BC\xc0\xde':
+        raise BitcodeError('Not a bitcode file')
+    return _BitReader(data, start + 4, end)
+
+
+def _read_modules(path, count=False):
+    """ Return the pair (modules, string table) of the bitcode file """
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    reader = _get_stream(data)
+    blockinfo = {}
+    modules, strtab = [], None
+    while not reader.at_end():
+        abbrevid = reader.read(2)
+        if abbrevid != _ENTER_SUBBLOCK:
+            # padding at the end of the stream
+            if abbrevid == 0 and not any(data[reader.pos >> 3:]):
+                break
+            raise BitcodeError('Unexpected record at the top level')
+
+        blockid = reader.read_vbr(8)
+        if blockid == _MODULE_BLOCK:
+            modules.append(_read_module(reader, _read_block_header(reader),
+                                        blockinfo, count))
+        elif blockid == _STRTAB_BLOCK:
+            strtab = _read_strtab(reader, _read_block_header(reader), data)
+        elif blockid == _BLOCKINFO_BLOCK:
+            _read_blockinfo(reader, _read_block_header(reader), blockinfo)
+        else:
+            _skip_block(reader)
+
+    if not modules:
+        raise BitcodeError('No module in the bitcode')
+    return modules, strtab
+
+
+def read_instructions_count(path):
+    """
+    Return the number of instructions in the bitcode file \\param path.
+    Raise BitcodeError if the file cannot be handled by this reader.
+    """
+    modules, _ = _read_modules(path, count=True)
+    return sum(m.instructions for m in modules)
+
+
+def read_symbols(path):
+    """
+    Return the pair (defined, undefined) of sorted lists of external
+    symbols of the bitcode file \\param path (the same that
+    'llvm-nm --extern-only' reports).
+    Raise BitcodeError if the file cannot be handled by this reader.
+    """
+    modules, strtab = _read_modules(path)
+    if strtab is None:
+        raise BitcodeError('No string table in the bitcode')
+
+    defined, undefined = set(), set()
+    for module in modules:
+        if module.version < 2:
+            raise BitcodeError('Unsupported version of bitcode')
+        # names may get mangled on these platforms
+        # and inline assembly can define symbols too
+        if module.has_asm or any(os in module.triple for os in
+                                 ('apple', 'darwin', 'macos', 'ios',
+                                  'windows', 'win32')):
+            raise BitcodeError('Unsupported module')
+
+        for offset, size, isdef, linkage in module.values:
+            if linkage in _LOCAL_LINKAGES:
+                continue
+            name = strtab[offset:offset + size].decode('utf-8', 'replace')
+            # intrinsics are not symbols
+            if name.startswith('llvm.'):
+                continue
+            if name.startswith('\x01'):
+                name = name[1:]
+
+            if isdef and linkage != _LINKAGE_AVAILABLE_EXTERNALLY and\
+               linkage != _LINKAGE_EXTERN_WEAK:
+                defined.add(name)
+            else:
+                undefined.add(name)
+
+    return sorted(defined), sorted(undefined - defined)
+
+
+# symbols and numbers of instructions of the bitcode files that we have
+# already read, the key is the hash of the contents of the file
+_symbols_cache = {}
+_instructions_cache = {}
+
+
+def get_symbols(path):
+    """
+    Memoized version of read_symbols(), the files
+    are identified by the hash of their contents
+    """
+    digest = hash_file(path).digest()
+    symbols = _symbols_cache.get(digest)
+    if symbols is None:
+        symbols = read_symbols(path)
+        _symbols_cache[digest] = symbols
+    return symbols
+
+
+def get_instructions_count(path):
+    """
+    Memoized version of read_instructions_count(), the files
+    are identified by the hash of their contents
+    """
+    digest = hash_file(path).digest()
+    num = _instructions_cache.get(digest)
+    if num is None:
+        num = read_instructions_count(path)
+        _instructions_cache[digest] = num
+    return num
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+
+"""
+Distribution of the time limit of the task (--timeout) among the stages.
+
+The static timeouts (--slicer-timeout, --instrumentation-timeout and
+the time slots of verifiers) are only upper bounds. A stage gets at most
+a share of the time that remains to the timeout, so that the slicer or
+the instrumentation cannot starve the verifiers on hard tasks.
+The share of the slicer grows with the size of the module, because
+slicing pays off more on large modules. The time slots of the verifiers
+(tuned for the time limit of SV-COMP) are scaled to the actual time limit
+and the time that a verifier did not use is handed to the next verifier.
+
+If there is no time limit, the static timeouts are used as they are.
+"""
+
+from math import log10
+
+from . utils import dbg
+from . timeout import time_limit, remaining_time
+from . bitcode import get_instructions_count, BitcodeError
+
+# the time limit for which the time slots of verifiers are tuned
+REFERENCE_TIME_LIMIT = 900
+# the shares of the remaining time for the stages
+INSTRUMENTATION_SHARE = 0.3
+SLICER_MIN_SHARE = 0.1
+SLICER_MAX_SHARE = 0.4
+# do not start slicing if it cannot get at least this many seconds
+SLICER_MIN_TIME = 5
+# the time that is kept for what follows the verification
+# (generating witnesses, replaying errors, ...)
+RESERVE = 0.05
+
+
+def _available():
+    """ The remaining time minus the reserve (None if there is no limit) """
+    remaining = remaining_time()
+    if remaining is None:
+        return None
+    return max(1, remaining - RESERVE * time_limit())
+
+
+def _bound(static, limit):
+    """ Bound the static timeout (0 or None for no timeout) by \\param limit """
+    if limit is None:
+        return static
+    if static:
+        return min(static, limit)
+    return limit
+
+
+def slicer_share(instructions):
+    """
+    The share of the remaining time for slicing the module
+    with \\param instructions instructions (None if unknown)
+    """
+    if not instructions:
+        return SLICER_MIN_SHARE
+    # 0.1 for 100 instructions, 0.4 for 100 000 instructions
+    share = 0.1 * (log10(instructions) - 1)
+    return min(SLICER_MAX_SHARE, max(SLICER_MIN_SHARE, share))
+
+
+def slicer_timeout(static, bitcode):
+    """
+    Return the timeout for slicing the module \\param bitcode
+    where \\param static is the timeout given by the options.
+    Return None if there is not enough time left for slicing.
+    """
+    available = _available()
+    if available is None:
+        return static
+
+    try:
+        instructions = get_instructions_count(bitcode)
+    except (BitcodeError, OSError):
+        instructions = None
+    limit = slicer_share(instructions) * available
+    if limit < SLICER_MIN_TIME:
+        dbg('Only {0:.1f}s left for slicing, skipping it'.format(limit))
+        return None
+    return _bound(static, limit)
+
+
+def instrumentation_timeout(static):
+    """ Return the timeout for instrumentation (\\param static is from options) """
+    available = _available()
+    if available is None:
+        return static
+    return _bound(static, max(1, INSTRUMENTATION_SHARE * available))
+
+
+class VerifierSlots(object):
+    """
+    Time slots of verifiers that run one after another.
+    The time that a verifier did not use from its slot (the slack)
+    is added to the slot of the next verifier.
+    """
+
+    def __init__(self):
+        self._slack = 0
+
+    def timeout(self, slot):
+        """
+        Return the timeout for a verifier with the time slot \\param slot
+        (None if the verifier may run until the timeout of the task)
+        """
+        available = _available()
+        if available is None:
+            return slot
+        if slot is None:
+            return available
+
+        limit = time_limit()
+        if limit < REFERENCE_TIME_LIMIT:
+            slot = slot * limit / REFERENCE_TIME_LIMIT
+        return min(slot + self._slack, available)
+
+    def finished(self, timeout, elapsed):
+        """ A verifier with \\param timeout finished after \\param elapsed seconds """
+        if timeout is None:
+            return
+        self._slack = max(0, timeout - elapsed)
+        if self._slack > 0:
+            dbg('The verifier left {0:.1f}s of its time slot'.format(self._slack))
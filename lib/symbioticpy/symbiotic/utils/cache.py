@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+
+import os
+import json
+from hashlib import sha256 as hashfunc
+from shutil import copyfile
+from tempfile import mkstemp
+
+from . utils import dbg
+
+
+def hash_file(path, hsh=None):
+    """
+    Feed the contents of the file \param path into the hash object
+    \param hsh (or into a new one if it is None) and return the hash object
+    """
+    if hsh is None:
+        hsh = hashfunc()
+
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            hsh.update(chunk)
+
+    return hsh
+
+
+class BitcodeCache(object):
+    """
+    Persistent content-addressed cache of files produced
+    by the stages of the compilation pipeline.
+
+    The key of an entry is derived from the contents of the input files,
+    the name of the stage, the command line that produces the output
+    and a salt (the versions of the components). Paths to the input
+    and output files are not part of the key, so that the entries can be
+    reused from different working directories.
+    """
+
+    def __init__(self, cachedir, salt=''):
+        self._dir = os.path.abspath(cachedir)
+        self._salt = salt
+        # digests of files that we already hashed,
+        # (path, mtime, size) -> digest
+        self._digests = {}
+
+        try:
+            os.makedirs(self._dir, exist_ok=True)
+        except OSError as e:
+            dbg('Failed creating the cache directory: {0}'.format(str(e)))
+
+    def _digest(self, path):
+        st = os.stat(path)
+        key = (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+        digest = self._digests.get(key)
+        if digest is None:
+            digest = hash_file(path).hexdigest()
+            self._digests[key] = digest
+        return digest
+
+    def _normalize_cmd(self, cmd, inputs, output):
+        names = {}
+        for n, path in enumerate(inputs):
+            names[path] = '<input{0}>'.format(n)
+        if output:
+            names[output] = '<output>'
+
+        return [names.get(arg, arg) for arg in cmd]
+
+    def _path(self, key):
+        return os.path.join(self._dir, key[:2], key)
+
+    def key(self, stage, cmd, inputs, output=None):
+        """
+        Compute the key of the output of the stage \param stage
+        that runs \param cmd on \param inputs.
+        Return None if the key cannot be computed (e.g., an input is missing).
+        """
+        hsh = hashfunc()
+        hsh.update(self._salt.encode('utf-8'))
+        hsh.update(b'\0')
+        hsh.update(stage.encode('utf-8'))
+        for arg in self._normalize_cmd(cmd, inputs, output):
+            hsh.update(b'\0')
+            hsh.update(str(arg).encode('utf-8'))
+
+        try:
+            for path in inputs:
+                hsh.update(b'\0')
+                hsh.update(self._digest(path).encode('ascii'))
+        except OSError as e:
+            dbg('Cannot hash the input of {0}: {1}'.format(stage, str(e)))
+            return None
+
+        return hsh.hexdigest()
+
+    def fetch(self, key, output):
+        """
+        Copy the cached entry \param key to \param output.
+        Return True on success, False if the entry is not cached.
+        """
+        if key is None:
+            return False
+
+        path = self._path(key)
+        if not os.path.isfile(path):
+            return False
+
+        try:
+            copyfile(path, output)
+        except OSError as e:
+            dbg('Failed fetching {0} from the cache: {1}'.format(key, str(e)))
+            return False
+
+        dbg("Reusing cached '{0}'".format(os.path.basename(output)))
+        return True
+
+    def store(self, key, output):
+        """
+        Store the file \param output into the cache under the key \param key.
+        Failing to store the file is not an error.
+        """
+        if key is None or not os.path.isfile(output):
+            return
+
+        path = self._path(key)
+        tmp = None
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # write into a temporary file and rename it,
+            # so that concurrent runs never see a partial entry
+            fd, tmp = mkstemp(dir=os.path.dirname(path))
+            os.close(fd)
+            copyfile(output, tmp)
+            os.replace(tmp, path)
+        except OSError as e:
+            dbg('Failed storing {0} into the cache: {1}'.format(key, str(e)))
+            if tmp and os.path.isfile(tmp):
+                os.unlink(tmp)
+
+    def _failure_path(self, key):
+        return self._path(key) + '.failed'
+
+    def store_failure(self, key, info):
+        """
+        Remember that the stage with the key \param key failed
+        (e.g., it timeouted or ran out of memory). \param info
+        is a dictionary with the details that must be serializable to JSON.
+        """
+        if key is None:
+            return
+
+        path = self._failure_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as f:
+                json.dump(info, f)
+        except OSError as e:
+            dbg('Failed storing the failure of {0}: {1}'.format(key, str(e)))
+
+    def fetch_failure(self, key):
+        """
+        Return the details of the previous failure of the stage
+        with the key \param key or None if it did not fail
+        """
+        if key is None:
+            return None
+
+        try:
+            with open(self._failure_path(key), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+
+import os
+import json
+from tempfile import mkstemp
+
+from . utils import dbg
+
+
+def fingerprint(path):
+    """
+    Return the fingerprint of the file \param path that changes
+    whenever the file is modified or replaced (None if it does not exist)
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_ino, st.st_size]
+
+
+def search_dirs(var):
+    """ Return the list of directories in the environment variable \param var """
+    return [d for d in os.environ.get(var, '').split(os.pathsep) if d]
+
+
+class EnvironmentCache(object):
+    """
+    Persistent cache of the results of probing the environment
+    (resolved executables and libraries, versions of components, ...),
+    so that we do not need to spawn the tools on every run.
+
+    Every entry remembers the files that it depends on together with
+    their fingerprints (mtime, inode and size). An entry is valid only
+    while none of these files has changed. Directories can be among
+    the dependencies too, so that we notice when a file is added
+    to a directory from PATH. The whole cache is dropped when the salt
+    (the versions of the components) changes. If \param path is None,
+    the cache lives only in memory.
+    """
+
+    def __init__(self, path=None, salt=''):
+        self._path = path
+        self._salt = salt
+        self._entries = {}
+        self._modified = False
+
+        if path is None:
+            return
+
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+            if data.get('salt') == salt:
+                self._entries = data.get('entries', {})
+            else:
+                dbg('The environment cache is outdated')
+        except (OSError, ValueError, AttributeError):
+            # no cache yet or a broken cache, start from scratch
+            pass
+
+    def get(self, key):
+        """ Return the value stored under \param key or None """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        for path, fp in entry['deps']:
+            if fingerprint(path) != fp:
+                dbg("The environment cache entry '{0}' is outdated ({1} changed)"\
+                    .format(key.replace('\0', ' '), path))
+                del self._entries[key]
+                self._modified = True
+                return None
+
+        return entry['value']
+
+    def put(self, key, value, deps):
+        """
+        Store \param value under \param key. The value must be
+        serializable to JSON and it is valid as long as the files
+        \param deps do not change.
+        """
+        self._entries[key] = {'value': value,
+                              'deps': [[p, fingerprint(p)] for p in deps]}
+        self._modified = True
+
+    def save(self):
+        """ Write the cache to the disk (failing to do so is not an error) """
+        if self._path is None or not self._modified:
+            return
+
+        tmp = None
+        try:
+            os.makedirs(os.path.dirname(self._path), exist_ok=True)
+            # write into a temporary file and rename it,
+            # so that concurrent runs never see a partial cache
+            fd, tmp = mkstemp(dir=os.path.dirname(self._path))
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'salt': self._salt, 'entries': self._entries}, f)
+            os.replace(tmp, self._path)
+            self._modified = False
+        except OSError as e:
+            dbg('Failed storing the environment cache: {0}'.format(str(e)))
+            if tmp and os.path.isfile(tmp):
+                os.unlink(tmp)
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+
+"""
+Reader of the .ktest files generated by KLEE.
+
+The file is memory-mapped and the objects are views into the mapping,
+so reading a test copies neither the names nor the bytes of the objects.
+The views are valid only while the KTest is open. The values of the
+objects that have the size of an integer can be decoded all at once
+(a single unpack of the whole file) by int_values().
+"""
+
+import mmap
+from struct import Struct, unpack_from, error as StructError
+
+from sys import byteorder
+
+
+class KTestError(Exception):
+    pass
+
+
+# the formats of integers by their size (in the native byte order)
+_INT_FORMATS = {1: 'b', 2: 'h', 4: 'i', 8: 'q'}
+_INT_STRUCTS = {size: Struct('=' + fmt) for size, fmt in _INT_FORMATS.items()}
+
+
+class KTestObject(object):
+    """ A symbolic object from a .ktest file """
+
+    __slots__ = ('_buf', '_nameoff', '_namelen', 'offset', 'size')
+
+    def __init__(self, buf, nameoff, namelen, offset, size):
+        self._buf = buf
+        self._nameoff = nameoff
+        self._namelen = namelen
+        # the position of the bytes of the object in the file
+        self.offset = offset
+        self.size = size
+
+    @property
+    def name(self):
+        """ The name of the object (bytes) """
+        return bytes(self._buf[self._nameoff:self._nameoff + self._namelen])
+
+    @property
+    def data(self):
+        """ The memoryview of the bytes of the object """
+        return self._buf[self.offset:self.offset + self.size]
+
+    def int_value(self):
+        """ The value of the object as a signed integer (None if it is not an integer) """
+        st = _INT_STRUCTS.get(self.size)
+        if st is None:
+            return None
+        return st.unpack_from(self._buf, self.offset)[0]
+
+
+class KTest(object):
+    """
+    A memory-mapped .ktest file. Use it as a context manager
+    or call close() once the objects are not needed:
+
+      with KTest(path) as ktest:
+          for obj in ktest.objects:
+              ...
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            try:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # the file is empty
+                raise KTestError('{0}: unrecognized file'.format(path))
+        self._buf = memoryview(self._mmap)
+        try:
+            self.objects = self._parse(path)
+        except (KTestError, StructError) as e:
+            self.close()
+            if isinstance(e, KTestError):
+                raise
+            raise KTestError('{0}: truncated file'.format(path))
+
+    def _parse(self, path):
+        # the format is taken from ktest-tool from KLEE
+        buf = self._buf
+        hdr = bytes(buf[:5])
+        if hdr != b'KTEST' and hdr != b'BOUT\n':
+            raise KTestError('{0}: unrecognized file'.format(path))
+        version, = unpack_from('>i', buf, 5)
+        if version > 3:
+            raise KTestError('{0}: unrecognized version'.format(path))
+
+        pos = 9
+        # skip args
+        numArgs, = unpack_from('>i', buf, pos)
+        pos += 4
+        for _ in range(numArgs):
+            size, = unpack_from('>i', buf, pos)
+            pos += 4 + size
+
+        if version >= 2:
+            # symArgvs and symArgvLen
+            pos += 8
+
+        numObjects, = unpack_from('>i', buf, pos)
+        pos += 4
+        objects = []
+        for _ in range(numObjects):
+            namelen, = unpack_from('>i', buf, pos)
+            nameoff = pos + 4
+            size, = unpack_from('>i', buf, nameoff + namelen)
+            offset = nameoff + namelen + 4
+            if offset + size > len(buf):
+                raise KTestError('{0}: truncated file'.format(path))
+            objects.append(KTestObject(buf, nameoff, namelen, offset, size))
+            pos = offset + size
+        return objects
+
+    def int_values(self, objects=None):
+        """
+        Decode the values of \\param objects (all objects by default)
+        at once. Return the list with the value of every object as
+        a signed integer, or None for the objects that do not have
+        the size of an integer.
+        """
+        if objects is None:
+            objects = self.objects
+
+        # build one format that skips the bytes between
+        # the integers and decode them with a single unpack
+        fmt = ['=']
+        pos = 0
+        ints = []
+        for obj in sorted(objects, key=lambda o: o.offset):
+            code = _INT_FORMATS.get(obj.size)
+            if code is None:
+                continue
+            if obj.offset > pos:
+                fmt.append('{0}x'.format(obj.offset - pos))
+            fmt.append(code)
+            pos = obj.offset + obj.size
+            ints.append(obj)
+
+        values = {}
+        if ints:
+            decoded = unpack_from(''.join(fmt), self._buf, 0)
+            values = {obj.offset: val for obj, val in zip(ints, decoded)}
+        return [values.get(obj.offset) for obj in objects]
+
+    def close(self):
+        for obj in getattr(self, 'objects', ()):
+            obj._buf = None
+        try:
+            self._buf.release()
+            self._mmap.close()
+        except BufferError:
+            # someone still holds a view of an object,
+            # the mapping is unmapped once the view is gone
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+##
+# pretty-printing of objects
+##
+
+def get_repr(obj):
+    """ Run-length encoding of the bytes of \\param obj: [(byte, count), ...] """
+    data = obj.data
+    if len(data) == 0:
+        return ()
+
+    ret = []
+    b = data[0]
+    num = 1
+    for value in data[1:]:
+        if value != b:
+            ret.append((b, num))
+            b = value
+            num = 1
+        else:
+            num += 1
+
+    ret.append((b, num))
+    return ret
+
+
+def is_zero(obj):
+    data = obj.data
+    assert len(data) > 0
+    # check the whole buffer at once instead of byte per byte
+    return int.from_bytes(data, byteorder) == 0
+
+
+def get_nice_repr(obj):
+    val = obj.int_value()
+    if val is None:
+        return ''
+    return 'i{0}: {1}'.format(8 * obj.size, val)
+
+
+def print_object(obj):
+    rep = 'len {0} bytes, ['.format(obj.size)
+    objrepr = get_repr(obj)
+    if objrepr == ():
+        rep += "|"
+
+    l = len(objrepr)
+    for n in range(0, l):
+        value, num = objrepr[n]
+        if num > 1:
+            rep += '{0} times {1}'.format(num, hex(value))
+        else:
+            rep += '{0}'.format(hex(value))
+        if n == l - 1:
+            rep += ']'
+        else:
+            rep += '|'
+    nice_rep = get_nice_repr(obj)
+    if nice_rep:
+        rep += " ({0})".format(nice_rep)
+    print('{0} := {1}'.format(obj.name.decode('ascii'), rep))
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+import re
+
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    # python < 3.11
+    import sre_parse
+
+
+def _search_body(pattern):
+    """
+    Turn a pattern that is used with re.match into a pattern
+    for re.search that matches (at least) the same strings
+    """
+    if pattern.startswith('.*'):
+        body = pattern[2:]
+    else:
+        body = '^' + pattern
+
+    if body.endswith('.*') and not body.endswith('\\.*'):
+        body = body[:-2]
+    return body
+
+
+def _required_literal(pattern):
+    """
+    Return the longest literal string that must be contained in every string
+    that matches \param pattern (may be empty), or None if we cannot tell.
+    Only the top-level sequence of the pattern is inspected,
+    everything in there is mandatory.
+    """
+    if pattern.flags & re.IGNORECASE:
+        return None
+
+    try:
+        parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+    except Exception:
+        return None
+
+    best, cur = '', ''
+    for op, av in parsed:
+        if op is sre_parse.LITERAL:
+            cur += chr(av)
+        else:
+            if len(cur) > len(best):
+                best = cur
+            cur = ''
+    return cur if len(cur) > len(best) else best
+
+
+def _make_filter(patterns):
+    literals = [_required_literal(p) for _, p in patterns]
+    if all(literals):
+        # searching for the plain strings is much faster than
+        # searching for the whole patterns
+        return re.compile('|'.join(map(re.escape, literals)))
+
+    return re.compile('|'.join('(?:{0})'.format(_search_body(p.pattern))
+                               for _, p in patterns))
+
+
+class PatternSet(object):
+    """
+    Ordered list of pairs (key, compiled regular expression) that classify
+    lines of output. The expressions are matched with re.match
+    and the first pattern that matches a line wins.
+
+    Most of the lines match no pattern, so all the patterns are first
+    tried at once by one combined regular expression (that searches
+    for the strings that the patterns require) and only the lines
+    that pass this filter are matched against the single patterns.
+    """
+
+    def __init__(self, patterns):
+        self._patterns = patterns
+        self._filter = _make_filter(patterns)
+
+    def __iter__(self):
+        return iter(self._patterns)
+
+    def match(self, line):
+        """
+        Return the key of the first pattern that matches \param line,
+        or None if no pattern matches
+        """
+        if not self._filter.search(line):
+            return None
+
+        for (key, pattern) in self._patterns:
+            if pattern.match(line):
+                return key
+        return None
@@ -1,11 +1,15 @@
 #!/usr/bin/env python3
 
+import os
 from subprocess import Popen, PIPE, STDOUT
 from . utils import dbg, print_stderr
 from . watch import ProcessWatch
 from .. import SymbioticException
 from signal import SIGKILL, SIGTERM
-from os import killpg, setpgid
+from os import killpg, setpgid, read as os_read
+from threading import Lock
+from selectors import DefaultSelector, EVENT_READ
+from time import monotonic, sleep
 
 try:
     from benchexec.util import find_executable
@@ -13,87 +17,391 @@ except ImportError:
     from symbiotic.benchexec.util import find_executable
 
 
+class ProcessUsage(object):
+    """
+    Resources consumed by a finished process (as reported by wait4).
+    This includes the children of the process that it waited for,
+    but not the children that were left running when it finished.
+    """
+
+    def __init__(self, rusage, wall):
+        self.wall = wall
+        self.user = rusage.ru_utime
+        self.sys = rusage.ru_stime
+        self.maxrss_kb = rusage.ru_maxrss
+        self.minflt = rusage.ru_minflt
+        self.majflt = rusage.ru_majflt
+        self.nvcsw = rusage.ru_nvcsw
+        self.nivcsw = rusage.ru_nivcsw
+
+    def cpu(self):
+        return self.user + self.sys
+
+    def as_dict(self):
+        return {'wall': self.wall, 'user': self.user, 'sys': self.sys,
+                'maxrss_kb': self.maxrss_kb,
+                'minflt': self.minflt, 'majflt': self.majflt,
+                'nvcsw': self.nvcsw, 'nivcsw': self.nivcsw}
+
+    def __str__(self):
+        return 'wall {0:.2f}s, cpu {1:.2f}s (user {2:.2f}s, sys {3:.2f}s), '\
+               'maxrss {4} kB'.format(self.wall, self.cpu(), self.user,
+                                      self.sys, self.maxrss_kb)
+
+
+class ExitStatus(int):
+    """
+    The exit status of a process as returned by ProcessRunner.run().
+    It compares as the plain integer status and carries the resources
+    consumed by the process in the attribute 'usage'.
+    """
+
+    def __new__(cls, status, usage=None):
+        obj = int.__new__(cls, status)
+        obj.usage = usage
+        return obj
+
+
+def _exit_code(status):
+    """ Translate the status from wait() to the code as Popen.returncode does """
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def _wait_exited(pid, timeout):
+    """
+    Wait until the child \param pid exits, but at most \param timeout
+    seconds. The child is not reaped. Return False on timeout.
+    """
+    try:
+        fd = os.pidfd_open(pid)
+    except (AttributeError, OSError):
+        # no pidfd (old Python or kernel), poll
+        deadline = monotonic() + timeout
+        delay = 0.001
+        while os.waitid(os.P_PID, pid,
+                        os.WEXITED | os.WNOHANG | os.WNOWAIT) is None:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                return False
+            sleep(min(delay, remaining))
+            delay = min(2 * delay, 0.05)
+        return True
+
+    try:
+        with DefaultSelector() as selector:
+            selector.register(fd, EVENT_READ)
+            return bool(selector.select(timeout))
+    finally:
+        os.close(fd)
+
+
 class ProcessRunner(object):
-    # we have one global process so that we can kill it anytime
-    # (there's always at most one process running anyway)
-    current_process = None
+    """
+    Run a process and pass its output to a watch.
+
+    Every instance supervises (at most) one child process at the time,
+    but any number of instances can run their children concurrently
+    (e.g., from different threads). Each child runs in its own process
+    group and is registered in a class-wide registry, so that all the
+    children (and their children) can be terminated or killed at once,
+    e.g., on timeout or signal.
 
-    def run(self, cmd, watch = ProcessWatch()):
+    The children are reaped with wait4(), so that we know the resources
+    that they consumed. The usage of the last finished process
+    is in the attribute 'usage' and it is passed to the watch too.
+    """
+
+    # the exit status of a process that was killed because it timeouted
+    # (the same as the status of the 'timeout' utility)
+    TIMEOUT_STATUS = 124
+    # how long to wait after SIGTERM before killing a timeouted process
+    KILL_AFTER = 2
+    # how much of the output we read at once
+    CHUNK_SIZE = 1 << 16
+
+    # the registry of running children: process group id -> runner
+    _registry = {}
+    _lock = Lock()
+
+    def __init__(self):
+        self._process = None
+        self._stopped = False
+        self._timeouted = False
+        self._stopping = False
+        self._deadline = None
+        self.usage = None
+
+    @staticmethod
+    def running():
+        """ Return the list of runners that have a running process """
+        with ProcessRunner._lock:
+            return list(ProcessRunner._registry.values())
+
+    @staticmethod
+    def terminate_all():
+        """
+        Send SIGTERM to all running children.
+        Return the number of children that were still running.
+        """
+        return ProcessRunner._signal_all(SIGTERM)
+
+    @staticmethod
+    def kill_all():
+        """
+        Send SIGKILL to all running children.
+        Return the number of children that were still running.
+        """
+        return ProcessRunner._signal_all(SIGKILL)
+
+    @staticmethod
+    def _signal_all(sig):
+        num = 0
+        with ProcessRunner._lock:
+            for runner in ProcessRunner._registry.values():
+                if runner._signal_locked(sig):
+                    num += 1
+        return num
+
+    def run(self, cmd, watch = ProcessWatch(), cwd = None, timeout = None):
         """
         Run command cmd and pass its stdout+stderr output
         to the watch object. watch object is supposed to be
-        an instance of ProcessWatch object.
+        an instance of ProcessWatch object. The command
+        is run in the directory \param cwd if it is given.
+        If \param timeout is set (to a number of seconds),
+        the process is terminated after that time.
 
-        \return return code of the process or None when the
-        process has been stopped by the watch object
+        \return return code of the process, TIMEOUT_STATUS if the process
+        timeouted, or None when the process has been stopped
+        by the watch object or by stop(). The returned status
+        is an ExitStatus that carries the usage of resources.
         """
 
         assert isinstance(watch, ProcessWatch)
         # we executed another process while the previous one is still running
-        assert ProcessRunner.current_process is None
+        assert self._process is None
 
         dbg('|> {0}'.format(' '.join(map(str, cmd))), prefix='', color='CYAN')
 
-        # run the command and store the handle into the class attribute
-        # current_process, so that we can easily kill this process
-        # on timeout or signal. This way we can run only one
-        # process at the time, but we don't need more (yet?)
-        try:
-            # create a new process group before performing exec so that we can
-            # kill every child this process will create as well
-            # (assuming that they won't create their own process groups)
-            def newpgrp():
-                # sets the subprocess pid as a pgid of the new process group
-                return setpgid(0, 0)
-            ProcessRunner.current_process = Popen(cmd, stdout=PIPE,
-                                                  stderr=STDOUT,
-                                                  preexec_fn=newpgrp)
-        except OSError as e:
-            msg = ' '.join(cmd) + '\n'
-            raise SymbioticException(msg + str(e))
-
-        for line in ProcessRunner.current_process.stdout:
-            if line == b'':
-                break
-
-            watch.putLine(line)
-            if not watch.ok():
-                # watch told us to kill the process for some reason
-                ProcessRunner.current_process.terminate()
-                ProcessRunner.current_process.kill()
-                ProcessRunner.current_process = None
+        # run the command and register this runner, so that we can
+        # easily kill the process on timeout or signal
+        with ProcessRunner._lock:
+            if self._stopped:
+                watch.finish()
                 return None
+            try:
+                # create a new process group before performing exec so that we can
+                # kill every child this process will create as well
+                # (assuming that they won't create their own process groups)
+                def newpgrp():
+                    # sets the subprocess pid as a pgid of the new process group
+                    return setpgid(0, 0)
+                self._process = Popen(cmd, stdout=PIPE, stderr=STDOUT,
+                                      preexec_fn=newpgrp, cwd=cwd)
+            except OSError as e:
+                watch.finish()
+                msg = ' '.join(cmd) + '\n'
+                raise SymbioticException(msg + str(e))
+            ProcessRunner._registry[self._process.pid] = self
 
-        status = ProcessRunner.current_process.wait()
-        ProcessRunner.current_process = None
+        process = self._process
+        self._timeouted = False
+        self._stopping = False
+        self._deadline = None
+        self.usage = None
+        started = monotonic()
+        if timeout and timeout > 0:
+            self._deadline = started + timeout
 
+        status = None
+        try:
+            watched = self._pump(process, watch)
+            if not watched:
+                # watch told us to kill the process for some reason
+                self.kill()
+            status = self._wait(process, started)
+        finally:
+            if status is None:
+                # we are leaving because of an exception (e.g., a signal),
+                # do not leave the process running
+                self.kill()
+                process.wait()
+            process.stdout.close()
+            watch.finish()
+            with ProcessRunner._lock:
+                del ProcessRunner._registry[process.pid]
+                self._process = None
+
+        watch.setUsage(self.usage)
+        if self._stopped or not watched:
+            return None
+        if self._timeouted and not self._stopping:
+            dbg('The process timeouted after {0} sec'.format(timeout))
+            return ExitStatus(ProcessRunner.TIMEOUT_STATUS, self.usage)
         return status
 
+    def stop_after(self, seconds):
+        """
+        Terminate the process after \param seconds (unless it finishes
+        earlier or timeouts before). In contrast to timeout, run()
+        returns the status of the terminated process.
+        It must be called from the watch of the process.
+        """
+        deadline = monotonic() + seconds
+        if self._deadline is None or deadline < self._deadline:
+            self._deadline = deadline
+            self._stopping = True
+
+    def _pump(self, process, watch):
+        """
+        Read the output of the process in large chunks and pass it
+        to the watch in batches of lines. Return False if the watch
+        wants us to stop the process.
+        """
+        fd = process.stdout.fileno()
+        # the incomplete last line
+        pending = []
+        with DefaultSelector() as selector:
+            selector.register(fd, EVENT_READ)
+            while True:
+                remaining = self._remaining()
+                if remaining == 0:
+                    self._expired()
+                    continue
+                if not selector.select(remaining):
+                    continue
+
+                data = os_read(fd, ProcessRunner.CHUNK_SIZE)
+                if not data:
+                    break
+                if b'\n' not in data:
+                    pending.append(data)
+                    continue
+
+                if pending:
+                    pending.append(data)
+                    data = b''.join(pending)
+                lines = data.split(b'\n')
+                last = lines.pop()
+                pending = [last] if last else []
+
+                watch.putLines([line + b'\n' for line in lines])
+                if not watch.ok():
+                    return False
+
+        if pending:
+            watch.putLines([b''.join(pending)])
+            return watch.ok()
+        return True
+
+    def _wait(self, process, started):
+        """
+        Wait for the process (respecting the deadline), reap it
+        and return its ExitStatus
+        """
+        pid = process.pid
+        while True:
+            remaining = self._remaining()
+            if remaining == 0:
+                self._expired()
+                continue
+            if remaining is None:
+                # block until the process exits, but do not reap it yet
+                os.waitid(os.P_PID, pid, os.WEXITED | os.WNOWAIT)
+            elif not _wait_exited(pid, remaining):
+                continue
+            break
+
+        # the process is a zombie now, so this does not block. Reap it
+        # under the lock, so that nobody sends signals to a reaped pid
+        with ProcessRunner._lock:
+            _, status, rusage = os.wait4(pid, 0)
+            process.returncode = _exit_code(status)
+        self.usage = ProcessUsage(rusage, monotonic() - started)
+        dbg('|> {0}'.format(self.usage), prefix='', color='DARK_GRAY')
+        return ExitStatus(process.returncode, self.usage)
+
+    def _remaining(self):
+        """ The time to the deadline of the process (None if there is none) """
+        if self._deadline is None:
+            return None
+        return max(0, self._deadline - monotonic())
+
+    def _expired(self):
+        if not self._timeouted:
+            self._timeouted = self._signal(SIGTERM)
+            # if the process ignores SIGTERM, kill it after a while
+            self._deadline = monotonic() + ProcessRunner.KILL_AFTER
+        else:
+            self._signal(SIGKILL)
+            self._deadline = None
+
+    def stop(self):
+        """
+        Stop the process of this runner (or do not start it at all
+        if it has not been started yet). Can be called from another thread.
+        """
+        with ProcessRunner._lock:
+            self._stopped = True
+        self.terminate()
+
+    def isStopped(self):
+        return self._stopped
+
+    def timeouted(self):
+        return self._timeouted
+
+    def _signal_locked(self, sig):
+        # do not use poll() here, it would reap the process
+        # and we would lose its usage of resources
+        process = self._process
+        if process is None or process.returncode is not None:
+            return False
+        try:
+            killpg(process.pid, sig)
+        except ProcessLookupError:
+            return False
+        return True
+
+    def _signal(self, sig):
+        # the process may finish concurrently, so check
+        # and send the signal under the lock
+        with ProcessRunner._lock:
+            return self._signal_locked(sig)
+
     def hasProcess(self):
-        return ProcessRunner.current_process is not None
+        return self._process is not None
 
     def terminate(self):
-        assert self.hasProcess()
-        if self.exitStatus() is None:
-            killpg(ProcessRunner.current_process.pid, SIGTERM)
+        self._signal(SIGTERM)
 
     def kill(self):
-        assert self.hasProcess()
-        if self.exitStatus() is None:
-            killpg(ProcessRunner.current_process.pid, SIGKILL)
+        self._signal(SIGKILL)
 
     def exitStatus(self):
-        assert self.hasProcess()
-        return ProcessRunner.current_process.poll()
+        with ProcessRunner._lock:
+            if self._process is None:
+                return None
+            return self._process.returncode
 
-def runcmd(cmd, watch = ProcessWatch(), err_msg = ""):
+def runcmd(cmd, watch = ProcessWatch(), err_msg = "", runner = None):
+    """
+    Run cmd and raise SymbioticException with \param err_msg if it fails.
+    The command is run by \param runner if it is given (so that it can
+    be stopped from another thread).
+    """
     ## if the binary does not have absolute path, tell us which binary it is
     #if cmd[0][0] != '/':
     #    dbg("'{0}' is '{1}'".format(cmd[0], find_executable(cmd[0])), color='DARK_GRAY')
-    process = ProcessRunner()
-    if process.run(cmd, watch) != 0:
+    process = runner or ProcessRunner()
+    status = process.run(cmd, watch)
+    if status != 0:
         for line in watch.getLines():
             print_stderr(line.decode('utf-8'),
                          color='RED', print_nl=False)
         raise SymbioticException(err_msg)
+    # the status carries the usage of resources
+    return status
 
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+
+"""
+Telemetry of the stages of Symbiotic (compilation, opt runs,
+instrumentation, slicing, linking, verifiers, ...).
+
+For every stage, we record the wall time, the CPU time of Symbiotic
+and of the child processes, the peak memory of the children
+and the sizes and numbers of instructions of the input
+and output bitcode files. The report is a JSON file.
+
+The resources of the children are those reported by wait4() for the
+processes that the stage ran (see ProcessUsage), so they are exact
+even if several stages run concurrently (e.g., verifiers in a portfolio).
+The peak memory is null if the stage did not run any process
+(e.g., its output was taken from the cache).
+"""
+
+import os
+import json
+from time import time, monotonic
+from threading import Lock
+from resource import getrusage, RUSAGE_SELF, RUSAGE_CHILDREN
+
+from . utils import dbg
+from . bitcode import get_instructions_count, BitcodeError
+
+_enabled = False
+_lock = Lock()
+_stages = []
+_start = time()
+
+
+def start_telemetry():
+    """ Start recording the stages (forget what was recorded before) """
+    global _enabled, _start
+    with _lock:
+        _enabled = True
+        _start = time()
+        del _stages[:]
+
+
+def telemetry_enabled():
+    return _enabled
+
+
+def _file_info(path):
+    info = {'path': path}
+    try:
+        info['size'] = os.path.getsize(path)
+    except OSError:
+        return info
+
+    try:
+        info['instructions'] = get_instructions_count(path)
+    except (BitcodeError, OSError):
+        # not a bitcode (or not a bitcode that we can read)
+        pass
+    return info
+
+
+class Stage(object):
+    """
+    Context manager that records one stage:
+
+      with Stage('opt', [infile], passes=passes) as stage:
+          ...
+          stage.output = outfile
+
+    Extra information about the stage can be added to stage.info
+    and the usage of resources of the processes that the stage ran
+    is added by add_usage(). If the telemetry is not enabled,
+    it does nothing.
+    """
+
+    def __init__(self, name, inputs=[], **info):
+        self.name = name
+        self.inputs = inputs
+        self.output = None
+        self.info = info
+        self._usages = []
+
+    def add_usage(self, usage):
+        """ Account the ProcessUsage \param usage to this stage """
+        if usage is not None:
+            self._usages.append(usage)
+
+    def __enter__(self):
+        if _enabled:
+            self._wall = monotonic()
+            self._start = time()
+            self._self = getrusage(RUSAGE_SELF)
+            # the files may be overwritten during the stage
+            self._inputs = [_file_info(p) for p in self.inputs if p]
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if not _enabled:
+            return False
+
+        wall = monotonic() - self._wall
+        selfusage = getrusage(RUSAGE_SELF)
+        usages = self._usages
+
+        record = {'stage': self.name,
+                  'start': self._start - _start,
+                  'wall': wall,
+                  'cpu_self': (selfusage.ru_utime - self._self.ru_utime) +\
+                              (selfusage.ru_stime - self._self.ru_stime),
+                  'cpu_children_user': sum(u.user for u in usages),
+                  'cpu_children_sys': sum(u.sys for u in usages),
+                  'children_maxrss_kb': max((u.maxrss_kb for u in usages),
+                                            default=None),
+                  'processes': [u.as_dict() for u in usages],
+                  'inputs': self._inputs,
+                  'output': _file_info(self.output) if self.output else None,
+                  'status': 'ok' if exc_type is None else 'failed'}
+        record.update(self.info)
+
+        with _lock:
+            _stages.append(record)
+        return False
+
+
+def stages():
+    """ Return the list of records of the finished stages """
+    with _lock:
+        return list(_stages)
+
+
+def write_report(path, **info):
+    """
+    Write the report with all the stages recorded so far into \\param path.
+    \\param info are added into the report (e.g., the result).
+    """
+    selfusage = getrusage(RUSAGE_SELF)
+    children = getrusage(RUSAGE_CHILDREN)
+    report = {'wall': time() - _start,
+              'cpu_self': selfusage.ru_utime + selfusage.ru_stime,
+              'cpu_children': children.ru_utime + children.ru_stime,
+              'children_maxrss_kb': children.ru_maxrss,
+              'stages': stages()}
+    report.update(info)
+
+    try:
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=1)
+    except OSError as e:
+        dbg('Failed writing the telemetry report: {0}'.format(str(e)))
@@ -1,21 +1,46 @@
 #!/usr/bin/env python3
 
 import signal
+from time import monotonic
 
 
 class Timeout(Exception):
     pass
 
+# the time limit that is running (seconds) and when it expires
+_limit = None
+_deadline = None
+
 
 def start_timeout(sec):
+    global _limit, _deadline
+
     def alarm_handler(signum, data):
         raise Timeout
 
     signal.signal(signal.SIGALRM, alarm_handler)
     signal.alarm(sec)
+    _limit = sec
+    _deadline = monotonic() + sec
 
 
 def stop_timeout():
+    global _limit, _deadline
+
     # turn of timeout
     signal.signal(signal.SIGALRM, signal.SIG_DFL)
     signal.alarm(0)
+    _limit = None
+    _deadline = None
+
+
+def time_limit():
+    """ Return the time limit that is running or None if there is none """
+    return _limit
+
+
+def remaining_time():
+    """ Return the seconds remaining to the timeout or None if there is none """
+    if _deadline is None:
+        return None
+    return max(0, _deadline - monotonic())
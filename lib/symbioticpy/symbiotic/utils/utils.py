@@ -3,7 +3,6 @@
 import sys
 import os
 from time import time
-from distutils.version import LooseVersion
 
 COLORS = {
     'DARK_BLUE': '\033[0;34m',
@@ -119,6 +118,14 @@ def print_elapsed_time(msg, color=None):
     last_time = time()
 
 
+def available_cpus():
+    """ The number of CPUs that we may run on """
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
 def get_symbiotic_dir():
     # get real path (strip off links)
     realpath = os.path.realpath(os.path.join(sys.argv[0], '..'))
@@ -3,22 +3,79 @@
 from . utils import dbg
 
 
+class SpilledLines(object):
+    """
+    Read-only sequence of lines of output that were spilled into a file.
+    The last lines are kept in memory, the rest is read from the file
+    only when it is needed.
+    """
+
+    def __init__(self, path, num, tail):
+        self._path = path
+        self._num = num
+        self._tail = tail
+
+    def __len__(self):
+        return self._num
+
+    def __bool__(self):
+        return self._num > 0
+
+    def __iter__(self):
+        if self._num == len(self._tail):
+            yield from self._tail
+            return
+
+        with open(self._path, 'rb') as f:
+            for n, line in enumerate(f):
+                if n >= self._num:
+                    break
+                yield line
+
+    def __getitem__(self, idx):
+        if isinstance(idx, int):
+            if idx < 0:
+                idx += self._num
+            if idx < 0 or idx >= self._num:
+                raise IndexError('line index out of range')
+            tailstart = self._num - len(self._tail)
+            if idx >= tailstart:
+                return self._tail[idx - tailstart]
+        return list(self)[idx]
+
+    def __contains__(self, line):
+        return any(line == l for l in self)
+
+
 class ProcessWatch(object):
     """ Parse output of running process """
 
-    def __init__(self, lines_limit=0):
+    def __init__(self, lines_limit=0, spill=None):
         """
         Initialize a watch. By default, do not store
         any output of the process. If \param buffer_lines
         is set to non-0 value, this watch will store
         the lines of output maximally up to \param buffer_lines,
-        or will store everything when \param buffer_lines is None
+        or will store everything when \param buffer_lines is None.
+        If \param spill is a path to a file, the whole output
+        is written into that file (and getLines() returns all the lines
+        while only the last lines_limit lines are kept in memory).
         """
         self._maxlines = lines_limit
+        self._spill = None
+        self._spillpath = spill
+        self._numlines = 0
+        # the resources consumed by the process (set when it finishes)
+        self.usage = None
 
         if self.isBuffering():
             from collections import deque
             self.buff = deque(maxlen=lines_limit)
+        if spill:
+            self._spill = open(spill, 'wb')
+
+        # do not call parse() if it does nothing
+        self._parses = type(self).parse is not ProcessWatch.parse
 
     def isBuffering(self):
         return self._maxlines is None or self._maxlines > 0
@@ -27,10 +84,22 @@ class ProcessWatch(object):
         """
         Put a line from a process' output to the watch
         """
+        self.putLines((line,))
+
+    def putLines(self, lines):
+        """
+        Put a batch of lines from a process' output to the watch
+        """
         if self.isBuffering():
-            self.buff.append(line)
+            self.buff.extend(lines)
+        if self._spill:
+            self._spill.writelines(lines)
+            self._numlines += len(lines)
 
-        self.parse(line)
+        if self._parses:
+            parse = self.parse
+            for line in lines:
+                parse(line)
 
     def parse(self, line):
         """
@@ -44,17 +113,40 @@ class ProcessWatch(object):
         """
         Get buffered lines
         """
+        if self._spillpath:
+            if self._spill:
+                self._spill.flush()
+            tail = list(self.buff) if self.isBuffering() else []
+            return SpilledLines(self._spillpath, self._numlines, tail)
         if self.isBuffering():
             return list(self.buff)
         else:
             return []
 
+    def finish(self):
+        """
+        Called when the process finished (or could not be run),
+        no lines are put into the watch after that
+        """
+        if self._spill:
+            self._spill.close()
+            self._spill = None
+
+    def setUsage(self, usage):
+        """
+        Called when the process finished with the resources that
+        it consumed (ProcessUsage, or None if they are unknown)
+        """
+        self.usage = usage
+
     def ok(self):
         """
         Return True if everyithing is ok with the process,
         or False if anything went wrong (based on the process' output).
         In case that this method returns False, run() method
-        will terminate the process and return -1
+        will terminate the process and return -1.
+        The output is passed to the watch in batches, so this method
+        is called after every batch of lines, not after every line.
         """
         return True
 
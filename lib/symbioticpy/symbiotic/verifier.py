@@ -1,12 +1,19 @@
 #!/usr/bin/env python3
 
 import sys
+import os
+from shutil import copyfile
+from threading import Thread, Lock
+from queue import Queue
+from time import monotonic
 
 from . utils import dbg
 from . utils import dbg, print_elapsed_time, restart_counting_time
 from . utils.process import runcmd, ProcessRunner
 from . utils.watch import ProcessWatch, DbgWatch
 from . utils.utils import print_stderr, print_stdout
+from . utils.telemetry import Stage
+from . utils.budget import VerifierSlots
 from . exceptions import SymbioticException, SymbioticExceptionalResult
 
 def initialize_verifier(opts):
@@ -17,21 +24,76 @@ def initialize_verifier(opts):
         raise SymbioticException('Unknown verifier: {0}'.format(opts.tool_name))
 
 class ToolWatch(ProcessWatch):
-    def __init__(self, tool):
-        # store the whole output of a tool
-        ProcessWatch.__init__(self, None)
+    # how many last lines of the output we keep in memory
+    TAIL_LINES = 1000
+
+    def __init__(self, tool, logfile=None, on_verdict=None):
+        # store the whole output of a tool, either in memory
+        # or in the log file (keeping only the tail in memory)
+        ProcessWatch.__init__(self, ToolWatch.TAIL_LINES if logfile else None,
+                              spill=logfile)
         self._tool = tool
+        self._decide = getattr(tool, 'decisive_result', None)
+        self._on_verdict = on_verdict
+        # the result that the tool decided while it was running
+        self.verdict = None
 
     def parse(self, line):
         if b'ERROR' in line or b'WARN' in line or b'Assertion' in line\
            or b'error' in line or b'warn' in line:
-            line = line.decode('utf-8', 'replace')
-            sys.stderr.write(line)
+            sys.stderr.write(line.decode('utf-8', 'replace'))
         else:
             # characters on which decode fails
             msg = line.decode('utf-8', 'replace')
             dbg(msg, 'all', print_nl=msg[-1] != '\n', prefix='', color=None)
 
+        if self.verdict is None and self._decide:
+            # the same (bytes) line that determine_result() gets
+            self.verdict = self._decide(line)
+            if self.verdict and self._on_verdict:
+                self._on_verdict(self.verdict)
+
+class PortfolioJob(object):
+    """
+    A verifier of a portfolio that runs in its own thread
+    """
+
+    def __init__(self, tool, params, timeout, bitcode):
+        self.tool = tool
+        self.params = params
+        self.timeout = timeout
+        # the copy of the bitcode in the working directory of this job
+        self.bitcode = bitcode
+        self.runner = ProcessRunner()
+        self.thread = None
+        self.result = None
+        self.exception = None
+        # (priority, verifier) of this job in the portfolio
+        self.entry = None
+
+    def _run(self, verifier, finished, on_verdict):
+        try:
+            self.result = verifier._run_verifier(self.tool, self.params,
+                                                 self.timeout,
+                                                 bitcode=self.bitcode,
+                                                 runner=self.runner,
+                                                 cwd=os.path.dirname(self.bitcode),
+                                                 on_verdict=lambda _: on_verdict(self))
+        except Exception as e:
+            self.exception = e
+        finished.put(self)
+
+    def start(self, verifier, finished, on_verdict):
+        """
+        Run the job, put the job into the queue \param finished
+        once it is done. \param on_verdict is called with the job
+        when the verifier decides the result while running.
+        """
+        self.thread = Thread(target=self._run,
+                             args=(verifier, finished, on_verdict),
+                             daemon=True)
+        self.thread.start()
+
 class SymbioticVerifier(object):
     """
     Instance of symbiotic tool. Instruments, prepares, compiles and runs
@@ -55,6 +117,35 @@ class SymbioticVerifier(object):
         # tool to use
         self._tool = tool
 
+        # the directory where the verifiers run (None for the current one)
+        self.cwd = None
+
+        # the runners of the verifiers that are running, see stop()
+        self._runners = []
+        self._stopped = False
+        self._lock = Lock()
+
+    def stop(self):
+        """
+        Stop the verification (the running verifiers and the verifiers
+        that would run next). Can be called from another thread.
+        """
+        with self._lock:
+            self._stopped = True
+            runners = list(self._runners)
+        for runner in runners:
+            runner.stop()
+
+    def kill(self):
+        """ Kill the running verifiers """
+        with self._lock:
+            runners = list(self._runners)
+        for runner in runners:
+            runner.kill()
+
+    def isStopped(self):
+        return self._stopped
+
     def command(self, cmd):
         return runcmd(cmd, DbgWatch('all'),
                       "Failed running command: {0}".format(" ".join(cmd)))
@@ -75,42 +166,200 @@ class SymbioticVerifier(object):
         runcmd(cmd, DbgWatch('all'), 'Running opt failed')
         self.curfile = output
 
-    def _run_tool(self, tool, prp, params, timeout):
-        cmd = []
-        if timeout:
-            cmd = ['timeout', str(int(timeout))]
-        cmd += tool.cmdline(tool.executable(), params,
-                            [self.curfile], prp, [])
-        watch = ToolWatch(tool)
-        process = ProcessRunner()
-
-        returncode = process.run(cmd, watch)
-        if returncode != 0:
-            dbg('The verifier return non-0 return status')
-
-        res = tool.determine_result(returncode, 0,
-                                    watch.getLines(),
-                                    False)
+    def _run_tool(self, tool, prp, params, timeout,
+                  bitcode=None, runner=None, cwd=None, on_verdict=None):
+        cwd = cwd or self.cwd
+        executable = tool.executable()
+        if cwd and os.sep in executable:
+            executable = os.path.abspath(executable)
+        cmd = tool.cmdline(executable, params,
+                           [bitcode or self.curfile], prp, [])
+        logfile = os.path.join(cwd or os.getcwd(),
+                               '{0}-output.log'.format(tool.name()))
+        process = runner or ProcessRunner()
+        with self._lock:
+            if self._stopped:
+                process.stop()
+            self._runners.append(process)
+
+        def decided(verdict):
+            print_stdout('INFO: {0} decided {1}'.format(tool.name(), verdict),
+                         color='WHITE')
+            if self.options.stop_on_verdict is not None:
+                process.stop_after(self.options.stop_on_verdict)
+            if on_verdict:
+                on_verdict(verdict)
+
+        watch = ToolWatch(tool, logfile, decided)
+
+        with Stage('verifier', [bitcode or self.curfile],
+                   tool=tool.name(), params=params) as stage:
+            try:
+                returncode = process.run(cmd, watch, cwd, timeout)
+            finally:
+                with self._lock:
+                    self._runners.remove(process)
+            stage.add_usage(process.usage)
+            stage.info['exit_status'] = returncode
+            if process.isStopped():
+                # someone else already decided the result
+                stage.info['result'] = 'unknown (stopped)'
+                return 'unknown (stopped)'
+            if returncode != 0:
+                dbg('The verifier return non-0 return status')
+
+            res = tool.determine_result(returncode, 0,
+                                        watch.getLines(),
+                                        False)
+            stage.info['result'] = res
         if res.lower().startswith('error'):
             for line in watch.getLines():
                 print_stderr(line.decode('utf-8', 'replace'),
                              color='RED', print_nl=False)
         return res
 
-    def _run_verifier(self, tool, addparams, timeout):
+    def _run_verifier(self, tool, addparams, timeout, **kwargs):
         params = self.override_params or self.options.tool_params
         if addparams:
             params = params + addparams
         prp = self.options.property.getPrpFile()
-        return self._run_tool(tool, prp, params, timeout)
+        if prp and kwargs.get('cwd'):
+            prp = os.path.abspath(prp)
+        return self._run_tool(tool, prp, params, timeout, **kwargs)
+
+    def _portfolio_workdir(self, num, tool):
+        """
+        Create a working directory for the num-th verifier of the portfolio
+        with a copy of the bitcode, so that the outputs of the verifiers
+        (e.g., klee-last) do not clash. Return the path to the copied bitcode.
+        """
+        workdir = os.path.join(os.path.dirname(os.path.abspath(self.curfile)),
+                               'portfolio', '{0}-{1}'.format(num, tool.name()))
+        os.makedirs(workdir, exist_ok=True)
+        bitcode = os.path.join(workdir, os.path.basename(self.curfile))
+        if os.path.exists(bitcode):
+            os.unlink(bitcode)
+        try:
+            os.link(self.curfile, bitcode)
+        except OSError:
+            copyfile(self.curfile, bitcode)
+        return bitcode
+
+    def _run_portfolio(self, verifiers, jobs):
+        """
+        Run the verifiers concurrently, at most \param jobs at once.
+        The verifiers are started in the given order (i.e., the order
+        is their priority). The first true/false answer wins and
+        the verifiers that are still running are stopped. With
+        --stop-on-verdict, the verifiers are stopped already when
+        a verifier decides the result while running. If its final answer
+        is not true/false, the stopped verifiers are run again.
+        """
+        print_stdout('INFO: Running {0} verifiers, {1} at once'.format(len(verifiers), jobs),
+                     color='WHITE')
+
+        finished = Queue()
+        running = []
+        pending = list(enumerate(verifiers))
+        # the verifiers run concurrently, so there is no slack to pass on
+        slots = VerifierSlots()
+
+        # the jobs that decided the result while running
+        decisive = []
+        # the jobs stopped because of a decided result, and the verifiers
+        # of those that finished meanwhile (to be run again if the result
+        # is not confirmed once its job finishes)
+        preempted = []
+        stopped = []
+        lock = Lock()
+
+        def decided(winner):
+            # the verifiers that run concurrently with the winner
+            # are not needed anymore
+            if self.options.stop_on_verdict is None:
+                return
+            with lock:
+                decisive.append(winner)
+                for job in list(running):
+                    if job is not winner and job not in preempted:
+                        preempted.append(job)
+                        job.runner.stop()
+
+        res = None
+        try:
+            while pending or running:
+                with lock:
+                    while pending and len(running) < jobs and not decisive:
+                        num, verifier = pending.pop(0)
+                        tool, addparams, timeout = verifier
+                        if not self.options.static_timeouts:
+                            timeout = slots.timeout(timeout)
+                        job = PortfolioJob(tool, addparams, timeout,
+                                           self._portfolio_workdir(num, tool))
+                        job.entry = (num, verifier)
+                        running.append(job)
+                        job.start(self, finished, decided)
+                    if not running:
+                        # nothing runs and nothing can be started
+                        break
+
+                job = finished.get()
+                with lock:
+                    running.remove(job)
+                    if job in decisive:
+                        decisive.remove(job)
+                if job.exception is not None:
+                    raise job.exception
+
+                res = job.result
+                sw = res.lower().startswith
+                if sw('true') or sw('false'):
+                    self.curfile = job.bitcode
+                    return res, job.tool
+
+                with lock:
+                    if job in preempted:
+                        preempted.remove(job)
+                        stopped.append(job.entry)
+                    else:
+                        print_stdout('{0} answered {1}'.format(job.tool.name(), res))
+                    if not decisive and stopped:
+                        # the decided result was not confirmed,
+                        # run the stopped verifiers again
+                        dbg('Restarting the verifiers stopped by an unconfirmed verdict')
+                        pending = sorted(stopped + pending, key=lambda e: e[0])
+                        stopped = []
+        finally:
+            for job in running:
+                job.runner.stop()
+            # give the verifiers a moment to terminate, then kill them
+            for job in running:
+                job.thread.join(1)
+                job.runner.kill()
+
+        return res, None
 
     def run_verification(self):
         print_stdout('INFO: Starting verification', color='WHITE')
         restart_counting_time()
+        jobs = self.options.portfolio_jobs
+        portfolio = self._tool.portfolio() if jobs > 1 else None
+        if portfolio and len(portfolio) > 1:
+            res, tool = self._run_portfolio(portfolio, jobs)
+            print_elapsed_time("INFO: Verification time", color='WHITE')
+            return res, tool
+
         orig_bitcode = self.curfile
+        slots = VerifierSlots()
         for verifiertool, addparams, verifiertimeout in self._tool.verifiers():
             self.curfile = orig_bitcode
+            if not self.options.static_timeouts:
+                verifiertimeout = slots.timeout(verifiertimeout)
+            started = monotonic()
             res = self._run_verifier(verifiertool, addparams, verifiertimeout)
+            slots.finished(verifiertimeout, monotonic() - started)
+            if self._stopped:
+                return 'unknown (stopped)', None
             sw = res.lower().startswith
             # we got an answer, we can finish
             if sw('true') or sw('false'):
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+#
+# Generate the index of precompiled models of undefined functions
+# (see lib/symbioticpy/symbiotic/models.py).
+#
+# Usage: gen-model-index.py LLVM_NM LIBDIR CATEGORY...
+#
+
+import sys
+import os
+from subprocess import check_output
+
+# set path to our package
+pth = os.path.join(os.path.dirname(__file__), '../lib/symbioticpy')
+sys.path.append(os.path.abspath(pth))
+
+from symbiotic.models import build_index, parse_nm_output
+
+def main(argv):
+    if len(argv) < 4:
+        print("Usage: {0} LLVM_NM LIBDIR CATEGORY...".format(argv[0]),
+              file=sys.stderr)
+        return 1
+
+    nm, libdir, categories = argv[1], argv[2], argv[3:]
+
+    def get_symbols(path):
+        out = check_output([nm, '--extern-only', path])
+        return parse_nm_output(out.splitlines())
+
+    num = build_index(libdir, categories, get_symbols)
+    print("Indexed {0} models in {1}".format(num, libdir))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
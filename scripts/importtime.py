@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+#
+# Measure how long Python spends importing modules when starting
+# symbiotic (uses 'python -X importtime'). The entry point is run
+# with --version-short, so that it exits right after parsing options.
+#
+# Usage: importtime.py [RUNS [TOP [MAX_MS]]]
+#
+#   RUNS    how many times to run the entry point (default 5),
+#           the best run is reported
+#   TOP     how many of the most expensive modules to show (default 15)
+#   MAX_MS  fail (exit with 1) if the import time exceeds MAX_MS
+#
+
+import sys
+import os
+from subprocess import run, PIPE, DEVNULL
+
+ENTRY_POINT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'symbiotic')
+
+def measure():
+    """
+    Run the entry point once and return the list of triples
+    (self us, cumulative us, module) for the top-level imports
+    and the list for all imports
+    """
+    proc = run([sys.executable, '-X', 'importtime', ENTRY_POINT, '--version-short'],
+               stdout=DEVNULL, stderr=PIPE, universal_newlines=True)
+    toplevel, allmods = [], []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        parts = line[len('import time:'):].split('|')
+        try:
+            selftime, cumulative = int(parts[0]), int(parts[1])
+        except ValueError:
+            # the header
+            continue
+        name = parts[2]
+        mod = (selftime, cumulative, name.strip())
+        allmods.append(mod)
+        # the nested imports are indented by two spaces per level
+        if not name[1:].startswith('  '):
+            toplevel.append(mod)
+    return toplevel, allmods
+
+def main(argv):
+    try:
+        runs = int(argv[1]) if len(argv) > 1 else 5
+        top = int(argv[2]) if len(argv) > 2 else 15
+        maxms = float(argv[3]) if len(argv) > 3 else None
+    except ValueError:
+        print("Usage: {0} [RUNS [TOP [MAX_MS]]]".format(argv[0]), file=sys.stderr)
+        return 1
+
+    best, bestmods = None, None
+    for _ in range(max(runs, 1)):
+        toplevel, allmods = measure()
+        total = sum(m[1] for m in toplevel)
+        if best is None or total < best:
+            best, bestmods = total, allmods
+
+    print('Total import time: {0:.1f} ms (best of {1} runs)'.format(best / 1000, runs))
+    print('{0:>10} {1:>10}  {2}'.format('self [ms]', 'cumul [ms]', 'module'))
+    for selftime, cumulative, name in sorted(bestmods, key=lambda m: -m[1])[:top]:
+        print('{0:>10.1f} {1:>10.1f}  {2}'.format(selftime / 1000, cumulative / 1000, name))
+
+    if maxms is not None and best / 1000 > maxms:
+        print('Import time exceeds {0} ms'.format(maxms), file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
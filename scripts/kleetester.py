@@ -1,6 +1,11 @@
 #!/usr/bin/env python3
+import os
+import heapq
+import selectors
+from collections import deque
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
 from subprocess import Popen, PIPE, STDOUT
-from time import sleep
 from sys import stderr
 
 def runcmd(cmd):
@@ -59,45 +64,241 @@ def find_criterions(bitcode):
         return newbitcode, (crit.decode('utf-8', 'ignore') for crit in out.splitlines())
     return None, None
 
-def constrain_to_target(bitcode, target):
-    newbitcode = f"{bitcode}.opt.bc"
+def constrain_to_target(bitcode, target, n, run=runcmd):
+    # the name must be unique, the targets are prepared concurrently
+    newbitcode = f"{bitcode}.{n}.ctt.bc"
     cmd = ['opt', '-load', 'LLVMsbt.so', '-constraint-to-target',
            f'-ctt-target={target}', '-O3', '-o', newbitcode, bitcode]
-    p = runcmd(cmd)
+    p = run(cmd)
     if p is None:
         return None
-    ret = p.wait()
-    if ret != 0:
-        out, errs = p.communicate()
+    out, errs = p.communicate()
+    if p.returncode != 0:
         print(out, file=stderr)
         print(errs, file=stderr)
         return None
     return newbitcode
 
-def sliceprocess(bitcode, crit):
-    bitcode = constrain_to_target(bitcode, crit)
+def sliceprocess(bitcode, crit, n, run=runcmd):
+    bitcode = constrain_to_target(bitcode, crit, n, run)
     if bitcode is None:
         return None, None
-        
-    slbitcode = f"{bitcode}-{crit}.bc"
+
+    slbitcode = f"{bitcode}.sliced.bc"
     cmd = ['timeout', '120', 'llvm-slicer', '-c', crit,
            '-o', slbitcode, bitcode]
-    return runcmd(cmd), slbitcode
+    return run(cmd), slbitcode
 
-def optimize(bitcode):
+def optimize(bitcode, run=runcmd):
     newbitcode = f"{bitcode}.opt.bc"
     cmd = ['opt', '-load', 'LLVMsbt.so', '-O3', '-remove-infinite-loops',
            '-O2', '-o', newbitcode, bitcode]
-    p = runcmd(cmd)
-    ret = p.wait()
+    p = run(cmd)
+    if p is None:
+        return None
+    p.communicate()
+    if p.returncode != 0:
+        return None
     return newbitcode
 
-def check_error(outs, errs):
-    for line in outs.splitlines():
+# the memory that we expect a test generator to take (in kB), KLEE may take
+# more (-max-memory), but most of the generators take much less
+GENERATOR_MEMORY = 1000 * 1024
+
+def available_memory():
+    """ The available memory in kB (None if unknown) """
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1])
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+def generators_limit():
+    """ How many test generators may run at once (including the main KLEE) """
+    try:
+        limit = len(os.sched_getaffinity(0))
+    except AttributeError:
+        limit = os.cpu_count() or 1
+    mem = available_memory()
+    if mem is not None:
+        limit = min(limit, mem // GENERATOR_MEMORY)
+    return max(limit, 1)
+
+class Generator:
+    """
+    A running test generator. Its output is read as it comes,
+    so that it never blocks on a full pipe and we see the error
+    as soon as KLEE reports it.
+    """
+    def __init__(self, name, process):
+        self.name = name
+        self.process = process
+        self.found_error = False
+        self._pending = b''
+        # the last lines of the output for the case that it fails
+        self.tail = deque(maxlen=50)
+
+    def fileno(self):
+        return self.process.stdout.fileno()
+
+    def _line(self, line):
+        self.tail.append(line)
         if b'ASSERTION FAIL: ' in line:
-            print('Found ERROR!', file=stderr)
-            return True
-    return False
+            self.found_error = True
+
+    def read(self):
+        """ Read the available output, return False on EOF """
+        data = os.read(self.fileno(), 1 << 16)
+        if not data:
+            if self._pending:
+                self._line(self._pending)
+            return False
+        lines = (self._pending + data).split(b'\n')
+        self._pending = lines.pop()
+        for line in lines:
+            self._line(line)
+        return True
+
+class Scheduler:
+    """ Runs test generators and waits for them without polling """
+    def __init__(self, limit):
+        self.limit = limit
+        self.running = []
+        self._selector = selectors.DefaultSelector()
+        # wakes up wait() from other threads
+        self._wakeup_r, self._wakeup_w = os.pipe()
+        os.set_blocking(self._wakeup_w, False)
+        self._selector.register(self._wakeup_r, selectors.EVENT_READ)
+
+    def wakeup(self):
+        try:
+            os.write(self._wakeup_w, b'x')
+        except BlockingIOError:
+            # the pipe is full, wait() wakes up anyway
+            pass
+
+    def has_slot(self):
+        return len(self.running) < self.limit
+
+    def add(self, name, process):
+        if process is None:
+            return None
+        gen = Generator(name, process)
+        self.running.append(gen)
+        self._selector.register(gen, selectors.EVENT_READ)
+        return gen
+
+    def wait(self, timeout=None):
+        """
+        Wait until some generators finish or someone calls wakeup()
+        (at most timeout seconds), return the list of the finished generators
+        """
+        finished = []
+        for key, _ in self._selector.select(timeout):
+            gen = key.fileobj
+            if gen == self._wakeup_r:
+                os.read(self._wakeup_r, 1 << 10)
+                continue
+            if gen.read():
+                continue
+            # EOF, the generator exited
+            self._selector.unregister(gen)
+            gen.process.stdout.close()
+            gen.process.wait()
+            self.running.remove(gen)
+            finished.append(gen)
+        return finished
+
+    def kill_all(self):
+        for gen in self.running:
+            gen.process.kill()
+        for gen in self.running:
+            gen.process.wait()
+
+class Preparations:
+    """
+    Prepares the targets (constrain, slice and optimize the bitcode)
+    in a pool of threads, so that the preparation of the next targets
+    overlaps with running KLEE on the prepared ones
+    """
+    def __init__(self, bitcode, jobs, done):
+        self.bitcode = bitcode
+        self.jobs = jobs
+        self._pool = ThreadPoolExecutor(jobs)
+        self._lock = Lock()
+        self._processes = []
+        self._cancelled = False
+        # called (in the worker thread) when a target is prepared
+        self._done = done
+        self.running = {}
+
+    def _run(self, cmd):
+        with self._lock:
+            if self._cancelled:
+                return None
+            p = runcmd(cmd)
+            if p is not None:
+                self._processes.append(p)
+            return p
+
+    def _prepare(self, n, crit):
+        """ Return the pair (bitcode for KLEE or None, whether slicing timeouted) """
+        p, slicedcode = sliceprocess(self.bitcode, crit, n, self._run)
+        if self._cancelled:
+            return None, False
+        if p is None:
+            print(f'Slicing w.r.t {crit} FAILED', file=stderr)
+            return None, False
+        out, errs = p.communicate()
+        if self._cancelled:
+            return None, False
+        if p.returncode != 0:
+            print(f'Slicing w.r.t {crit} FAILED', file=stderr)
+            if p.returncode == 124:
+                return None, True
+            print(out, file=stderr)
+            print(errs, file=stderr)
+            return None, False
+        print(f'Slicing w.r.t {crit} done', file=stderr)
+
+        slicedcode = optimize(slicedcode, self._run)
+        if slicedcode is None and not self._cancelled:
+            print("Optimizing failed", file=stderr)
+        return slicedcode, False
+
+    def submit(self, n, crit):
+        print(f"\n--- Preparing {crit} target --- ", file=stderr)
+        future = self._pool.submit(self._prepare, n, crit)
+        self.running[future] = (n, crit)
+        future.add_done_callback(lambda f: self._done())
+
+    def finished(self):
+        """ Return the list of (n, crit, bitcode or None, timeouted) for finished targets """
+        ret = []
+        for future in [f for f in self.running if f.done()]:
+            n, crit = self.running.pop(future)
+            if future.cancelled():
+                continue
+            ret.append((n, crit) + future.result())
+        return ret
+
+    def cancel(self):
+        """ Cancel the pending preparations and kill the running ones """
+        with self._lock:
+            self._cancelled = True
+            for p in self._processes:
+                if p.poll() is None:
+                    p.kill()
+        self._pool.shutdown(wait=True, cancel_futures=True)
+        self.running.clear()
+
+def found_error(gen):
+    if gen.found_error:
+        print(f'Found ERROR! ({gen.name})', file=stderr)
+    return gen.found_error
 
 def main(argv):
     if len(argv) != 4:
@@ -106,110 +307,74 @@ def main(argv):
     outdir = argv[2]
     bitcode = argv[3]
 
-    generators = []
+    scheduler = Scheduler(generators_limit())
+    print(f"Running at most {scheduler.limit} test generators at once", file=stderr)
 
     # run KLEE on the original bitcode
     print("\n--- Running the main KLEE --- ", file=stderr)
-    maingen = gentest(bitcode, outdir, prp)
-    if maingen:
-        generators.append(maingen)
+    maingen = scheduler.add('main', gentest(bitcode, outdir, prp))
 
+    # the targets that wait for the preparation, ordered by the estimated
+    # depth: the later crits are likely deeper in the code and the main KLEE
+    # is less likely to cover them, so they go first
+    pending = []
+    # the prepared targets that wait for a free slot (in the same order)
+    ready = []
     bitcodewithcrits, crits = find_criterions(bitcode)
     if bitcodewithcrits:
-        # The later crits are likely deeper in the code.
-        # Since run use only part of them, use those.
-        crits = list(crits)
-        crits.reverse()
         for n, crit in enumerate(crits):
-            print(f"\n--- Targeting at {crit} target --- ", file=stderr)
-            if prp == 'coverage' and maingen and maingen.poll() is not None:
-                break # the main process finished, we can finish too
-
-            # slice bitcode
-            p, slicedcode = sliceprocess(bitcodewithcrits, crit)
-            if p is None:
-                print(f'Slicing w.r.t {crit} FAILED', file=stderr)
-                continue
-            print(f'Starget slicing w.r.t {crit}, waiting for the job...', file=stderr)
-            ret = p.wait()
-            if ret != 0:
-                out, errs = p.communicate()
-                print(f'Slicing w.r.t {crit} FAILED', file=stderr)
-                if ret == 124:
-                    break # one timeouted, others will too...
-                print(out, file=stderr)
-                print(errs, file=stderr)
-                continue
-            print(f'Slicing w.r.t {crit} done', file=stderr)
+            heapq.heappush(pending, (-n, crit))
+    preparations = Preparations(bitcodewithcrits, max(1, scheduler.limit // 2),
+                                scheduler.wakeup)
 
-            slicedcode = optimize(slicedcode)
-            if slicedcode is None:
-                print("Optimizing failed", file=stderr)
-                continue
+    def cancel_targets(why):
+        if pending or ready or preparations.running:
+            print(f"Cancelling {len(pending) + len(ready) + len(preparations.running)}"
+                  f" pending targets ({why})", file=stderr)
+        pending.clear()
+        ready.clear()
+        preparations.cancel()
+
+    try:
+        while True:
+            for n, crit, slicedcode, timeouted in preparations.finished():
+                if timeouted:
+                    # one timeouted, others will too...
+                    cancel_targets('slicing timeouted')
+                elif slicedcode:
+                    heapq.heappush(ready, (-n, crit, slicedcode))
+
+            if prp == 'coverage' and maingen and maingen.process.poll() is not None:
+                # the main process finished, we can finish too
+                cancel_targets('the main KLEE finished')
 
             # generate tests
-            if prp == 'coverage' and maingen and maingen.poll() is not None:
-                break # the main process finished, we can finish too
-            p = gentest(slicedcode, outdir, prp, suffix=str(n),
-                        params=['--search=dfs', '--use-batching-search'])
-            if p is None:
-                continue
-            generators.append(p)
-
-            newgens = []
-            for p in generators:
-                if p.poll() is not None:
-                    if prp != 'coverage':
-                        if check_error(*p.communicate()):
-                            for gen in generators:
-                                if gen.poll() is not None:
-                                    gen.kill()
-                            exit(0)
-                else:
-                    newgens.append(p)
-            generators = newgens
-
-            # run atmost 8 at once
-            while len(generators) >= 8:
-                if prp == 'coverage' and maingen and maingen.poll() is not None:
-                    break # the main process finished, we can finish too
-
-                print("Got enough test generators, waiting for some to finish...",
-                      file=stderr)
-                sleep(2) # sleep 2 seconds
-                for p in generators:
-                    if p.poll() is not None:
-                        if prp != 'coverage':
-                            if check_error(*p.communicate()):
-                                for gen in generators:
-                                    if gen.poll() is not None:
-                                        gen.kill()
-                                exit(0)
-                    else:
-                        newgens.append(p)
-                # some processes finished
-                generators = newgens
-
-    print(f"\n--- All targets running --- ", file=stderr)
-    stderr.flush()
+            while ready and scheduler.has_slot():
+                n, crit, slicedcode = heapq.heappop(ready)
+                print(f"\n--- Targeting at {crit} target --- ", file=stderr)
+                scheduler.add(crit,
+                              gentest(slicedcode, outdir, prp, suffix=str(-n),
+                                      params=['--search=dfs', '--use-batching-search']))
+
+            # prepare the next targets while the generators run,
+            # but not more than we can run soon
+            while pending and len(preparations.running) < preparations.jobs and\
+                  len(ready) + len(preparations.running) < scheduler.limit:
+                n, crit = heapq.heappop(pending)
+                preparations.submit(-n, crit)
+
+            if not scheduler.running and not preparations.running:
+                break
 
-    while generators:
-        print(f"Have {len(generators)} test generators running", file=stderr)
-        stderr.flush()
-        newgens = []
-        for p in generators:
-            if p.poll() is not None:
-                if prp != 'coverage':
-                    if check_error(*p.communicate()):
-                        for gen in generators:
-                            if gen.poll() is not None:
-                                gen.kill()
-                        exit(0)
-            else:
-                newgens.append(p)
-        generators = newgens
-        if generators:
-            sleep(2) # sleep 2 seconds
+            for gen in scheduler.wait():
+                print(f"Test generator {gen.name} finished, "
+                      f"have {len(scheduler.running)} running", file=stderr)
+                stderr.flush()
+                if prp != 'coverage' and found_error(gen):
+                    exit(0)
+    finally:
+        preparations.cancel()
+        scheduler.kill_all()
 
     print(f"\n--- All KLEE finished --- ", file=stderr)
 
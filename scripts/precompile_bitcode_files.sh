@@ -50,7 +50,15 @@ for LLVM in $PREFIX/llvm-*; do
 	done
 done
 
-
+# index the precompiled models, so that symbiotic can find
+# all the models that a module needs without repeated linking
+CATEGORIES=`find $LIBS -mindepth 1 -maxdepth 1 -type d ! -name symbioticpy -exec basename {} \;`
+for LLVM in $PREFIX/llvm-*; do
+	for LIBDIR in "$LLVM/lib" "$LLVM/lib32"; do
+		scripts/gen-model-index.py "$LLVM/bin/llvm-nm" "$LIBDIR" $CATEGORIES
+		FILES="$FILES ${LIBDIR#install/}/models.json"
+	done
+done
 
 echo "To add precompiled files to distribution, run this command from install/ folder:"
 echo "git add $FILES"
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+"""
+Regression tests of running the verifiers in a portfolio.
+The verifiers are mocked, so these tests do not need the tools:
+
+  python3 -m unittest test_portfolio
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+from threading import Event, Thread
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'lib', 'symbioticpy'))
+
+from symbiotic.verifier import SymbioticVerifier
+
+
+class FakeTool(object):
+    def __init__(self, name):
+        self._name = name
+
+    def name(self):
+        return self._name
+
+
+class FakeOptions(object):
+    stop_on_verdict = 0
+    static_timeouts = True
+
+
+class FakeVerifier(SymbioticVerifier):
+    """
+    Runs the fake tools instead of the verifiers: fake0 decides
+    'false' while running, but its final answer is 'unknown' once
+    fake1 was stopped. fake1 runs until it is stopped and answers
+    'true' if it is not stopped.
+    """
+
+    def __init__(self, bitcode):
+        SymbioticVerifier.__init__(self, bitcode, [], None, FakeOptions())
+        self.runs = []
+
+    def _run_verifier(self, tool, addparams, timeout, **kwargs):
+        runner = kwargs['runner']
+        self.runs.append(tool.name())
+        if tool.name() == 'fake0':
+            kwargs['on_verdict']('false')
+            return 'unknown'
+        if tool.name() == 'fake1':
+            if self.runs.count('fake1') == 1:
+                # the first run is stopped by the verdict of fake0
+                while not runner.isStopped():
+                    Event().wait(0.01)
+                return 'unknown (stopped)'
+            return 'true'
+        return 'unknown'
+
+
+class TestPortfolio(unittest.TestCase):
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.bitcode = os.path.join(self._tmpdir.name, 'code.bc')
+        with open(self.bitcode, 'wb'):
+            pass
+
+    def tearDown(self):
+        self._tmpdir.cleanup()
+
+    def test_unconfirmed_verdict(self):
+        """ A decisive verifier whose final answer is unknown """
+        verifier = FakeVerifier(self.bitcode)
+        verifiers = [(FakeTool('fake{0}'.format(n)), [], None)
+                     for n in range(3)]
+        result = []
+        thread = Thread(target=lambda: result.append(
+                            verifier._run_portfolio(verifiers, 2)),
+                        daemon=True)
+        thread.start()
+        thread.join(10)
+
+        self.assertFalse(thread.is_alive(), 'the portfolio hangs')
+        res, tool = result[0]
+        self.assertEqual(res, 'true')
+        self.assertEqual(tool.name(), 'fake1')
+        # the stopped verifier was run again
+        self.assertEqual(verifier.runs.count('fake1'), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()